@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+"""
+Load-test harness for the Bardabar Cafe server (server.py)
+
+Starts run_server() in a subprocess on a free local port with a throwaway
+database, drives concurrent load against the API, static files and admin
+mutation endpoints, and reports requests/sec and latency percentiles.
+
+Examples:
+    python benchmark.py
+    python benchmark.py --modes threaded,async --concurrency 32 --duration 10
+    python benchmark.py --output after.json --compare before.json
+"""
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVER_SCRIPT = os.path.join(BASE_DIR, 'server.py')
+
+API_PATHS = (
+    '/api/items',
+    '/api/menu/categories',
+    '/api/events',
+    '/api/news',
+    '/api/staff',
+    '/api/about',
+    '/api/admin/status',
+)
+STATIC_PATHS = (
+    '/',
+    '/css/style.css',
+    '/js/script.js',
+    '/admin/',
+    '/admin/admin.js',
+    '/images/logo.svg',
+)
+SCENARIOS = ('api', 'conditional', 'static', 'admin')
+CONNECTION_MODES = ('keepalive', 'close')
+ADMIN_CREDENTIALS = {'login': 'admin', 'password': 'cafe123'}
+PERCENTILES = (50, 90, 95, 99)
+
+
+# --- Load generation ---
+
+class Client:
+    """One simulated browser: a single connection, reused when keep-alive is on"""
+
+    def __init__(self, port, keepalive):
+        self.port = port
+        self.keepalive = keepalive
+        self.conn = None
+        self.headers = {'Accept-Encoding': 'gzip, br'}
+
+    def request(self, method, path, body=None, headers=None):
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+        request_headers = dict(self.headers)
+        if headers:
+            request_headers.update(headers)
+        if body is not None:
+            body = json.dumps(body).encode('utf-8')
+            request_headers['Content-Type'] = 'application/json'
+        if not self.keepalive:
+            request_headers['Connection'] = 'close'
+        try:
+            self.conn.request(method, path, body, request_headers)
+            response = self.conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            self.close()
+            raise
+        if not self.keepalive or response.will_close:
+            self.close()
+        return response, data
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+class ApiScenario:
+    """Plain GETs of every read-only API route"""
+
+    def __init__(self, client):
+        self.client = client
+        self.step = 0
+
+    def next(self):
+        path = API_PATHS[self.step % len(API_PATHS)]
+        self.step += 1
+        return self.client.request('GET', path)[0].status
+
+
+class ConditionalScenario(ApiScenario):
+    """Menu polling: GETs that revalidate with If-None-Match and mostly get 304"""
+
+    def __init__(self, client):
+        super().__init__(client)
+        self.etags = {}
+
+    def next(self):
+        path = API_PATHS[self.step % len(API_PATHS)]
+        self.step += 1
+        headers = {'If-None-Match': self.etags[path]} if path in self.etags else None
+        response, _ = self.client.request('GET', path, headers=headers)
+        if response.getheader('ETag'):
+            self.etags[path] = response.getheader('ETag')
+        return 200 if response.status == 304 else response.status
+
+
+class StaticScenario(ApiScenario):
+    def next(self):
+        path = STATIC_PATHS[self.step % len(STATIC_PATHS)]
+        self.step += 1
+        return self.client.request('GET', path)[0].status
+
+
+class AdminScenario:
+    """Create, update and delete a menu item as a logged-in admin"""
+
+    def __init__(self, client):
+        self.client = client
+        response, _ = client.request('POST', '/api/admin/login', ADMIN_CREDENTIALS)
+        self.cookie = {'Cookie': response.getheader('Set-Cookie').split(';')[0]}
+        response, data = client.request('GET', '/api/menu/categories')
+        self.category_id = json.loads(data)[0]['id']
+        self.item_id = None
+        self.step = 0
+
+    def next(self):
+        action = self.step % 3
+        self.step += 1
+        if action == 0:
+            response, data = self.client.request('POST', '/api/items', {
+                'name': 'Тестовое блюдо', 'price': 100, 'categoryId': self.category_id}, self.cookie)
+            if response.status == 200:
+                self.item_id = json.loads(data)['data']['id']
+            return response.status
+        if action == 1:
+            return self.client.request('PUT', f'/api/items/{self.item_id}', {'price': 110}, self.cookie)[0].status
+        return self.client.request('DELETE', f'/api/items/{self.item_id}', None, self.cookie)[0].status
+
+
+SCENARIO_CLASSES = {
+    'api': ApiScenario,
+    'conditional': ConditionalScenario,
+    'static': StaticScenario,
+    'admin': AdminScenario,
+}
+
+
+def _client_loop(port, scenario, keepalive, start_at, end_at):
+    """Run one client until end_at; returns (latencies, errors)"""
+    client = Client(port, keepalive)
+    latencies = []
+    errors = 0
+    runner = SCENARIO_CLASSES[scenario](client)
+    time.sleep(max(0.0, start_at - time.time()))
+    while time.time() < end_at:
+        started = time.perf_counter()
+        try:
+            status = runner.next()
+        except (OSError, http.client.HTTPException, ValueError, KeyError):
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - started)
+        if status >= 400:
+            errors += 1
+    client.close()
+    return latencies, errors
+
+
+def _client_process(port, scenario, keepalive, threads, start_at, end_at):
+    """Run several client threads in one process (client processes sidestep the GIL)"""
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        futures = [pool.submit(_client_loop, port, scenario, keepalive, start_at, end_at)
+                   for _ in range(threads)]
+        latencies = []
+        errors = 0
+        for future in futures:
+            client_latencies, client_errors = future.result()
+            latencies.extend(client_latencies)
+            errors += client_errors
+    return latencies, errors
+
+
+def run_load(port, scenario, keepalive, concurrency, duration, client_processes):
+    client_processes = max(1, min(client_processes, concurrency))
+    shares = [concurrency // client_processes + (1 if i < concurrency % client_processes else 0)
+              for i in range(client_processes)]
+    start_at = time.time() + 0.5
+    end_at = start_at + duration
+    latencies = []
+    errors = 0
+    with ProcessPoolExecutor(max_workers=client_processes) as pool:
+        futures = [pool.submit(_client_process, port, scenario, keepalive, share, start_at, end_at)
+                   for share in shares]
+        for future in futures:
+            process_latencies, process_errors = future.result()
+            latencies.extend(process_latencies)
+            errors += process_errors
+    return summarize(latencies, errors, duration)
+
+
+def summarize(latencies, errors, duration):
+    latencies.sort()
+    count = len(latencies)
+
+    def percentile(p):
+        if not count:
+            return None
+        index = min(count - 1, max(0, int(round(p / 100 * count)) - 1))
+        return round(latencies[index] * 1000, 3)
+
+    return {
+        'requests': count,
+        'errors': errors,
+        'durationSeconds': duration,
+        'requestsPerSecond': round(count / duration, 1),
+        'latencyMs': dict(
+            {f'p{p}': percentile(p) for p in PERCENTILES},
+            mean=round(sum(latencies) / count * 1000, 3) if count else None,
+            max=round(latencies[-1] * 1000, 3) if count else None,
+        ),
+    }
+
+# --- END: Load generation ---
+
+
+# --- Server under test ---
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=15.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'Сервер не запустился на порту {port}')
+
+
+class ServerProcess:
+    """run_server() in a subprocess with its own temporary databases"""
+
+    def __init__(self, mode, workers, server_args=()):
+        self.mode = mode
+        self.workers = workers
+        self.server_args = list(server_args)
+        self.port = free_port()
+        self.tempdir = None
+        self.process = None
+
+    def __enter__(self):
+        self.tempdir = tempfile.mkdtemp(prefix='bardabar-bench-')
+        # Every file the server writes lives in the temporary directory: the live contact queue's
+        # writer would otherwise move pending requests into the throwaway database
+        env = dict(os.environ,
+                   BARDABAR_DB=os.path.join(self.tempdir, 'bench.db'),
+                   BARDABAR_SESSIONS_DB=os.path.join(self.tempdir, 'sessions.db'),
+                   BARDABAR_CONTACT_QUEUE=os.path.join(self.tempdir, 'contact-queue.db'))
+        # Benchmark contact requests must not reach the real notification endpoint
+        env.pop('BARDABAR_NOTIFY_URL', None)
+        command = [sys.executable, SERVER_SCRIPT, str(self.port), '--mode', self.mode,
+                   '--workers', str(self.workers), '--seed-demo'] + self.server_args
+        self.process = subprocess.Popen(command, cwd=BASE_DIR, env=env,
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        wait_for_port(self.port)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.process.poll() is None:
+            if hasattr(signal, 'SIGTERM'):
+                self.process.send_signal(signal.SIGTERM)
+            else:
+                self.process.terminate()
+            try:
+                self.process.wait(timeout=20)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        shutil.rmtree(self.tempdir, ignore_errors=True)
+
+# --- END: Server under test ---
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR,
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_benchmarks(args):
+    results = {
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {
+            'concurrency': args.concurrency,
+            'duration': args.duration,
+            'workers': args.workers,
+            'clientProcesses': args.client_processes,
+        },
+        'runs': [],
+    }
+    for mode in args.modes:
+        with ServerProcess(mode, args.workers, args.server_arg) as server:
+            for scenario in args.scenarios:
+                for connection in args.connections:
+                    summary = run_load(server.port, scenario, connection == 'keepalive',
+                                       args.concurrency, args.duration, args.client_processes)
+                    run = dict(mode=mode, scenario=scenario, connection=connection, **summary)
+                    results['runs'].append(run)
+                    print_run(run)
+    return results
+
+
+def run_key(run):
+    return run['mode'], run['scenario'], run['connection']
+
+
+def print_header():
+    print(f"{'режим':<10}{'сценарий':<13}{'соединение':<11}{'запросов/с':>11}{'ошибок':>8}"
+          + ''.join(f'{"p" + str(p) + " мс":>10}' for p in PERCENTILES))
+
+
+def print_run(run, baseline=None):
+    line = (f"{run['mode']:<10}{run['scenario']:<13}{run['connection']:<11}"
+            f"{run['requestsPerSecond']:>11.1f}{run['errors']:>8}"
+            + ''.join(f"{run['latencyMs'][f'p{p}'] or 0:>10.2f}" for p in PERCENTILES))
+    if baseline:
+        change = (run['requestsPerSecond'] / baseline['requestsPerSecond'] - 1) * 100 \
+            if baseline['requestsPerSecond'] else 0.0
+        line += f'  ({change:+.1f}% к базовому)'
+    print(line)
+
+
+def print_comparison(results, baseline_path):
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {run_key(run): run for run in json.load(f)['runs']}
+    print(f'\nСравнение с {baseline_path}:')
+    print_header()
+    for run in results['runs']:
+        print_run(run, baseline.get(run_key(run)))
+
+
+def parse_list(value, allowed):
+    items = [item.strip() for item in value.split(',') if item.strip()]
+    unknown = [item for item in items if item not in allowed]
+    if unknown:
+        raise argparse.ArgumentTypeError(f'неизвестные значения: {", ".join(unknown)}')
+    return items
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Нагрузочное тестирование server.py')
+    parser.add_argument('--modes', default='threaded',
+                        type=lambda v: parse_list(v, ('single', 'threaded', 'async')),
+                        help='режимы сервера через запятую (single, threaded, async)')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        type=lambda v: parse_list(v, SCENARIOS),
+                        help=f'сценарии через запятую ({", ".join(SCENARIOS)})')
+    parser.add_argument('--connections', default=','.join(CONNECTION_MODES),
+                        type=lambda v: parse_list(v, CONNECTION_MODES),
+                        help='keepalive, close или оба')
+    parser.add_argument('--concurrency', type=int, default=16, help='число одновременных клиентов')
+    parser.add_argument('--duration', type=float, default=5.0, help='длительность каждого прогона, с')
+    parser.add_argument('--workers', type=int, default=16, help='--workers для сервера')
+    parser.add_argument('--client-processes', type=int, default=min(4, os.cpu_count() or 1),
+                        help='процессов-клиентов (потоки клиентов делятся между ними)')
+    parser.add_argument('--server-arg', action='append', default=[],
+                        help='дополнительный аргумент для server.py (можно повторять)')
+    parser.add_argument('--output', help='записать результаты в JSON-файл')
+    parser.add_argument('--compare', help='сравнить с ранее сохранёнными результатами')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    print_header()
+    results = run_benchmarks(args)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f'\nРезультаты сохранены в {args.output}')
+    if args.compare:
+        print_comparison(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,384 @@
+"""
+SQLite data layer of the Bardabar Cafe server: the Prisma database in prisma/dev.db
+"""
+
+import os
+import json
+import hashlib
+import sqlite3
+import contextlib
+import datetime
+import time
+import secrets
+import threading
+import uuid
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DATABASE_PATH = os.environ.get('BARDABAR_DB') or os.path.join(BASE_DIR, 'prisma', 'dev.db')
+MIGRATIONS_DIR = os.path.join(BASE_DIR, 'prisma', 'migrations')
+
+# Migration history in the layout `prisma migrate deploy` creates and reads
+PRISMA_MIGRATIONS_SQL = '''
+    CREATE TABLE IF NOT EXISTS "_prisma_migrations" (
+        "id"                    TEXT PRIMARY KEY NOT NULL,
+        "checksum"              TEXT NOT NULL,
+        "finished_at"           DATETIME,
+        "migration_name"        TEXT NOT NULL,
+        "logs"                  TEXT,
+        "rolled_back_at"        DATETIME,
+        "started_at"            DATETIME NOT NULL DEFAULT current_timestamp,
+        "applied_steps_count"   INTEGER UNSIGNED NOT NULL DEFAULT 0
+    )
+'''
+PRISMA_MIGRATION_RECORD_SQL = '''
+    INSERT INTO "_prisma_migrations"
+        ("id", "checksum", "finished_at", "migration_name", "started_at", "applied_steps_count")
+    VALUES (?, ?, ?, ?, ?, 1)
+'''
+
+
+class ValidationError(ValueError):
+    """Invalid data submitted to an admin or public endpoint"""
+
+
+class Database:
+    """Per-thread SQLite connections in WAL mode, so readers never wait for the admin writer.
+
+    Queries use constant parameterized SQL, which the sqlite3 module keeps
+    prepared in each connection's statement cache.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            if not self._initialized:
+                self.initialize()
+            conn = self._connect()
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, cached_statements=256, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA foreign_keys = ON')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        return conn
+
+    def initialize(self):
+        """Enable WAL and apply pending Prisma migrations (tables and indexes)"""
+        with self._lock:
+            if self._initialized:
+                return
+            conn = self._connect()
+            try:
+                conn.execute('PRAGMA journal_mode = WAL')
+                self._migrate(conn)
+            finally:
+                conn.close()
+            self._initialized = True
+
+    def _migrate(self, conn):
+        """Apply migrations missing from _prisma_migrations and record them there.
+
+        The history is written the way `prisma migrate deploy` writes it (the checksum is the
+        SHA-256 of migration.sql), so Prisma and the server can take turns on one database.
+        """
+        has_history = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = '_prisma_migrations'").fetchone()
+        has_schema = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'MenuItem'").fetchone()
+        conn.execute(PRISMA_MIGRATIONS_SQL)
+        applied = {row[0] for row in conn.execute(
+            'SELECT "migration_name" FROM "_prisma_migrations" '
+            'WHERE "finished_at" IS NOT NULL AND "rolled_back_at" IS NULL')}
+        conn.commit()
+        names = sorted(name for name in os.listdir(MIGRATIONS_DIR)
+                       if os.path.isfile(os.path.join(MIGRATIONS_DIR, name, 'migration.sql')))
+        for position, name in enumerate(names):
+            if name in applied:
+                continue
+            with open(os.path.join(MIGRATIONS_DIR, name, 'migration.sql'), 'rb') as f:
+                script = f.read()
+            started = now_millis()
+            # Tables made without a history (prisma db push, older servers) already hold the
+            # initial migration: record it as applied, like `prisma migrate resolve --applied`
+            if not (position == 0 and has_schema and not has_history):
+                conn.executescript(script.decode('utf-8'))
+            conn.execute(PRISMA_MIGRATION_RECORD_SQL, (
+                str(uuid.uuid4()), hashlib.sha256(script).hexdigest(), now_millis(), name, started))
+            conn.commit()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        conn = self.connection()
+        with conn:
+            yield conn
+
+    def close_all(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+
+def new_id():
+    """Collision-resistant id in the spirit of Prisma's cuid()"""
+    return 'c' + secrets.token_hex(12)
+
+
+def to_db_datetime(value):
+    """Prisma stores SQLite DateTime values as Unix epoch milliseconds"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    try:
+        parsed = datetime.datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        raise ValidationError(f'Некорректная дата: {value}')
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return int(parsed.timestamp() * 1000)
+
+
+def from_db_datetime(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        if not value.isdigit():
+            # CURRENT_TIMESTAMP defaults are stored as text
+            return value.replace(' ', 'T') + ('' if 'T' in value else 'Z')
+        value = int(value)
+    moment = datetime.datetime.fromtimestamp(value / 1000, tz=datetime.timezone.utc)
+    return moment.strftime('%Y-%m-%dT%H:%M:%S.') + f'{moment.microsecond // 1000:03d}Z'
+
+
+def now_millis():
+    return int(time.time() * 1000)
+
+
+def as_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValidationError(f'Ожидалось число: {value}')
+
+
+def as_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValidationError(f'Ожидалось целое число: {value}')
+
+
+def as_text(value):
+    return None if value is None else str(value)
+
+
+class TableSpec:
+    """Column layout of one Prisma model as exposed through the API"""
+
+    def __init__(self, table, columns, required=(), defaults=None, datetimes=(), order_by='"id"'):
+        self.table = table
+        self.columns = columns
+        self.required = required
+        self.defaults = defaults or {}
+        self.datetimes = datetimes
+        self.select_sql = 'SELECT "id", %s FROM "%s" ORDER BY %s' % (
+            ', '.join('"%s"' % c for c in columns), table, order_by)
+        self.get_sql = 'SELECT "id", %s FROM "%s" WHERE "id" = ?' % (
+            ', '.join('"%s"' % c for c in columns), table)
+        self.insert_sql = 'INSERT INTO "%s" ("id", %s) VALUES (?%s)' % (
+            table, ', '.join('"%s"' % c for c in columns), ', ?' * len(columns))
+        self.delete_sql = 'DELETE FROM "%s" WHERE "id" = ?' % table
+
+    def clean(self, data, partial=False):
+        """Pick known columns from request data and coerce them to column types"""
+        values = {}
+        for column, convert in self.columns.items():
+            if column not in data:
+                continue
+            value = data[column]
+            if column in self.datetimes:
+                value = to_db_datetime(value)
+            elif value is not None:
+                value = convert(value)
+            values[column] = value
+        if not partial:
+            for column, default in self.defaults.items():
+                values.setdefault(column, default() if callable(default) else default)
+        for column in self.required:
+            if (not partial or column in values) and values.get(column) in (None, ''):
+                raise ValidationError(f'Поле {column} обязательно')
+        return values
+
+    def to_dict(self, row):
+        record = dict(row)
+        for column in self.datetimes:
+            record[column] = from_db_datetime(record[column])
+        return record
+
+
+TABLES = {
+    'categories': TableSpec(
+        'MenuCategory', {'name': as_text, 'order': as_int},
+        required=('name',), defaults={'order': 0}, order_by='"order", "id"'),
+    'items': TableSpec(
+        'MenuItem', {'name': as_text, 'description': as_text, 'price': as_float,
+                     'imageUrl': as_text, 'articleCode': as_text, 'categoryId': as_text},
+        required=('name', 'price', 'categoryId')),
+    'events': TableSpec(
+        'Event', {'title': as_text, 'description': as_text, 'imageUrl': as_text, 'date': as_text},
+        required=('title', 'date'), datetimes=('date',), order_by='"date", "id"'),
+    'news': TableSpec(
+        'News', {'title': as_text, 'content': as_text, 'imageUrl': as_text, 'createdAt': as_text},
+        required=('title', 'content'), defaults={'createdAt': now_millis}, datetimes=('createdAt',),
+        order_by='"createdAt" DESC, "id"'),
+    'staff': TableSpec(
+        'Staff', {'name': as_text, 'position': as_text, 'description': as_text,
+                  'imageUrl': as_text, 'order': as_int},
+        required=('name', 'position'), defaults={'order': 0}, order_by='"order", "id"'),
+    'contacts': TableSpec(
+        'ContactRequest', {'name': as_text, 'phone': as_text, 'message': as_text,
+                           'type': as_text, 'createdAt': as_text},
+        required=('name', 'phone', 'type'), defaults={'createdAt': now_millis}, datetimes=('createdAt',),
+        order_by='"createdAt" DESC, "id"'),
+}
+
+# The whole menu in one query instead of a lookup per category
+MENU_ITEMS_SQL = '''
+    SELECT i."id", i."name", i."description", i."price", i."imageUrl", i."articleCode", i."categoryId",
+           c."name" AS "categoryName", c."order" AS "categoryOrder"
+    FROM "MenuItem" i
+    JOIN "MenuCategory" c ON c."id" = i."categoryId"
+    ORDER BY c."order", c."id", i."name", i."id"
+'''
+ABOUT_ID = 'about'
+ABOUT_SELECT_SQL = 'SELECT "title", "content", "advantages" FROM "AboutContent" WHERE "id" = ?'
+ABOUT_UPSERT_SQL = '''
+    INSERT INTO "AboutContent" ("id", "title", "content", "advantages") VALUES (?, ?, ?, ?)
+    ON CONFLICT("id") DO UPDATE SET
+        "title" = excluded."title", "content" = excluded."content", "advantages" = excluded."advantages"
+'''
+DEFAULT_ABOUT = {"title": "О нас", "content": "", "advantages": []}
+
+
+class CafeRepository:
+    """Reads and writes the site content stored in the Prisma SQLite database"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def list(self, resource):
+        spec = TABLES[resource]
+        rows = self.db.connection().execute(spec.select_sql).fetchall()
+        return [spec.to_dict(row) for row in rows]
+
+    def get(self, resource, record_id):
+        spec = TABLES[resource]
+        row = self.db.connection().execute(spec.get_sql, (record_id,)).fetchone()
+        return spec.to_dict(row) if row else None
+
+    def list_menu_items(self):
+        items = []
+        for row in self.db.connection().execute(MENU_ITEMS_SQL):
+            item = dict(row)
+            item['category'] = {
+                "id": item['categoryId'],
+                "name": item.pop('categoryName'),
+                "order": item.pop('categoryOrder'),
+            }
+            items.append(item)
+        return items
+
+    def create(self, resource, data):
+        spec = TABLES[resource]
+        values = spec.clean(data)
+        record_id = as_text(data.get('id')) or new_id()
+        with self.db.transaction() as conn:
+            conn.execute(spec.insert_sql, [record_id] + [values.get(c) for c in spec.columns])
+        return self.get(resource, record_id)
+
+    def update(self, resource, record_id, data):
+        spec = TABLES[resource]
+        values = spec.clean(data, partial=True)
+        if values:
+            assignments = ', '.join('"%s" = ?' % c for c in values)
+            sql = 'UPDATE "%s" SET %s WHERE "id" = ?' % (spec.table, assignments)
+            with self.db.transaction() as conn:
+                if conn.execute(sql, list(values.values()) + [record_id]).rowcount == 0:
+                    return None
+        return self.get(resource, record_id)
+
+    def delete(self, resource, record_id):
+        with self.db.transaction() as conn:
+            return conn.execute(TABLES[resource].delete_sql, (record_id,)).rowcount > 0
+
+    def get_about(self):
+        row = self.db.connection().execute(ABOUT_SELECT_SQL, (ABOUT_ID,)).fetchone()
+        if row is None:
+            return dict(DEFAULT_ABOUT)
+        try:
+            advantages = json.loads(row['advantages'])
+        except ValueError:
+            advantages = []
+        return {"title": row['title'], "content": row['content'], "advantages": advantages}
+
+    def update_about(self, data):
+        about = self.get_about()
+        for key in ('title', 'content', 'advantages'):
+            if key in data:
+                about[key] = data[key]
+        if not isinstance(about['advantages'], list):
+            raise ValidationError('Поле advantages должно быть списком')
+        with self.db.transaction() as conn:
+            conn.execute(ABOUT_UPSERT_SQL, (
+                ABOUT_ID, str(about['title']), str(about['content']),
+                json.dumps(about['advantages'], ensure_ascii=False)))
+        return about
+
+
+database = Database(DATABASE_PATH)
+repository = CafeRepository(database)
+
+
+def seed_demo_content():
+    """Fill an empty database with the demo content the server used to hard-code"""
+    if repository.list('categories'):
+        return False
+    for category in ({"id": "pizza", "name": "Пицца", "order": 1},
+                     {"id": "burgers", "name": "Бургеры", "order": 2}):
+        repository.create('categories', category)
+    repository.create('items', {
+        "name": "Пицца Маргарита", "description": "Томатный соус, моцарелла, базилик",
+        "price": 450, "articleCode": "001", "categoryId": "pizza"})
+    repository.create('items', {
+        "name": "Бургер Йорк",
+        "description": "Котлета куриная, булка белая, бекон копченый, сыр, помидор, лист салата, красный лук",
+        "price": 470, "articleCode": "002", "categoryId": "burgers"})
+    repository.create('events', {
+        "title": "Живая музыка", "description": "Каждую пятницу и субботу!", "date": "2025-06-20"})
+    repository.create('news', {
+        "title": "Новое меню!", "content": "Попробуйте наши новые блюда.", "createdAt": "2025-06-10"})
+    repository.create('staff', {
+        "name": "Анна Петрова", "position": "Шеф-повар", "description": "Опытный шеф-повар", "order": 1})
+    repository.update_about({
+        "title": "О нас",
+        "content": "Лучшее кафе города!",
+        "advantages": [
+            {"title": "Уютная атмосфера", "description": "Приятная обстановка для всех гостей."},
+            {"title": "Вкусная еда", "description": "Широкий выбор блюд на любой вкус."}
+        ]
+    })
+    return True
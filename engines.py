@@ -0,0 +1,636 @@
+"""
+Serving engines of the Bardabar Cafe server: one thread, a thread pool, or asyncio
+
+Each engine drives an http.server request handler class; the handler decides
+about keep-alive (server.keep_alive, server.draining) and, for the async
+engine, about request bodies (see AsyncHTTPServer).
+"""
+
+import os
+import io
+import json
+import asyncio
+import contextlib
+import selectors
+import signal
+import socket
+import socketserver
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+SERVER_MODES = ('single', 'threaded', 'async')
+DEFAULT_MODE = 'threaded'
+DEFAULT_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+KEEPALIVE_TIMEOUT = 5
+SHUTDOWN_TIMEOUT = 10
+MAX_HEADER_BYTES = 64 * 1024
+# Bodies are read from the network in pieces of this size
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class RequestEntityTooLarge(Exception):
+    """The request body exceeds the configured size cap (answered with 413)"""
+
+
+class MalformedBody(Exception):
+    """The async engine cannot frame the request body (answered with 400)"""
+
+
+def _closing_response(status, message):
+    """A complete JSON error response sent by the engine itself, ending the connection"""
+    body = json.dumps({"status": "error", "message": message}, ensure_ascii=False).encode('utf-8')
+    return (b'HTTP/1.1 %s\r\nContent-type: application/json\r\nContent-Length: %d\r\n'
+            b'Connection: close\r\n\r\n' % (status, len(body)) + body)
+
+
+class _SharedSocketMixin:
+    """Serve from an already listening socket (inherited from the pre-fork supervisor)"""
+
+    def use_socket(self, sock):
+        self.socket.close()
+        self.socket = sock
+        self.server_address = sock.getsockname()
+
+
+class _HandOffMixin:
+    """Lets a handler keep its connection open after the request (see hand_off_connection)"""
+
+    def __init__(self, *args, **kwargs):
+        self._detached = set()
+        super().__init__(*args, **kwargs)
+
+    def detach_request(self, request):
+        self._detached.add(request)
+
+    def shutdown_request(self, request):
+        if request in self._detached:
+            self._detached.discard(request)
+            # Only close this descriptor: shutdown() would also end the stream on the duplicate
+            self.close_request(request)
+        else:
+            super().shutdown_request(request)
+
+
+class SingleThreadHTTPServer(_HandOffMixin, _SharedSocketMixin, socketserver.TCPServer):
+    """The original one-request-at-a-time server; connections are closed after each response"""
+    allow_reuse_address = True
+    keep_alive = False
+    draining = False
+
+    def drain(self):
+        self.draining = True
+
+
+class SelectorThread:
+    """One daemon thread serving many sockets through a selector; other threads hand sockets over.
+
+    hand_over() queues an item and wakes the thread through a socketpair; the thread takes it
+    up in _adopt(). Subclasses implement _adopt(), _ready() for selector events, _tick() after
+    every pass and _release() to close everything on exit; _prepare() and _timeout() are optional.
+    """
+    name = 'bardabar-selector'
+
+    def __init__(self):
+        self._incoming = []
+        self._lock = threading.Lock()
+        self._selector = None
+        self._wakeup = None
+        self._thread = None
+        self._closed = False
+
+    def hand_over(self, item):
+        """Queue an item for the thread; False once closed (the caller then disposes of it)"""
+        with self._lock:
+            if self._closed:
+                return False
+            # Started on first use, so a pre-fork supervisor never forks with this thread running
+            if self._thread is None:
+                self._start()
+            self._incoming.append(item)
+        self.wake()
+        return True
+
+    def wake(self):
+        """Interrupt the thread's select() now"""
+        wakeup = self._wakeup
+        if wakeup is not None:
+            with contextlib.suppress(OSError):
+                wakeup[1].send(b'\0')
+
+    def close(self):
+        """Stop the thread; it releases every socket it holds"""
+        with self._lock:
+            self._closed = True
+            thread = self._thread
+        self.wake()
+        if thread is not None:
+            thread.join(SHUTDOWN_TIMEOUT)
+
+    def _start(self):
+        self._selector = selectors.DefaultSelector()
+        self._wakeup = socket.socketpair()
+        for sock in self._wakeup:
+            sock.setblocking(False)
+        self._selector.register(self._wakeup[0], selectors.EVENT_READ)
+        self._prepare()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._closed:
+            for key, mask in self._selector.select(self._timeout()):
+                if key.data is None:
+                    with contextlib.suppress(OSError):
+                        while self._wakeup[0].recv(4096):
+                            pass
+                else:
+                    self._ready(key, mask)
+            self._adopt(self._take_incoming())
+            self._tick()
+        self._release(self._take_incoming())
+        self._selector.close()
+        for sock in self._wakeup:
+            sock.close()
+
+    def _take_incoming(self):
+        with self._lock:
+            incoming, self._incoming = self._incoming, []
+        return incoming
+
+    def _prepare(self):
+        """Runs in hand_over()'s thread just before the selector thread starts"""
+
+    def _timeout(self):
+        """Longest wait in select(); None waits for an event"""
+        return None
+
+    def _ready(self, key, mask):
+        raise NotImplementedError
+
+    def _adopt(self, incoming):
+        raise NotImplementedError
+
+    def _tick(self):
+        pass
+
+    def _release(self, incoming):
+        """Close every socket held, and the handed-over ones (incoming) not adopted yet"""
+        raise NotImplementedError
+
+
+class _IdleConnections(SelectorThread):
+    """Keep-alive connections waiting for their next request, watched by one selector thread.
+
+    New connections and connections a pool worker parks after a response wait here
+    instead of blocking a worker in readline(), so idle clients cost a file descriptor
+    rather than a worker. A parked connection goes to the pool once it is readable and
+    is closed after KEEPALIVE_TIMEOUT of silence.
+    """
+    name = 'bardabar-idle'
+
+    def __init__(self, resume, close):
+        super().__init__()
+        self._resume = resume
+        self._close = close
+        # request -> (client_address, deadline); insertion order is deadline order
+        self._parked = {}
+
+    def park(self, request, client_address):
+        """Watch the connection; False once closed (the caller then closes it itself)"""
+        return self.hand_over((request, client_address))
+
+    def _timeout(self):
+        if not self._parked:
+            return None
+        return max(0.0, next(iter(self._parked.values()))[1] - time.monotonic())
+
+    def _ready(self, key, mask):
+        request = key.fileobj
+        self._selector.unregister(request)
+        client_address, deadline = self._parked.pop(request)
+        self._resume(request, client_address)
+
+    def _adopt(self, incoming):
+        deadline = time.monotonic() + KEEPALIVE_TIMEOUT
+        for request, client_address in incoming:
+            self._parked[request] = (client_address, deadline)
+            self._selector.register(request, selectors.EVENT_READ, request)
+
+    def _tick(self):
+        now = time.monotonic()
+        while self._parked:
+            request, (client_address, deadline) = next(iter(self._parked.items()))
+            if deadline > now:
+                break
+            del self._parked[request]
+            self._selector.unregister(request)
+            self._close(request)
+
+    def _release(self, incoming):
+        for request in list(self._parked) + [request for request, client_address in incoming]:
+            self._close(request)
+        self._parked.clear()
+
+
+class ThreadPoolHTTPServer(_HandOffMixin, _SharedSocketMixin, socketserver.TCPServer):
+    """Accept loop in one thread, requests handled by a bounded pool of workers.
+
+    Workers only hold a connection while a request is being read or answered: new
+    connections and keep-alive connections between requests wait in _IdleConnections
+    until request bytes arrive.
+    """
+    allow_reuse_address = True
+    request_queue_size = 128
+    keep_alive = True
+    parks_idle_connections = True
+
+    def __init__(self, server_address, RequestHandlerClass, workers=DEFAULT_WORKERS, bind_and_activate=True):
+        super().__init__(server_address, RequestHandlerClass, bind_and_activate)
+        self.workers = workers
+        self.draining = False
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bardabar-worker')
+        self._idle = _IdleConnections(self._resume_request, self.shutdown_request)
+
+    def process_request(self, request, client_address):
+        # Most clients send the request right after connecting: skip the watcher then
+        if self._request_waiting(request):
+            self._resume_request(request, client_address)
+        elif not self._idle.park(request, client_address):
+            self.shutdown_request(request)
+
+    @staticmethod
+    def _request_waiting(request):
+        """True unless reading the connection now would block (EOF and errors count as waiting)"""
+        timeout = request.gettimeout()
+        request.settimeout(0)
+        try:
+            request.recv(1, socket.MSG_PEEK)
+        except BlockingIOError:
+            return False
+        except OSError:
+            pass
+        finally:
+            request.settimeout(timeout)
+        return True
+
+    def finish_request(self, request, client_address):
+        return self.RequestHandlerClass(request, client_address, self)
+
+    def _resume_request(self, request, client_address):
+        self._pool.submit(self._process_request_worker, request, client_address)
+
+    def _process_request_worker(self, request, client_address):
+        parked = False
+        try:
+            parked = getattr(self.finish_request(request, client_address), 'parked', False)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            if not (parked and not self.draining and self._idle.park(request, client_address)):
+                self.shutdown_request(request)
+
+    def drain(self):
+        """Stop keep-alive and close the connections no request has started on.
+
+        Requests in flight (even those whose body is still arriving) keep their worker and
+        finish; server_close() then waits for the pool.
+        """
+        self.draining = True
+        self._idle.close()
+
+    def server_close(self):
+        super().server_close()
+        # Before the pool: the watcher must not resume connections into a closed pool
+        self._idle.close()
+        self._pool.shutdown(wait=True)
+
+
+class _StreamedRequestFile:
+    """Blocking rfile for a handler thread whose request body is still arriving on the event loop.
+
+    The head is served from memory. Body reads run on the loop as StreamReader calls that never
+    return more than was asked for, so a pipelined request after the body stays in the reader.
+    """
+
+    def __init__(self, head, reader, receive, loop):
+        self._head = io.BytesIO(head)
+        self._reader = reader
+        self._receive = receive
+        self._loop = loop
+
+    def read(self, size=-1):
+        data = self._head.read(size)
+        if data or not size:
+            return data
+        return self._call(self._reader.read(size))
+
+    def readline(self, size=-1):
+        return self._head.readline(size) or self._call(self._readline())
+
+    def close(self):
+        pass
+
+    async def _readline(self):
+        try:
+            return await self._reader.readuntil(b'\n')
+        except asyncio.IncompleteReadError as e:
+            return e.partial
+        except asyncio.LimitOverrunError:
+            # Longer than any valid chunk header; BodyReader rejects the empty line
+            return b''
+
+    def _call(self, coro):
+        # _receive() bounds each read; the extra second only covers a loop that has stopped
+        return asyncio.run_coroutine_threadsafe(self._receive(coro), self._loop).result(KEEPALIVE_TIMEOUT + 1)
+
+
+class _BufferedConnection:
+    """Socket stand-in that feeds a stream handler one buffered request and collects its output"""
+
+    def __init__(self, data, rfile=None):
+        self._data = data
+        self._rfile = rfile
+        self.output = bytearray()
+        # Set by hand_off_connection(): the engine passes the real socket on after the output
+        self.adopt = None
+        # Set by send_file_body(): (open file, byte count) the engine sends after the output
+        self.file = None
+
+    def makefile(self, mode, bufsize=-1):
+        return self._rfile or io.BytesIO(self._data)
+
+    def sendall(self, data):
+        self.output += data
+
+    def settimeout(self, timeout):
+        pass
+
+    def setsockopt(self, *args):
+        pass
+
+
+class _BufferedHandlerMixin:
+    """Runs exactly one request per handler instance; the async engine owns the connection"""
+
+    def handle(self):
+        self.close_connection = True
+        self.handle_one_request()
+
+    def handle_expect_100(self):
+        # The engine has already answered "100 Continue" before reading the body
+        return True
+
+    def hand_off_connection(self, adopt):
+        self.connection.adopt = adopt
+
+    def send_file_body(self, f, count):
+        # Sent by the event loop after the buffered head, so the file never passes through memory
+        self.connection.file = (f, count)
+
+
+class AsyncHTTPServer:
+    """asyncio engine: socket I/O on the event loop, handler code in a bounded thread pool.
+
+    Slow clients only cost a coroutine while their request and response are
+    transferred; a worker thread is occupied only while the handler runs. Upload
+    and import bodies are the exception: they are not buffered but read by the
+    handler as it goes (see _StreamedRequestFile), so memory per connection stays
+    at a chunk instead of the whole upload cap.
+
+    The handler class provides body_limit_for(content_type) -> (size cap, streamed),
+    so bodies are capped and either buffered or streamed before the handler runs.
+    """
+    keep_alive = True
+    # Sent by the engine itself: a body that is too large or cannot be framed never reaches a handler
+    TOO_LARGE_RESPONSE = _closing_response(b'413 Payload Too Large', "Слишком большой запрос")
+
+    def __init__(self, server_address, RequestHandlerClass, workers=DEFAULT_WORKERS):
+        self.server_address = server_address
+        self.socket = None
+        self.RequestHandlerClass = type(
+            'Buffered' + RequestHandlerClass.__name__,
+            (_BufferedHandlerMixin, RequestHandlerClass), {})
+        self.workers = workers
+        self.draining = False
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bardabar-async')
+        self._connections = {}
+        self._loop = None
+        self._stop = None
+
+    def use_socket(self, sock):
+        self.socket = sock
+        self.server_address = sock.getsockname()
+
+    def serve_forever(self):
+        asyncio.run(self._serve())
+
+    def shutdown(self):
+        """Thread-safe request to stop serve_forever()"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stop.set)
+
+    def drain(self):
+        self.draining = True
+
+    def server_close(self):
+        self._pool.shutdown(wait=True)
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        if self.socket is not None:
+            server = await asyncio.start_server(
+                self._handle_connection, sock=self.socket, limit=MAX_HEADER_BYTES)
+        else:
+            server = await asyncio.start_server(
+                self._handle_connection, *self.server_address, limit=MAX_HEADER_BYTES,
+                reuse_address=True, backlog=128)
+        self.server_address = server.sockets[0].getsockname()[:2]
+        if threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                try:
+                    self._loop.add_signal_handler(signum, self._stop.set)
+                except (NotImplementedError, RuntimeError):
+                    pass
+        try:
+            await self._stop.wait()
+        finally:
+            server.close()
+            await server.wait_closed()
+            await self._drain_connections()
+
+    async def _drain_connections(self):
+        self.drain()
+        for writer, busy in list(self._connections.items()):
+            if not busy:
+                writer.close()
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        if tasks:
+            await asyncio.wait(tasks, timeout=SHUTDOWN_TIMEOUT)
+
+    async def _receive(self, awaitable):
+        # Like the threaded engine's socket timeout: a limit on each read, not on the whole request
+        return await asyncio.wait_for(awaitable, KEEPALIVE_TIMEOUT)
+
+    async def _read_request(self, reader, writer):
+        """Read one request; returns (raw, streamed).
+
+        The body keeps its framing (chunked bodies are decoded by the handler). A streamed body
+        (uploads, menu imports) is left in the reader for the handler and raw is just the head.
+        """
+        first = await self._receive(reader.readexactly(1))
+        # From the first byte on, a drain lets the request finish instead of closing the connection
+        self._connections[writer] = True
+        # Tolerate stray CRLFs between pipelined requests
+        head = (first + await self._receive(reader.readuntil(b'\r\n\r\n'))).lstrip(b'\r\n')
+        content_length = 0
+        chunked = False
+        expect_continue = False
+        content_type = 'text/plain'
+        for line in head.split(b'\r\n')[1:]:
+            name, _, value = line.partition(b':')
+            name = name.strip().lower()
+            if name == b'content-length':
+                try:
+                    content_length = int(value.strip() or 0)
+                except ValueError:
+                    content_length = -1
+                if content_length < 0:
+                    raise MalformedBody("Некорректная длина тела запроса")
+            elif name == b'transfer-encoding':
+                chunked = b'chunked' in value.lower()
+            elif name == b'content-type':
+                content_type = value.split(b';')[0].strip().lower().decode('latin-1')
+            elif name == b'expect' and value.strip().lower() == b'100-continue':
+                expect_continue = True
+        # The handler's own caps, applied before the body is buffered
+        limit, streamed = self.RequestHandlerClass.body_limit_for(content_type)
+        if content_length > limit:
+            raise RequestEntityTooLarge(content_length)
+        if (content_length or chunked) and expect_continue:
+            writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+            await writer.drain()
+        if streamed and (content_length or chunked):
+            return head, True
+        if chunked:
+            return head + await self._read_chunked(reader, limit), False
+        return head + await self._read_exactly(reader, content_length), False
+
+    async def _read_exactly(self, reader, size):
+        parts = []
+        while size:
+            part = await self._receive(reader.readexactly(min(size, READ_CHUNK_SIZE)))
+            parts.append(part)
+            size -= len(part)
+        return b''.join(parts)
+
+    async def _read_chunked(self, reader, limit):
+        parts = []
+        total = 0
+        while True:
+            line = await self._receive(reader.readuntil(b'\r\n'))
+            parts.append(line)
+            try:
+                size = int(line.split(b';', 1)[0].strip(), 16)
+            except ValueError:
+                size = -1
+            if size < 0:
+                raise MalformedBody("Некорректное chunked-кодирование")
+            if not size:
+                break
+            total += size
+            if total > limit:
+                raise RequestEntityTooLarge(total)
+            parts.append(await self._read_exactly(reader, size + 2))
+        # Trailer fields end with an empty line
+        while line != b'\r\n':
+            line = await self._receive(reader.readuntil(b'\r\n'))
+            parts.append(line)
+        return b''.join(parts)
+
+    def _run_handler(self, raw, client_address, reader=None):
+        rfile = None if reader is None else _StreamedRequestFile(raw, reader, self._receive, self._loop)
+        conn = _BufferedConnection(raw, rfile)
+        try:
+            handler = self.RequestHandlerClass(conn, client_address, self)
+        except Exception:
+            traceback.print_exc()
+            if conn.file is not None:
+                conn.file[0].close()
+            return bytes(conn.output), True, None, None
+        return bytes(conn.output), handler.close_connection, conn.adopt, conn.file
+
+    async def _handle_connection(self, reader, writer):
+        client_address = writer.get_extra_info('peername')
+        self._connections[writer] = False
+        try:
+            while not self.draining:
+                try:
+                    raw, streamed = await self._read_request(reader, writer)
+                except RequestEntityTooLarge:
+                    writer.write(self.TOO_LARGE_RESPONSE)
+                    await writer.drain()
+                    break
+                except MalformedBody as e:
+                    # The threaded engine's BodyReader answers the same way
+                    writer.write(_closing_response(b'400 Bad Request', str(e)))
+                    await writer.drain()
+                    break
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError,
+                        asyncio.LimitOverrunError, ValueError, ConnectionError):
+                    break
+                output, close, adopt, body_file = await self._loop.run_in_executor(
+                    self._pool, self._run_handler, raw, client_address, reader if streamed else None)
+                writer.write(output)
+                await writer.drain()
+                if body_file is not None:
+                    f, count = body_file
+                    with f:
+                        # os.sendfile() where the transport allows it, chunked reads otherwise
+                        await self._loop.sendfile(writer.transport, f, 0, count)
+                self._connections[writer] = False
+                if adopt is not None:
+                    # Closing the transport below only releases our descriptor, not the duplicate
+                    sock = writer.get_extra_info('socket')
+                    adopt(socket.fromfd(sock.fileno(), sock.family, sock.type))
+                    break
+                if close:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self._connections.pop(writer, None)
+            writer.close()
+
+
+def make_server(handler_class, port=12000, mode=DEFAULT_MODE, workers=DEFAULT_WORKERS, host='0.0.0.0',
+                sock=None):
+    """Create (but do not start) a server for the given concurrency mode.
+
+    With sock the server accepts on that already listening socket instead of binding its own.
+    """
+    bind = sock is None
+    if mode == 'single':
+        httpd = SingleThreadHTTPServer((host, port), handler_class, bind_and_activate=bind)
+    elif mode == 'threaded':
+        httpd = ThreadPoolHTTPServer((host, port), handler_class, workers=workers, bind_and_activate=bind)
+    elif mode == 'async':
+        httpd = AsyncHTTPServer((host, port), handler_class, workers=workers)
+    else:
+        raise ValueError(f'Unknown server mode: {mode}')
+    if sock is not None:
+        httpd.use_socket(sock)
+    return httpd
+
+
+def create_listener(host, port, reuse_port=False):
+    """Listening socket bound once by the supervisor and shared by all worker processes"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(ThreadPoolHTTPServer.request_queue_size)
+    return sock
@@ -0,0 +1,5 @@
+-- CreateIndex
+CREATE INDEX IF NOT EXISTS "MenuCategory_order_idx" ON "MenuCategory"("order");
+
+-- CreateIndex
+CREATE INDEX IF NOT EXISTS "MenuItem_categoryId_idx" ON "MenuItem"("categoryId");
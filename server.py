@@ -4,29 +4,2205 @@ Simple HTTP server for the Bardabar Cafe website
 """
 
 import http.server
-import socketserver
 import os
 import sys
-from urllib.parse import urlparse, parse_qs
+from urllib.parse import urlparse, parse_qs, unquote
 import json
 import mimetypes
+import gzip
+import email.parser
+import email.utils
+import shutil
+import bisect
+import codecs
+import csv
+import re
 import base64
+import hashlib
+import sqlite3
+import contextlib
+import datetime
+import time
+import collections
 import secrets
+import io
+import tempfile
+import selectors
+import signal
+import threading
+import multiprocessing
+import traceback
+import argparse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from db import (DATABASE_PATH, TABLES, Database, ValidationError, as_int, as_text, database, new_id,
+                repository, seed_demo_content)
+from engines import (DEFAULT_MODE, DEFAULT_WORKERS, KEEPALIVE_TIMEOUT, SERVER_MODES, SHUTDOWN_TIMEOUT,
+                     RequestEntityTooLarge, SelectorThread, create_listener, make_server)
 
 SESSION_COOKIE_NAME = 'admin_session'
 ADMIN_LOGIN = 'admin'
 ADMIN_PASSWORD = 'cafe123'
-sessions = set()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# --- Content loaders (API resources built from the database) ---
+
+def load_menu_items():
+    return image_pipeline.annotate(repository.list_menu_items())
+
+
+def load_menu_categories():
+    return repository.list('categories')
+
+
+def load_events():
+    return image_pipeline.annotate(repository.list('events'))
+
+
+def load_news():
+    return repository.list('news')
+
+
+def load_contacts():
+    """Stored contact requests, preceded by those still waiting in the write-behind queue"""
+    # Queue first: a request written in between then shows up twice rather than not at all
+    pending = contact_queue.pending()
+    stored = repository.list('contacts')
+    stored_ids = {record['id'] for record in stored}
+    return [record for record in reversed(pending) if record['id'] not in stored_ids] + stored
+
+
+def load_staff():
+    return image_pipeline.annotate(repository.list('staff'))
+
+
+def load_about():
+    return repository.get_about()
+
+# --- END: Content loaders ---
+
+
+# --- Admin sessions ---
+
+SESSION_BACKENDS = ('memory', 'sqlite')
+SESSION_TTL = 12 * 60 * 60
+SESSION_MAX = 1000
+# Sliding expiry is written back at most this often per session (matters for the SQLite store)
+SESSION_REFRESH_INTERVAL = 60
+SESSION_SWEEP_INTERVAL = 60
+SESSIONS_DB_PATH = os.environ.get('BARDABAR_SESSIONS_DB') or os.path.join(BASE_DIR, 'prisma', 'sessions.db')
+
+
+class MemorySessionStore:
+    """Admin sessions of this process with sliding expiry and LRU eviction.
+
+    Every session has the same TTL and is moved to the end on use, so the
+    OrderedDict is ordered by expiry as well as by recency: sweeping and
+    eviction only ever pop from the front.
+    """
+
+    def __init__(self, ttl=SESSION_TTL, max_sessions=SESSION_MAX):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self):
+        token = secrets.token_hex(32)
+        now = time.monotonic()
+        with self._lock:
+            self._sweep(now)
+            self._sessions[token] = now + self.ttl
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return token
+
+    def validate(self, token):
+        if not token:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            self._sweep(now)
+            if token not in self._sessions:
+                return False
+            self._sessions[token] = now + self.ttl
+            self._sessions.move_to_end(token)
+            return True
+
+    def revoke(self, token):
+        with self._lock:
+            self._sessions.pop(token, None)
+
+    def _sweep(self, now):
+        while self._sessions:
+            token, expires_at = next(iter(self._sessions.items()))
+            if expires_at > now:
+                break
+            del self._sessions[token]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def close(self):
+        pass
+
+
+class SessionDatabase(Database):
+    """SQLite file holding sessions shared by all server processes"""
+
+    def initialize(self):
+        with self._lock:
+            if self._initialized:
+                return
+            conn = self._connect()
+            try:
+                conn.execute('PRAGMA journal_mode = WAL')
+                conn.execute('CREATE TABLE IF NOT EXISTS "Session" '
+                             '("token" TEXT NOT NULL PRIMARY KEY, "expiresAt" REAL NOT NULL, "lastSeen" REAL NOT NULL)')
+                conn.execute('CREATE INDEX IF NOT EXISTS "Session_expiresAt_idx" ON "Session"("expiresAt")')
+                conn.commit()
+            finally:
+                conn.close()
+            self._initialized = True
+
+
+class SqliteSessionStore:
+    """Sessions in a shared SQLite file, so any worker process can validate the admin cookie"""
+
+    INSERT_SQL = 'INSERT INTO "Session" ("token", "expiresAt", "lastSeen") VALUES (?, ?, ?)'
+    SELECT_SQL = 'SELECT "expiresAt", "lastSeen" FROM "Session" WHERE "token" = ?'
+    TOUCH_SQL = 'UPDATE "Session" SET "expiresAt" = ?, "lastSeen" = ? WHERE "token" = ?'
+    DELETE_SQL = 'DELETE FROM "Session" WHERE "token" = ?'
+    SWEEP_SQL = 'DELETE FROM "Session" WHERE "expiresAt" <= ?'
+    # Keep the max_sessions most recently used sessions
+    EVICT_SQL = ('DELETE FROM "Session" WHERE "token" IN '
+                 '(SELECT "token" FROM "Session" ORDER BY "lastSeen" DESC LIMIT -1 OFFSET ?)')
+
+    def __init__(self, path=SESSIONS_DB_PATH, ttl=SESSION_TTL, max_sessions=SESSION_MAX):
+        self.db = SessionDatabase(path)
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._next_sweep = 0.0
+
+    def create(self):
+        token = secrets.token_hex(32)
+        now = time.time()
+        with self.db.transaction() as conn:
+            conn.execute(self.INSERT_SQL, (token, now + self.ttl, now))
+            conn.execute(self.EVICT_SQL, (self.max_sessions,))
+        return token
+
+    def validate(self, token):
+        if not token:
+            return False
+        now = time.time()
+        self._maybe_sweep(now)
+        row = self.db.connection().execute(self.SELECT_SQL, (token,)).fetchone()
+        if row is None:
+            return False
+        if row['expiresAt'] <= now:
+            self.revoke(token)
+            return False
+        if now - row['lastSeen'] >= SESSION_REFRESH_INTERVAL:
+            with self.db.transaction() as conn:
+                conn.execute(self.TOUCH_SQL, (now + self.ttl, now, token))
+        return True
+
+    def revoke(self, token):
+        with self.db.transaction() as conn:
+            conn.execute(self.DELETE_SQL, (token,))
+
+    def _maybe_sweep(self, now):
+        # Amortized cleanup: at most one DELETE per interval per process
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + SESSION_SWEEP_INTERVAL
+        with self.db.transaction() as conn:
+            conn.execute(self.SWEEP_SQL, (now,))
+
+    def __len__(self):
+        return self.db.connection().execute('SELECT COUNT(*) FROM "Session"').fetchone()[0]
+
+    def close(self):
+        self.db.close_all()
+
+
+sessions = MemorySessionStore()
+
+
+def configure_sessions(backend='memory', path=None):
+    """Replace the session store; 'sqlite' shares sessions between worker processes"""
+    global sessions
+    sessions.close()
+    if backend == 'sqlite':
+        sessions = SqliteSessionStore(path or SESSIONS_DB_PATH)
+    elif backend == 'memory':
+        sessions = MemorySessionStore()
+    else:
+        raise ValueError(f'Unknown session backend: {backend}')
+    return sessions
+
+# --- END: Admin sessions ---
+
+
+# --- Contact request queue (write-behind) ---
+
+CONTACT_QUEUE_PATH = (os.environ.get('BARDABAR_CONTACT_QUEUE')
+                      or os.path.join(BASE_DIR, 'prisma', 'contact-queue.db'))
+CONTACT_BATCH_SIZE = 100
+# Submissions arriving within this window are written in one transaction
+CONTACT_BATCH_DELAY = 0.05
+# Also picks up rows queued by other (or crashed) worker processes
+CONTACT_FLUSH_INTERVAL = 1.0
+# Optional webhook that receives {"contacts": [...]} for every written batch
+CONTACT_NOTIFY_URL = os.environ.get('BARDABAR_NOTIFY_URL')
+CONTACT_NOTIFY_TIMEOUT = 5
+
+
+class ContactQueueDatabase(Database):
+    """Append-only SQLite file of accepted contact requests not yet in the main database"""
+
+    def _connect(self):
+        conn = super()._connect()
+        # An acknowledged request must survive a power loss, not just a crash
+        conn.execute('PRAGMA synchronous = FULL')
+        return conn
+
+    def initialize(self):
+        with self._lock:
+            if self._initialized:
+                return
+            conn = self._connect()
+            try:
+                conn.execute('PRAGMA journal_mode = WAL')
+                conn.execute('CREATE TABLE IF NOT EXISTS "PendingContact" '
+                             '("seq" INTEGER PRIMARY KEY AUTOINCREMENT, "id" TEXT NOT NULL UNIQUE, "data" TEXT NOT NULL)')
+                conn.commit()
+            finally:
+                conn.close()
+            self._initialized = True
+
+
+class ContactQueue:
+    """Write-behind queue for contact and table-booking requests.
+
+    submit() validates a request, appends it to the queue file and returns at once. A
+    background thread moves queued rows into ContactRequest in batches of one transaction
+    each and then hands them to the notifier. Rows still queued at startup (after a crash or
+    restart) are written first; inserts are idempotent, so a batch interrupted between the
+    two commits is simply written again.
+    """
+
+    def __init__(self, path, repository):
+        self.db = ContactQueueDatabase(path)
+        self.repository = repository
+        self.spec = TABLES['contacts']
+        self.insert_sql = self.spec.insert_sql.replace('INSERT INTO', 'INSERT OR IGNORE INTO', 1)
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._stopping = False
+        self._notifier = None
+        self._lock = threading.Lock()
+
+    def submit(self, data):
+        """Queue a request; returns its API record, marked "pending": true"""
+        values = self.spec.clean(data)
+        # Every column, like the stored rows listed by GET /api/contacts
+        record = {"id": new_id(), **{column: values.get(column) for column in self.spec.columns}}
+        with self.db.transaction() as conn:
+            conn.execute('INSERT INTO "PendingContact" ("id", "data") VALUES (?, ?)',
+                         (record['id'], json.dumps(record, ensure_ascii=False)))
+        self._wakeup.set()
+        return self._to_dict(record)
+
+    def pending(self):
+        """Queued requests, oldest first"""
+        rows = self.db.connection().execute('SELECT "data" FROM "PendingContact" ORDER BY "seq"')
+        return [self._to_dict(json.loads(row['data'])) for row in rows]
+
+    def discard(self, record_id):
+        with self.db.transaction() as conn:
+            return conn.execute('DELETE FROM "PendingContact" WHERE "id" = ?', (record_id,)).rowcount > 0
+
+    def start(self):
+        """Start the writer; it begins by replaying whatever is already queued"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='bardabar-contacts', daemon=True)
+            self._thread.start()
+        self._wakeup.set()
+
+    def close(self):
+        """Write what is queued, stop the writer and release the queue file"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            self._stopping = True
+        self._wakeup.set()
+        if thread is not None:
+            thread.join(SHUTDOWN_TIMEOUT)
+        with self._lock:
+            notifier, self._notifier = self._notifier, None
+        if notifier is not None:
+            notifier.shutdown(wait=True)
+        self.db.close_all()
+
+    def flush(self):
+        """Move one batch into ContactRequest; returns the number of requests written"""
+        conn = self.db.connection()
+        with conn:
+            # IMMEDIATE: a batch is moved (and announced) by exactly one worker process
+            conn.execute('BEGIN IMMEDIATE')
+            rows = conn.execute('SELECT "seq", "data" FROM "PendingContact" ORDER BY "seq" LIMIT ?',
+                                (CONTACT_BATCH_SIZE,)).fetchall()
+            if not rows:
+                return 0
+            records = [json.loads(row['data']) for row in rows]
+            with self.repository.db.transaction() as main:
+                main.executemany(self.insert_sql, [
+                    [record['id']] + [record.get(column) for column in self.spec.columns] for record in records])
+            conn.execute('DELETE FROM "PendingContact" WHERE "seq" <= ?', (rows[-1]['seq'],))
+        response_cache.invalidate('contacts')
+        self._notify([self.spec.to_dict(record) for record in records])
+        return len(records)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(CONTACT_FLUSH_INTERVAL)
+            stopping = self._stopping
+            if not stopping:
+                # Let the rest of a burst arrive
+                time.sleep(CONTACT_BATCH_DELAY)
+            self._wakeup.clear()
+            try:
+                while self.flush():
+                    pass
+            except sqlite3.Error as e:
+                # The rows stay queued and are retried on the next round (or after a restart)
+                print(f"Не удалось записать заявки: {e}")
+            if stopping:
+                return
+
+    def _notify(self, records):
+        print(f"Записано заявок: {len(records)}")
+        if not CONTACT_NOTIFY_URL:
+            return
+        with self._lock:
+            if self._notifier is None:
+                self._notifier = ThreadPoolExecutor(max_workers=1, thread_name_prefix='bardabar-notify')
+            self._notifier.submit(self._post_notification, records)
+
+    def _post_notification(self, records):
+        body = json.dumps({"contacts": records}, ensure_ascii=False).encode('utf-8')
+        request = urllib.request.Request(CONTACT_NOTIFY_URL, data=body, method='POST',
+                                         headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=CONTACT_NOTIFY_TIMEOUT) as response:
+                response.read()
+        except (OSError, ValueError) as e:
+            print(f"Не удалось отправить уведомление о заявках: {e}")
+
+    def _to_dict(self, record):
+        # Rows queued by older versions may lack the columns that were not sent
+        record = self.spec.to_dict({"id": record['id'], **{column: record.get(column) for column in self.spec.columns}})
+        record['pending'] = True
+        return record
+
+
+contact_queue = ContactQueue(CONTACT_QUEUE_PATH, repository)
+
+# --- END: Contact request queue ---
+
+
+# --- Response cache for read-only API resources ---
+
+class CachedResponse:
+    """Encoded JSON body of one resource together with its strong ETag"""
+    __slots__ = ('body', 'etag', 'version')
+
+    def __init__(self, body, etag, version):
+        self.body = body
+        self.etag = etag
+        self.version = version
+
+
+# Every resource that has a version counter
+CACHE_RESOURCES = ('items', 'categories', 'events', 'news', 'staff', 'about', 'contacts')
+
+
+class LocalVersions:
+    """Resource version counters of a single process"""
+
+    def __init__(self):
+        self._versions = dict.fromkeys(CACHE_RESOURCES, 0)
+        self._lock = threading.Lock()
+
+    def get(self, resource):
+        return self._versions[resource]
+
+    def bump(self, resource):
+        with self._lock:
+            self._versions[resource] += 1
+
+    def bump_if(self, resource, expected):
+        """Bump only if the version is still expected; False when something else bumped it first"""
+        with self._lock:
+            if self._versions[resource] != expected:
+                return False
+            self._versions[resource] += 1
+            return True
+
+
+class SharedVersions:
+    """Resource version counters in shared memory, inherited by forked worker processes.
+
+    A mutation in any worker bumps the counter; every other worker sees the
+    new value on its next lookup and rebuilds its cached body.
+    """
+
+    def __init__(self):
+        self._index = {resource: i for i, resource in enumerate(CACHE_RESOURCES)}
+        self._counters = multiprocessing.RawArray('q', len(CACHE_RESOURCES))
+        self._lock = multiprocessing.Lock()
+
+    def get(self, resource):
+        return self._counters[self._index[resource]]
+
+    def bump(self, resource):
+        with self._lock:
+            self._counters[self._index[resource]] += 1
+
+    def bump_if(self, resource, expected):
+        with self._lock:
+            index = self._index[resource]
+            if self._counters[index] != expected:
+                return False
+            self._counters[index] += 1
+            return True
+
+
+class ResponseCache:
+    """Pre-serialized API responses, rebuilt only after a mutation bumps the resource version"""
+
+    def __init__(self, versions=None):
+        self.versions = versions or LocalVersions()
+        self._entries = {}
+        # (version, ETag) of the last body passed to replace(), per resource
+        self._replaced = {}
+
+    def version(self, resource):
+        return self.versions.get(resource)
+
+    def get(self, resource, build):
+        """Return (entry, hit): hit is False when the body had to be rebuilt"""
+        version = self.versions.get(resource)
+        entry = self._entries.get(resource)
+        if entry is not None and entry.version == version:
+            return entry, True
+        entry = self._entry(json.dumps(build(), ensure_ascii=False).encode('utf-8'), version)
+        # A body built from data older than a concurrent invalidation is served once but not kept
+        if self.versions.get(resource) == version:
+            self._entries[resource] = entry
+        return entry, False
+
+    def replace(self, bodies, versions):
+        """Swap in bodies built elsewhere from data read while each resource was at versions[resource].
+
+        The version is bumped only for a body that differs from what this cache last saw at the
+        same version: the cached entry, or else the previous replace(). If the counter moved since
+        that replace(), a mutation has already announced the change and the body is stored without
+        another bump. A resource bumped while its body was being built is skipped: its next request
+        rebuilds it. Returns the resources that changed.
+        """
+        changed = []
+        for resource, body in bodies.items():
+            version = versions[resource]
+            entry = self._entry(body, version)
+            current = self._entries.get(resource)
+            if current is not None and current.version == version:
+                seen = current.etag
+            else:
+                previous_version, seen = self._replaced.get(resource, (None, None))
+                if previous_version != version:
+                    # The first snapshot of this process, or one taken after a mutation
+                    seen = None
+            if seen is not None and seen != entry.etag and self.versions.bump_if(resource, version):
+                entry.version = version + 1
+                changed.append(resource)
+            elif self.versions.get(resource) != version:
+                continue
+            self._entries[resource] = entry
+            self._replaced[resource] = (entry.version, entry.etag)
+        return changed
+
+    @staticmethod
+    def _entry(body, version):
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()[:20]
+        return CachedResponse(body, etag, version)
+
+    def invalidate(self, *resources):
+        for resource in resources:
+            self.versions.bump(resource)
+            self._entries.pop(resource, None)
+
+
+response_cache = ResponseCache()
+
+# Resources whose cached responses are stale after a mutation under the given API prefix
+MUTATION_INVALIDATES = {
+    '/api/menu/categories': ('categories', 'items'),
+    '/api/items': ('items',),
+    '/api/events': ('events',),
+    '/api/news': ('news',),
+    '/api/staff': ('staff',),
+    '/api/about': ('about',),
+    '/api/contacts': ('contacts',),
+}
+
+# --- END: Response cache ---
+
+
+# --- Collection queries (filtering, search, pagination, projection) ---
+
+MAX_PAGE_SIZE = 100
+QUERY_RESPONSE_CACHE_SIZE = 128
+
+
+class QueryError(ValueError):
+    """Invalid query string parameters"""
+
+
+class CollectionSpec:
+    """Which fields of a collection can be searched, grouped by and projected.
+
+    sort_key(record) mirrors the ORDER BY the collection is loaded with; cursors carry it.
+    """
+
+    def __init__(self, fields, search_fields, sort_key, group_field=None):
+        self.fields = fields
+        self.search_fields = search_fields
+        self.sort_key = sort_key
+        self.group_field = group_field
+
+
+def _menu_order(item):
+    # MENU_ITEMS_SQL: ORDER BY c."order", c."id", i."name", i."id"
+    return item['category']['order'], item['categoryId'], item['name'], item['id']
+
+
+def _newest_first(record):
+    # TABLES['news']: ORDER BY "createdAt" DESC, "id"
+    created = record.get('createdAt')
+    return -(datetime.datetime.fromisoformat(created).timestamp() if created else 0), record['id']
+
+
+COLLECTION_SPECS = {
+    'items': CollectionSpec(
+        fields=('id', 'name', 'description', 'price', 'imageUrl', 'images', 'articleCode', 'categoryId',
+                'category'),
+        search_fields=('name', 'description', 'articleCode'), sort_key=_menu_order, group_field='categoryId'),
+    'news': CollectionSpec(
+        fields=('id', 'title', 'content', 'imageUrl', 'createdAt'),
+        search_fields=('title', 'content'), sort_key=_newest_first),
+}
+
+
+def _search_words(text):
+    return re.findall(r'\w+', text.lower().replace('ё', 'е'))
+
+
+def encode_cursor(sort_key):
+    raw = json.dumps(sort_key, ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        sort_key = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8'))
+    except (ValueError, UnicodeDecodeError):
+        sort_key = None
+    if not isinstance(sort_key, list):
+        raise QueryError('Некорректный cursor')
+    return tuple(sort_key)
+
+
+class CollectionIndex:
+    """Lookup structures over one version of a collection.
+
+    Per-group position lists and a word -> positions map let filters and
+    text search avoid scanning every record; all lists are kept in the
+    collection's own order so pages can be cut with bisect. The sorted
+    vocabulary turns a prefix into one contiguous range of words.
+
+    A cursor is the sort key of the last record served, so the next page
+    starts right after it even if that record has since been deleted.
+    """
+
+    def __init__(self, records, spec):
+        self.records = records
+        self.spec = spec
+        self.keys = [spec.sort_key(record) for record in records]
+        self.groups = {}
+        self.words = {}
+        for i, record in enumerate(records):
+            if spec.group_field:
+                self.groups.setdefault(record.get(spec.group_field), []).append(i)
+            for field in spec.search_fields:
+                for word in _search_words(str(record.get(field) or '')):
+                    self.words.setdefault(word, set()).add(i)
+        self.vocabulary = sorted(self.words)
+        self.responses = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def search(self, text):
+        """Positions of records containing every query word (as a word prefix)"""
+        result = None
+        for term in _search_words(text):
+            matches = set()
+            # Words starting with term sort right after it
+            for i in range(bisect.bisect_left(self.vocabulary, term), len(self.vocabulary)):
+                word = self.vocabulary[i]
+                if not word.startswith(term):
+                    break
+                matches |= self.words[word]
+            result = matches if result is None else result & matches
+            if not result:
+                return []
+        return sorted(result) if result is not None else None
+
+    def select(self, group=None, text=None, cursor=None, limit=None):
+        """Return (records, next_cursor) for a filtered page"""
+        candidates = None
+        if group is not None:
+            candidates = self.groups.get(group, [])
+        if text:
+            found = self.search(text)
+            if found is not None:
+                found_set = set(found)
+                candidates = found if candidates is None else [p for p in candidates if p in found_set]
+        if candidates is None:
+            candidates = range(len(self.records))
+        start = 0
+        if cursor:
+            try:
+                start = bisect.bisect_right(candidates, decode_cursor(cursor), key=self.keys.__getitem__)
+            except TypeError:
+                # A key of another collection (or a forged one) does not compare with ours
+                raise QueryError('Некорректный cursor')
+        end = len(candidates) if limit is None else start + limit
+        page = [self.records[p] for p in candidates[start:end]]
+        next_cursor = None
+        if end < len(candidates) and page:
+            next_cursor = encode_cursor(self.keys[candidates[end - 1]])
+        return page, next_cursor
+
+    def cached_response(self, key, build):
+        """Encoded response for a canonical query string; returns (entry, hit)"""
+        with self._lock:
+            entry = self.responses.get(key)
+            if entry is not None:
+                self.responses.move_to_end(key)
+                return entry, True
+        body = json.dumps(build(), ensure_ascii=False).encode('utf-8')
+        entry = CachedResponse(body, '"%s"' % hashlib.sha1(body).hexdigest()[:20], None)
+        with self._lock:
+            self.responses[key] = entry
+            while len(self.responses) > QUERY_RESPONSE_CACHE_SIZE:
+                self.responses.popitem(last=False)
+        return entry, False
+
+
+_collection_indexes = {}
+
+
+def get_collection_index(resource, load):
+    """Index for the current version of a resource, rebuilt after invalidation"""
+    version = response_cache.version(resource)
+    cached = _collection_indexes.get(resource)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    index = CollectionIndex(load(), COLLECTION_SPECS[resource])
+    _collection_indexes[resource] = (version, index)
+    return index
+
+
+def parse_collection_query(resource, query_string):
+    """Validate ?categoryId=&q=&limit=&cursor=&fields=&normalize= into keyword arguments"""
+    spec = COLLECTION_SPECS[resource]
+    params = {key: values[-1] for key, values in parse_qs(query_string).items()}
+    query = {'group': None, 'text': params.get('q') or None, 'cursor': params.get('cursor') or None,
+             'limit': None, 'fields': None, 'normalize': False, 'paged': False}
+    if spec.group_field:
+        query['group'] = params.get(spec.group_field) or None
+    if 'limit' in params:
+        try:
+            query['limit'] = max(1, min(int(params['limit']), MAX_PAGE_SIZE))
+        except ValueError:
+            raise QueryError('Некорректный limit')
+    if 'fields' in params:
+        fields = [field.strip() for field in params['fields'].split(',') if field.strip()]
+        unknown = [field for field in fields if field not in spec.fields]
+        if unknown:
+            raise QueryError(f'Неизвестные поля: {", ".join(unknown)}')
+        query['fields'] = tuple(fields)
+    if resource == 'items':
+        query['normalize'] = params.get('normalize', '').lower() in ('1', 'true', 'yes')
+        if query['normalize'] and query['fields'] and 'category' in query['fields']:
+            raise QueryError('С normalize=1 категории приходят в categories: запросите categoryId вместо category')
+    query['paged'] = bool(query['limit'] or query['cursor'] or query['normalize'])
+    return query
+
+
+def build_collection_response(index, group, text, cursor, limit, fields, normalize, paged):
+    records, next_cursor = index.select(group, text, cursor, limit)
+    categories = None
+    if normalize:
+        categories = {}
+        for record in records:
+            category = record.get('category')
+            if category:
+                categories.setdefault(category['id'], category)
+        records = [{key: value for key, value in record.items() if key != 'category'} for record in records]
+    if fields:
+        records = [{field: record.get(field) for field in fields} for record in records]
+    if not paged:
+        return records
+    response = {'items': records, 'nextCursor': next_cursor}
+    if categories is not None:
+        response['categories'] = sorted(categories.values(), key=lambda c: (c['order'], c['id']))
+    return response
+
+# --- END: Collection queries ---
+
+
+# --- Request bodies (size caps, chunked transfer-encoding, multipart uploads) ---
+
+# Size caps; configure_body_limits() overrides them from the command line
+MAX_JSON_BODY = 1024 * 1024
+MAX_UPLOAD_BODY = 10 * 1024 * 1024
+MAX_FORM_FIELD = 64 * 1024
+MAX_PART_HEADERS = 8 * 1024
+MAX_UPLOAD_FILES = 10
+BODY_CHUNK_SIZE = 64 * 1024
+UPLOAD_DIR = os.path.join(BASE_DIR, 'images')
+
+
+class BodyReader:
+    """File-like reader over a request body sent with Content-Length or chunked encoding.
+
+    A declared Content-Length over the cap is rejected before anything is read; chunked bodies
+    are rejected as soon as a chunk header pushes the total over the cap.
+    """
+
+    def __init__(self, rfile, headers, limit):
+        self.rfile = rfile
+        self.limit = limit
+        self.chunked = 'chunked' in headers.get('Transfer-Encoding', '').lower()
+        self.received = 0
+        # Bytes left in the body (Content-Length) or in the current chunk
+        self.remaining = 0
+        self.finished = False
+        if not self.chunked:
+            try:
+                length = int(headers.get('Content-Length') or 0)
+            except ValueError:
+                length = -1
+            if length < 0:
+                raise ValidationError("Некорректная длина тела запроса")
+            if length > limit:
+                raise RequestEntityTooLarge(length)
+            self.remaining = length
+            self.finished = not length
+
+    def read(self, size=-1):
+        """Read up to size bytes (the rest of the body if size < 0); b'' at the end"""
+        if size < 0:
+            return b''.join(iter(lambda: self.read(BODY_CHUNK_SIZE), b''))
+        if not self.remaining and not self.finished:
+            self._next_chunk()
+        if self.finished or not size:
+            return b''
+        data = self.rfile.read(min(size, self.remaining))
+        if not data:
+            raise ValidationError("Тело запроса оборвано")
+        self.remaining -= len(data)
+        if not self.remaining:
+            if not self.chunked:
+                self.finished = True
+            elif self.rfile.read(2) != b'\r\n':
+                raise ValidationError("Некорректное chunked-кодирование")
+        return data
+
+    def drain(self):
+        """Discard whatever is left of the body (still bounded by the cap)"""
+        while self.read(BODY_CHUNK_SIZE):
+            pass
+
+    def _next_chunk(self):
+        line = self.rfile.readline(MAX_PART_HEADERS)
+        try:
+            size = int(line.split(b';', 1)[0].strip(), 16)
+        except ValueError:
+            size = -1
+        if size < 0:
+            raise ValidationError("Некорректное chunked-кодирование")
+        if size == 0:
+            # Trailer fields are read and ignored
+            while self.rfile.readline(MAX_PART_HEADERS) not in (b'\r\n', b'\n', b''):
+                pass
+            self.finished = True
+            return
+        self.received += size
+        if self.received > self.limit:
+            raise RequestEntityTooLarge(self.received)
+        self.remaining = size
+
+
+def detect_image_extension(head):
+    """File extension for the image format recognised from its first bytes, or None"""
+    if head.startswith(b'\xff\xd8\xff'):
+        return '.jpg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return '.png'
+    if head.startswith((b'GIF87a', b'GIF89a')):
+        return '.gif'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return '.webp'
+    return None
+
+
+class MultipartParser:
+    """Incremental multipart/form-data parser.
+
+    Form fields are kept in memory (each capped at MAX_FORM_FIELD); files are streamed chunk by
+    chunk into a temporary file in upload_dir and renamed after the SHA-256 of their content.
+    Only images are accepted, recognised by their signature rather than the client's filename.
+    With upload_dir=None file parts are refused.
+    """
+
+    def __init__(self, body, boundary, upload_dir=UPLOAD_DIR):
+        self.body = body
+        self.delimiter = b'\r\n--' + boundary
+        self.upload_dir = upload_dir
+        self.buffer = b''
+        self.fields = {}
+        self.files = []
+        # Paths of the files this body added to upload_dir (not those already stored)
+        self.created = []
+
+    def parse(self):
+        """Consume the body; returns (fields, files) where files are dicts with the saved url"""
+        # Prefixing CRLF lets the first boundary be found like every other delimiter
+        self.buffer = b'\r\n'
+        self._stream_part(lambda data: None)
+        try:
+            while self._next_part():
+                headers = self._read_part_headers()
+                name = headers.get_param('name', header='content-disposition')
+                filename = headers.get_filename()
+                if not name:
+                    raise ValidationError("Некорректные данные формы")
+                if filename is None:
+                    self.fields[name] = self._read_field()
+                else:
+                    self._read_file(name, filename)
+            self.body.drain()
+        except Exception:
+            # A rejected request leaves no files behind
+            self.discard()
+            raise
+        return self.fields, self.files
+
+    def discard(self):
+        """Remove the files this body added, e.g. because the request they came with failed"""
+        for path in self.created:
+            with contextlib.suppress(OSError):
+                os.remove(path)
+        self.created = []
+
+    def _fill(self):
+        data = self.body.read(BODY_CHUNK_SIZE)
+        if not data:
+            raise ValidationError("Некорректные данные формы")
+        self.buffer += data
+
+    def _stream_part(self, write):
+        """Feed the current part's content to write() up to the next delimiter"""
+        keep = len(self.delimiter)
+        while True:
+            index = self.buffer.find(self.delimiter)
+            if index >= 0:
+                if index:
+                    write(self.buffer[:index])
+                self.buffer = self.buffer[index + keep:]
+                return
+            # The tail may be the start of a delimiter split across reads
+            if len(self.buffer) > keep:
+                write(self.buffer[:-keep])
+                self.buffer = self.buffer[-keep:]
+            self._fill()
+
+    def _next_part(self):
+        """Skip the rest of the boundary line; False after the closing boundary"""
+        while len(self.buffer) < 2:
+            self._fill()
+        if self.buffer.startswith(b'--'):
+            return False
+        while b'\r\n' not in self.buffer:
+            if len(self.buffer) > MAX_PART_HEADERS:
+                raise ValidationError("Некорректные данные формы")
+            self._fill()
+        self.buffer = self.buffer[self.buffer.index(b'\r\n') + 2:]
+        return True
+
+    def _read_part_headers(self):
+        while b'\r\n\r\n' not in self.buffer:
+            if len(self.buffer) > MAX_PART_HEADERS:
+                raise ValidationError("Некорректные данные формы")
+            self._fill()
+        raw, self.buffer = self.buffer.split(b'\r\n\r\n', 1)
+        return email.parser.BytesHeaderParser().parsebytes(raw + b'\r\n\r\n')
+
+    def _read_field(self):
+        value = bytearray()
+
+        def write(data):
+            if len(value) + len(data) > MAX_FORM_FIELD:
+                raise RequestEntityTooLarge(len(value) + len(data))
+            value.extend(data)
+
+        self._stream_part(write)
+        return value.decode('utf-8', 'replace')
+
+    def _read_file(self, field, filename):
+        if self.upload_dir is None:
+            raise ValidationError("Загрузка файлов здесь не поддерживается")
+        if len(self.files) >= MAX_UPLOAD_FILES:
+            raise ValidationError("Слишком много файлов")
+        digest = hashlib.sha256()
+        head = bytearray()
+        size = 0
+        fd, temp_path = tempfile.mkstemp(prefix='.upload-', dir=self.upload_dir)
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                def write(data):
+                    nonlocal size
+                    if len(head) < 16:
+                        head.extend(data[:16 - len(head)])
+                    digest.update(data)
+                    out.write(data)
+                    size += len(data)
+
+                self._stream_part(write)
+            if not size and not filename:
+                # An empty file input of a browser form
+                return
+            extension = detect_image_extension(bytes(head))
+            if extension is None:
+                raise ValidationError("Допустимы только изображения JPEG, PNG, GIF и WebP")
+            path = os.path.join(self.upload_dir, digest.hexdigest()[:32] + extension)
+            # Identical content is already stored under the same name
+            if not os.path.exists(path):
+                os.chmod(temp_path, 0o644)
+                os.replace(temp_path, path)
+                self.created.append(path)
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(temp_path)
+        self.files.append({
+            "field": field, "filename": filename, "size": size,
+            "url": '/' + os.path.relpath(path, BASE_DIR).replace(os.sep, '/'),
+        })
+
+
+def configure_body_limits(json_bytes=None, upload_bytes=None):
+    """Override the request body size caps (bytes)"""
+    global MAX_JSON_BODY, MAX_UPLOAD_BODY
+    if json_bytes is not None:
+        MAX_JSON_BODY = json_bytes
+    if upload_bytes is not None:
+        MAX_UPLOAD_BODY = upload_bytes
+
+# --- END: Request bodies ---
+
+
+# --- Menu import/export (CSV and JSON lines) ---
+
+# One row per dish; a row with only the category columns creates or reorders an empty category
+MENU_COLUMNS = ('articleCode', 'name', 'description', 'price', 'imageUrl', 'category', 'categoryOrder')
+MENU_CONTENT_TYPES = {'text/csv': 'csv', 'application/x-ndjson': 'jsonl', 'application/jsonl': 'jsonl'}
+MENU_MEDIA_TYPES = {'csv': 'text/csv; charset=utf-8', 'jsonl': 'application/x-ndjson; charset=utf-8'}
+# Request bodies that handlers read themselves (under the upload size cap) instead of as JSON
+STREAMED_BODY_TYPES = ('multipart/form-data',) + tuple(MENU_CONTENT_TYPES)
+MAX_IMPORT_ERRORS = 100
+EXPORT_BATCH_ROWS = 200
+
+MENU_EXPORT_SQL = '''
+    SELECT i."articleCode", i."name", i."description", i."price", i."imageUrl",
+           c."name" AS "category", c."order" AS "categoryOrder"
+    FROM "MenuCategory" c LEFT JOIN "MenuItem" i ON i."categoryId" = c."id"
+    ORDER BY c."order", c."id", i."name", i."id"
+'''
+
+
+def menu_format_for(path):
+    """'csv' or 'jsonl' from a file name"""
+    return 'jsonl' if path.lower().endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def iter_text_lines(read, chunk_size=BODY_CHUNK_SIZE):
+    """Decode a UTF-8 byte stream (BOM allowed) into lines without reading it all"""
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    pending = ''
+    while True:
+        data = read(chunk_size)
+        try:
+            text = decoder.decode(data, final=not data)
+        except UnicodeDecodeError:
+            raise ValidationError("Файл должен быть в кодировке UTF-8")
+        *lines, pending = (pending + text).split('\n')
+        for line in lines:
+            yield line + '\n'
+        if not data:
+            if pending:
+                yield pending
+            return
+
+
+class MenuImporter:
+    """Upserts streamed menu rows into MenuCategory and MenuItem on one connection.
+
+    Dishes are matched by articleCode (rows without one are always added), categories by
+    name. Errors are collected per line and the caller rolls the transaction back if any.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.spec = TABLES['items']
+        self.categories = {}
+        self.category_ids = set()
+        for row in conn.execute('SELECT "id", "name" FROM "MenuCategory"'):
+            self.categories.setdefault(row['name'].casefold(), row['id'])
+            self.category_ids.add(row['id'])
+        self.items = {}
+        self.ambiguous = set()
+        for row in conn.execute('SELECT "id", "articleCode" FROM "MenuItem" WHERE "articleCode" IS NOT NULL'):
+            if row['articleCode'] in self.items:
+                self.ambiguous.add(row['articleCode'])
+            self.items[row['articleCode']] = row['id']
+        self.reordered = set()
+        self.rows = 0
+        self.created = {"categories": 0, "items": 0}
+        self.updated = 0
+        self.errors = []
+        self.error_count = 0
+
+    def import_lines(self, lines, fmt):
+        if fmt == 'csv':
+            reader = csv.DictReader(lines)
+            if reader.fieldnames is not None and not {'name', 'category'} & set(reader.fieldnames):
+                raise ValidationError("В первой строке CSV должны быть названия колонок: " + ', '.join(MENU_COLUMNS))
+            for row in reader:
+                self.add(reader.line_num, row)
+            return
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            if isinstance(record, dict):
+                self.add(number, record)
+            else:
+                self.error(number, "Строка не является JSON-объектом")
+
+    def add(self, number, record):
+        self.rows += 1
+        try:
+            self._upsert(record)
+        except ValidationError as e:
+            self.error(number, str(e))
+
+    def error(self, number, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_IMPORT_ERRORS:
+            self.errors.append({"line": number, "message": message})
+
+    def summary(self, applied):
+        return {"rows": self.rows, "created": self.created, "updated": self.updated,
+                "errors": self.errors, "errorCount": self.error_count, "applied": applied}
+
+    def _upsert(self, record):
+        # Empty CSV cells mean "not given"
+        data = {key: value for key, value in record.items()
+                if key in MENU_COLUMNS + ('categoryId',) and value not in (None, '')}
+        category_id = self._category(data)
+        item = {column: data[column] for column in self.spec.columns if column in data}
+        if not item:
+            return
+        item['categoryId'] = category_id
+        code = item.get('articleCode')
+        if code is not None and code in self.ambiguous:
+            raise ValidationError(f'Артикул {code} встречается в меню несколько раз')
+        if code is not None and code in self.items:
+            values = self.spec.clean(item, partial=True)
+            assignments = ', '.join('"%s" = ?' % column for column in values)
+            self.conn.execute('UPDATE "MenuItem" SET %s WHERE "id" = ?' % assignments,
+                              list(values.values()) + [self.items[code]])
+            self.updated += 1
+            return
+        values = self.spec.clean(item)
+        record_id = new_id()
+        self.conn.execute(self.spec.insert_sql, [record_id] + [values.get(column) for column in self.spec.columns])
+        self.created['items'] += 1
+        if code is not None:
+            self.items[code] = record_id
+
+    def _category(self, data):
+        if 'categoryId' in data:
+            if data['categoryId'] not in self.category_ids:
+                raise ValidationError(f'Категория {data["categoryId"]} не найдена')
+            return data['categoryId']
+        name = as_text(data.get('category'))
+        if not name:
+            raise ValidationError('Поле category обязательно')
+        order = as_int(data['categoryOrder']) if 'categoryOrder' in data else None
+        key = name.casefold()
+        category_id = self.categories.get(key)
+        if category_id is None:
+            category_id = new_id()
+            self.conn.execute(TABLES['categories'].insert_sql, [category_id, name, order or 0])
+            self.categories[key] = category_id
+            self.category_ids.add(category_id)
+            self.created['categories'] += 1
+        elif order is not None and category_id not in self.reordered:
+            self.conn.execute('UPDATE "MenuCategory" SET "order" = ? WHERE "id" = ?', (order, category_id))
+        if order is not None:
+            self.reordered.add(category_id)
+        return category_id
+
+
+def import_menu(read, fmt, dry_run=False):
+    """Import a CSV/JSON-lines menu from read(size) in one transaction; returns the summary.
+
+    Nothing is written if any row is invalid (or with dry_run).
+    """
+    conn = database.connection()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        importer = MenuImporter(conn)
+        importer.import_lines(iter_text_lines(read), fmt)
+    except BaseException:
+        conn.rollback()
+        raise
+    applied = not importer.error_count and not dry_run
+    if applied:
+        conn.commit()
+    else:
+        conn.rollback()
+    return importer.summary(applied)
+
+
+def iter_menu_export(fmt):
+    """Yield the menu as CSV or JSON-lines text, EXPORT_BATCH_ROWS rows at a time"""
+    cursor = database.connection().execute(MENU_EXPORT_SQL)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == 'csv':
+        writer.writerow(MENU_COLUMNS)
+    while True:
+        rows = cursor.fetchmany(EXPORT_BATCH_ROWS)
+        if not rows:
+            break
+        for row in rows:
+            if fmt == 'csv':
+                writer.writerow(['' if value is None else value for value in row])
+            else:
+                record = {key: row[key] for key in MENU_COLUMNS if row[key] is not None}
+                buffer.write(json.dumps(record, ensure_ascii=False) + '\n')
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+# --- END: Menu import/export ---
+
+
+# --- Image derivatives (responsive sizes and WebP, generated in the background) ---
+
+try:
+    from PIL import Image
+except ImportError:
+    # Pillow is optional; without it the API lists the original images only
+    Image = None
+
+IMAGE_DERIVED_DIR = os.path.join(UPLOAD_DIR, 'derived')
+# Derivative name -> longest side in pixels
+IMAGE_SIZES = {'thumb': 160, 'card': 480, 'full': 1600}
+IMAGE_QUALITY = 82
+IMAGE_WORKERS = 2
+IMAGE_SOURCE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp')
+# Resources whose records get an "images" field next to imageUrl
+IMAGE_RESOURCES = ('items', 'staff', 'events')
+# Part of every derivative name: new settings produce new URLs
+IMAGE_SETTINGS_TAG = repr((sorted(IMAGE_SIZES.items()), IMAGE_QUALITY)).encode()
+# While a long queue (a startup scan) is worked off, finished images are published this often
+IMAGE_PUBLISH_INTERVAL = 5.0
+
+
+class ImagePipeline:
+    """Resized JPEG/PNG and WebP copies of the photos in images/.
+
+    Derivatives are named after a hash of the source content, so a URL never changes meaning
+    and can be cached forever. Hashing and rendering both happen in a small thread pool off the
+    request path; API records list the derivatives once every file exists. The cached responses
+    that embed them are invalidated once per batch of finished jobs (when the queue drains, or
+    every IMAGE_PUBLISH_INTERVAL during a long one). Processes of a pre-fork server share the
+    results through disk.
+    """
+
+    def __init__(self, source_dir, derived_dir, workers=IMAGE_WORKERS):
+        self.source_dir = source_dir
+        self.derived_dir = derived_dir
+        self.url_prefix = '/' + os.path.relpath(derived_dir, BASE_DIR).replace(os.sep, '/') + '/'
+        self.workers = workers
+        self._keys = {}
+        self._ready = {}
+        # Sources Pillow could not decode are not retried until their content changes
+        self._failed = set()
+        self._pending = set()
+        # Images made ready since the cached responses were last invalidated
+        self._unpublished = False
+        self._published_at = time.monotonic()
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def source_path(self, url):
+        """Filesystem path of a local image URL directly under source_dir, or None"""
+        if not url or not url.startswith('/'):
+            return None
+        path = os.path.normpath(os.path.join(BASE_DIR, unquote(urlparse(url).path).lstrip('/')))
+        if os.path.dirname(path) != self.source_dir or not path.lower().endswith(IMAGE_SOURCE_EXTENSIONS):
+            return None
+        return path
+
+    def variants(self, url):
+        """{size: {"src": url, "webp": url}} for an image URL, or None until they are generated.
+
+        Only a stat happens here: a source that is new or changed is queued, and the worker
+        hashes it and renders (or finds) its derivatives.
+        """
+        if Image is None:
+            return None
+        path = self.source_path(url)
+        if path is None:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        cached = self._keys.get(path)
+        if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            key = cached[2]
+            if key in self._ready or key in self._failed:
+                return self._ready.get(key)
+        self.submit(path)
+        return None
+
+    def annotate(self, records):
+        """Add an "images" field to records whose imageUrl has derivatives"""
+        for record in records:
+            images = self.variants(record.get('imageUrl'))
+            if images is not None:
+                record['images'] = images
+        return records
+
+    def scan(self):
+        """Queue every source image that still lacks derivatives"""
+        if Image is None or not os.path.isdir(self.source_dir):
+            return 0
+        count = 0
+        for entry in os.scandir(self.source_dir):
+            if not entry.is_file() or not entry.name.lower().endswith(IMAGE_SOURCE_EXTENSIONS):
+                continue
+            url = '/' + os.path.relpath(entry.path, BASE_DIR).replace(os.sep, '/')
+            if self.variants(url) is None:
+                count += 1
+        return count
+
+    def submit(self, path):
+        with self._lock:
+            if path in self._pending:
+                return
+            self._pending.add(path)
+            # Lazily, for the same reason as SelectorThread.hand_over()
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bardabar-images')
+            self._pool.submit(self._generate, path)
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _key(self, path):
+        stat = os.stat(path)
+        cached = self._keys.get(path)
+        if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            return cached[2]
+        digest = hashlib.sha256(IMAGE_SETTINGS_TAG)
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(BODY_CHUNK_SIZE), b''):
+                digest.update(block)
+        key = digest.hexdigest()[:32]
+        self._keys[path] = (stat.st_mtime_ns, stat.st_size, key)
+        return key
+
+    @staticmethod
+    def _names(path, key):
+        # JPEG stays JPEG; other formats may carry transparency and fall back to PNG
+        fallback = '.jpg' if path.lower().endswith(('.jpg', '.jpeg')) else '.png'
+        return {size: {"src": f'{key}-{size}{fallback}', "webp": f'{key}-{size}.webp'} for size in IMAGE_SIZES}
+
+    def _generate(self, path):
+        ready = False
+        try:
+            ready = self._prepare(path)
+        except Exception as e:
+            print(f"Не удалось обработать изображение {os.path.relpath(path, BASE_DIR)}: {e}")
+        finally:
+            self._finish(path, ready)
+
+    def _prepare(self, path):
+        """Hash the source and render what is missing; True if it has just become ready"""
+        key = self._key(path)
+        if key in self._ready or key in self._failed:
+            return False
+        names = self._names(path, key)
+        if not all(os.path.exists(os.path.join(self.derived_dir, name))
+                   for formats in names.values() for name in formats.values()):
+            try:
+                self._render(path, names)
+            except Exception:
+                self._failed.add(key)
+                raise
+        self._ready[key] = {size: {fmt: self.url_prefix + name for fmt, name in formats.items()}
+                            for size, formats in names.items()}
+        return True
+
+    def _render(self, path, names):
+        os.makedirs(self.derived_dir, exist_ok=True)
+        with Image.open(path) as source:
+            # Animated images contribute their first frame
+            source = source.convert('RGB' if names['thumb']['src'].endswith('.jpg') else 'RGBA')
+        for size, longest in IMAGE_SIZES.items():
+            image = source.copy()
+            image.thumbnail((longest, longest), Image.LANCZOS)
+            for name in names[size].values():
+                self._save(image, name)
+
+    def _finish(self, path, ready):
+        with self._lock:
+            self._pending.discard(path)
+            self._unpublished = self._unpublished or ready
+            now = time.monotonic()
+            publish = self._unpublished and (not self._pending or now >= self._published_at + IMAGE_PUBLISH_INTERVAL)
+            if publish:
+                self._unpublished = False
+                self._published_at = now
+        if publish:
+            # One rebuild (and one SSE "change" per resource) for the whole batch
+            response_cache.invalidate(*IMAGE_RESOURCES)
+
+    def _save(self, image, name):
+        target = os.path.join(self.derived_dir, name)
+        if os.path.exists(target):
+            return
+        fd, temp_path = tempfile.mkstemp(prefix='.image-', dir=self.derived_dir)
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                if name.endswith('.webp'):
+                    image.save(out, 'WEBP', quality=IMAGE_QUALITY, method=4)
+                elif name.endswith('.jpg'):
+                    image.save(out, 'JPEG', quality=IMAGE_QUALITY, optimize=True, progressive=True)
+                else:
+                    image.save(out, 'PNG', optimize=True)
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, target)
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(temp_path)
+
+
+image_pipeline = ImagePipeline(UPLOAD_DIR, IMAGE_DERIVED_DIR)
+
+# --- END: Image derivatives ---
+
+
+# --- Static asset engine ---
+
+# Directories scanned at startup; other files are loaded on first request
+STATIC_PRELOAD_DIRS = ('', 'css', 'js', 'images', 'admin')
+# Never served: server-side data and configuration
+STATIC_HIDDEN_DIRS = ('prisma',)
+STATIC_MEMORY_LIMIT = 256 * 1024
+STATIC_MEMORY_BUDGET = 64 * 1024 * 1024
+STATIC_RECHECK_INTERVAL = 2.0
+STATIC_COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json',
+                             'application/xml', 'image/svg+xml')
+STATIC_MAX_AGE = 24 * 60 * 60
+STATIC_IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+# Uploads and image derivatives are named after a hash of their content
+CONTENT_ADDRESSED_NAME = re.compile(r'^[0-9a-f]{32}(-\w+)?\.\w+$')
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class StaticAsset:
+    """One file of the site: metadata, validators and (for small files) its encoded variants"""
+    __slots__ = ('path', 'size', 'mtime_ns', 'content_type', 'etag', 'last_modified',
+                 'variants', 'checked')
+
+    def __init__(self, path, stat, content_type):
+        self.path = path
+        self.size = stat.st_size
+        self.mtime_ns = stat.st_mtime_ns
+        self.content_type = content_type
+        self.etag = '"%x-%x"' % (stat.st_mtime_ns, stat.st_size)
+        self.last_modified = email.utils.formatdate(stat.st_mtime, usegmt=True)
+        # encoding ('identity', 'gzip', 'br') -> bytes; empty for files streamed from disk
+        self.variants = {}
+        self.checked = time.monotonic()
+
+    @property
+    def in_memory(self):
+        return 'identity' in self.variants
+
+    def variant_etag(self, encoding):
+        return self.etag if encoding == 'identity' else '%s-%s"' % (self.etag[:-1], encoding)
+
+
+class StaticAssets:
+    """In-memory index of static files with precompressed variants, refreshed by mtime checks"""
+
+    def __init__(self, root):
+        self.root = root
+        self._assets = {}
+        self._memory_used = 0
+        self._lock = threading.Lock()
+
+    def preload(self):
+        count = 0
+        for directory in STATIC_PRELOAD_DIRS:
+            base = os.path.join(self.root, directory)
+            if not os.path.isdir(base):
+                continue
+            for entry in os.scandir(base):
+                if entry.is_file() and self.get(entry.path) is not None:
+                    count += 1
+        return count
+
+    def is_hidden(self, path):
+        relative = os.path.relpath(path, self.root)
+        if relative == '.':
+            return False
+        parts = relative.split(os.sep)
+        return (relative.startswith('..') or any(part.startswith('.') for part in parts)
+                or parts[0] in STATIC_HIDDEN_DIRS)
+
+    def get(self, path):
+        """Current asset for a filesystem path, or None if it is missing or hidden"""
+        asset = self._assets.get(path)
+        now = time.monotonic()
+        if asset is not None and now - asset.checked < STATIC_RECHECK_INTERVAL:
+            return asset
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self._forget(path)
+            return None
+        if asset is not None and asset.mtime_ns == stat.st_mtime_ns and asset.size == stat.st_size:
+            asset.checked = now
+            return asset
+        if not os.path.isfile(path) or self.is_hidden(path):
+            return None
+        return self._load(path, stat)
+
+    def _load(self, path, stat):
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        asset = StaticAsset(path, stat, content_type)
+        if stat.st_size <= STATIC_MEMORY_LIMIT and self._memory_used + stat.st_size <= STATIC_MEMORY_BUDGET:
+            with open(path, 'rb') as f:
+                body = f.read()
+            asset.variants['identity'] = body
+            if content_type.startswith(STATIC_COMPRESSIBLE_TYPES) and len(body) > 256:
+                compressed = gzip.compress(body, compresslevel=9, mtime=0)
+                if len(compressed) < len(body) * 0.9:
+                    asset.variants['gzip'] = compressed
+                if brotli is not None:
+                    compressed = brotli.compress(body, quality=11)
+                    if len(compressed) < len(body) * 0.9:
+                        asset.variants['br'] = compressed
+        with self._lock:
+            previous = self._assets.get(path)
+            self._memory_used += sum(len(v) for v in asset.variants.values())
+            if previous is not None:
+                self._memory_used -= sum(len(v) for v in previous.variants.values())
+            self._assets[path] = asset
+        return asset
+
+    def _forget(self, path):
+        with self._lock:
+            previous = self._assets.pop(path, None)
+            if previous is not None:
+                self._memory_used -= sum(len(v) for v in previous.variants.values())
+
+
+def choose_encoding(accept_encoding, available):
+    """Pick the best precompressed variant allowed by an Accept-Encoding header"""
+    if len(available) == 1 or not accept_encoding:
+        return 'identity'
+    accepted = {}
+    for part in accept_encoding.split(','):
+        coding, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    for encoding in ('br', 'gzip'):
+        if encoding in available and accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return 'identity'
+
+
+def static_cache_control(path):
+    if path.endswith('.html'):
+        # Pages must pick up new asset links right away
+        return 'no-cache'
+    if CONTENT_ADDRESSED_NAME.match(os.path.basename(path)):
+        # New content always gets a new URL
+        return f'public, max-age={STATIC_IMMUTABLE_MAX_AGE}, immutable'
+    return f'public, max-age={STATIC_MAX_AGE}'
+
+
+static_assets = StaticAssets(BASE_DIR)
+
+# --- END: Static asset engine ---
+
+
+# --- Request metrics ---
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RouteStats:
+    __slots__ = ('requests', 'statuses', 'bytes_sent', 'buckets', 'latency_sum')
+
+    def __init__(self):
+        self.requests = 0
+        self.statuses = {}
+        self.bytes_sent = 0
+        # One slot per bucket plus the +Inf overflow
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+
+    def percentile(self, q):
+        """Estimate a latency quantile (seconds) by interpolating inside its bucket"""
+        if not self.requests:
+            return 0.0
+        rank = q * self.requests
+        cumulative = 0
+        lower = 0.0
+        for bound, count in zip(LATENCY_BUCKETS, self.buckets):
+            if count and cumulative + count >= rank:
+                return lower + (bound - lower) * (rank - cumulative) / count
+            cumulative += count
+            lower = bound
+        return LATENCY_BUCKETS[-1]
+
+
+class Metrics:
+    """Per-route request counters and latency histograms, cheap enough to leave on"""
+
+    def __init__(self):
+        self._routes = {}
+        # kind ('api' or 'static') -> [hits, misses]
+        self._cache = {'api': [0, 0], 'static': [0, 0]}
+        self._lock = threading.Lock()
+        self.started = time.time()
+
+    def observe(self, route, status, bytes_sent, latency, cache_hit=None):
+        bucket = bisect.bisect_left(LATENCY_BUCKETS, latency)
+        with self._lock:
+            stats = self._routes.get(route)
+            if stats is None:
+                stats = self._routes[route] = RouteStats()
+            stats.requests += 1
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+            stats.bytes_sent += bytes_sent
+            stats.buckets[bucket] += 1
+            stats.latency_sum += latency
+            if cache_hit is not None:
+                self._cache['static' if route == 'static' else 'api'][0 if cache_hit else 1] += 1
+
+    def snapshot(self):
+        with self._lock:
+            routes = {}
+            for route, stats in sorted(self._routes.items()):
+                routes[route] = {
+                    'requests': stats.requests,
+                    'statuses': {str(code): count for code, count in sorted(stats.statuses.items())},
+                    'bytesSent': stats.bytes_sent,
+                    'latencyMs': {
+                        'avg': round(stats.latency_sum / stats.requests * 1000, 3),
+                        'p50': round(stats.percentile(0.50) * 1000, 3),
+                        'p95': round(stats.percentile(0.95) * 1000, 3),
+                        'p99': round(stats.percentile(0.99) * 1000, 3),
+                    },
+                }
+            cache = {}
+            for kind, (hits, misses) in self._cache.items():
+                total = hits + misses
+                cache[kind] = {'hits': hits, 'misses': misses,
+                               'hitRatio': round(hits / total, 4) if total else None}
+        return {'uptimeSeconds': round(time.time() - self.started, 1), 'pid': os.getpid(),
+                'routes': routes, 'cache': cache}
+
+    def prometheus(self):
+        """Render the metrics in the Prometheus text exposition format"""
+        lines = [
+            '# HELP bardabar_http_requests_total HTTP requests by route and status.',
+            '# TYPE bardabar_http_requests_total counter',
+        ]
+        with self._lock:
+            routes = sorted(self._routes.items())
+            for route, stats in routes:
+                for status, count in sorted(stats.statuses.items()):
+                    lines.append(f'bardabar_http_requests_total{{route="{route}",status="{status}"}} {count}')
+            lines += [
+                '# HELP bardabar_http_response_bytes_total Response body bytes by route.',
+                '# TYPE bardabar_http_response_bytes_total counter',
+            ]
+            for route, stats in routes:
+                lines.append(f'bardabar_http_response_bytes_total{{route="{route}"}} {stats.bytes_sent}')
+            lines += [
+                '# HELP bardabar_http_request_duration_seconds Request latency by route.',
+                '# TYPE bardabar_http_request_duration_seconds histogram',
+            ]
+            for route, stats in routes:
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), stats.buckets):
+                    cumulative += count
+                    lines.append(f'bardabar_http_request_duration_seconds_bucket{{route="{route}",le="{bound}"}} {cumulative}')
+                lines.append(f'bardabar_http_request_duration_seconds_sum{{route="{route}"}} {stats.latency_sum:.6f}')
+                lines.append(f'bardabar_http_request_duration_seconds_count{{route="{route}"}} {stats.requests}')
+            lines += [
+                '# HELP bardabar_cache_requests_total Cache lookups for API and static responses.',
+                '# TYPE bardabar_cache_requests_total counter',
+            ]
+            for kind, (hits, misses) in sorted(self._cache.items()):
+                lines.append(f'bardabar_cache_requests_total{{kind="{kind}",result="hit"}} {hits}')
+                lines.append(f'bardabar_cache_requests_total{{kind="{kind}",result="miss"}} {misses}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+# --- END: Request metrics ---
+
+
+# --- Server-Sent Events (/api/stream) ---
+
+# Resources a public stream may subscribe to (contacts are admin-only data)
+STREAM_RESOURCES = ('items', 'categories', 'events', 'news', 'staff', 'about')
+# Changes made by other worker processes are noticed within this many seconds
+STREAM_POLL_INTERVAL = 0.5
+STREAM_HEARTBEAT_INTERVAL = 15.0
+STREAM_RETRY_MS = 3000
+STREAM_MAX_CLIENTS = 1000
+# A subscriber that falls this far behind is disconnected (it reconnects and resynchronises)
+STREAM_MAX_BACKLOG = 64 * 1024
+
+
+def format_event(event, payload):
+    return f'event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n'.encode('utf-8')
+
+
+class _StreamClient:
+    __slots__ = ('sock', 'resources', 'versions', 'pending')
+
+    def __init__(self, sock, resources, versions):
+        self.sock = sock
+        self.resources = resources
+        self.versions = versions
+        self.pending = b''
+
+
+class EventStream(SelectorThread):
+    """All open /api/stream connections of a process, served by a single selector thread.
+
+    A handler sends the SSE headers and the current versions, then hands its socket over, so
+    an idle subscriber costs a file descriptor instead of a worker thread. The thread polls
+    the response cache versions (shared between pre-fork workers) and is woken right away by
+    mutations made in its own process; every bump becomes a "change" event.
+    """
+    name = 'bardabar-stream'
+
+    def __init__(self):
+        super().__init__()
+        self._clients = {}
+        self._versions = {}
+        self._heartbeat_at = None
+
+    def __len__(self):
+        return len(self._clients) + len(self._incoming)
+
+    def snapshot(self, resources):
+        return {resource: response_cache.version(resource) for resource in resources}
+
+    def add(self, sock, resources, versions):
+        """Adopt a socket whose response headers and initial versions have been sent"""
+        if not self.hand_over(_StreamClient(sock, resources, versions)):
+            sock.close()
+
+    def notify(self):
+        """Check the resource versions now instead of at the next poll"""
+        self.wake()
+
+    def _prepare(self):
+        self._versions = self.snapshot(STREAM_RESOURCES)
+        self._heartbeat_at = time.monotonic() + STREAM_HEARTBEAT_INTERVAL
+
+    def _timeout(self):
+        return STREAM_POLL_INTERVAL
+
+    def _ready(self, key, mask):
+        if mask & selectors.EVENT_READ:
+            self._read(key.data)
+        elif mask & selectors.EVENT_WRITE:
+            self._flush(key.data)
+
+    def _tick(self):
+        self._publish_changes()
+        if time.monotonic() >= self._heartbeat_at:
+            # Keeps proxies from timing out idle streams and finds dead subscribers
+            self._broadcast(STREAM_RESOURCES, b': ping\n\n')
+            self._heartbeat_at = time.monotonic() + STREAM_HEARTBEAT_INTERVAL
+
+    def _release(self, incoming):
+        for client in list(self._clients.values()):
+            self._drop(client)
+        for client in incoming:
+            client.sock.close()
+
+    def _adopt(self, incoming):
+        for client in incoming:
+            client.sock.setblocking(False)
+            self._clients[client.sock.fileno()] = client
+            self._selector.register(client.sock, selectors.EVENT_READ, client)
+            # Changes published between the handler's snapshot and now
+            for resource in client.resources:
+                if client.versions[resource] != self._versions[resource]:
+                    self._send(client, format_event('change', {
+                        "resource": resource, "version": self._versions[resource]}))
+
+    def _publish_changes(self):
+        for resource in STREAM_RESOURCES:
+            version = response_cache.version(resource)
+            if version != self._versions[resource]:
+                self._versions[resource] = version
+                self._broadcast((resource,), format_event('change', {"resource": resource, "version": version}))
+
+    def _broadcast(self, resources, message):
+        for client in list(self._clients.values()):
+            if any(resource in client.resources for resource in resources):
+                self._send(client, message)
+
+    def _send(self, client, message):
+        client.pending += message
+        if len(client.pending) > STREAM_MAX_BACKLOG:
+            self._drop(client)
+        else:
+            self._flush(client)
+
+    def _flush(self, client):
+        try:
+            sent = client.sock.send(client.pending)
+        except BlockingIOError:
+            sent = 0
+        except OSError:
+            self._drop(client)
+            return
+        client.pending = client.pending[sent:]
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if client.pending else 0)
+        self._selector.modify(client.sock, events, client)
+
+    def _read(self, client):
+        # Subscribers never send anything; readable means closed (or misbehaving)
+        try:
+            data = client.sock.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self._drop(client)
+
+    def _drop(self, client):
+        if self._clients.pop(client.sock.fileno(), None) is not None:
+            self._selector.unregister(client.sock)
+        client.sock.close()
+
+
+event_stream = EventStream()
+
+# --- END: Server-Sent Events ---
+
+
+# --- Router ---
+
+class _RouteNode:
+    __slots__ = ('children', 'param', 'param_node', 'methods')
+
+    def __init__(self):
+        self.children = {}
+        self.param = None
+        self.param_node = None
+        self.methods = {}
+
+
+class Router:
+    """Dispatch table: exact paths in a dict, parameterized paths (/api/items/<id>) in a segment trie"""
+
+    def __init__(self):
+        self._exact = {}
+        self._root = _RouteNode()
+
+    def add(self, method, pattern, handler, **kwargs):
+        """Register handler (a BardabarHandler method name) with fixed keyword arguments"""
+        if '<' not in pattern:
+            self._exact.setdefault(pattern, {})[method] = (handler, kwargs, pattern)
+            return
+        node = self._root
+        for segment in pattern.strip('/').split('/'):
+            if segment.startswith('<') and segment.endswith('>'):
+                if node.param_node is None:
+                    node.param, node.param_node = segment[1:-1], _RouteNode()
+                node = node.param_node
+            else:
+                node = node.children.setdefault(segment, _RouteNode())
+        node.methods[method] = (handler, kwargs, pattern)
+
+    def resolve(self, method, path):
+        """Return (handler, kwargs, pattern, allowed_methods); handler is None on 404 (no allowed) or 405"""
+        methods = self._exact.get(path)
+        params = {}
+        if methods is None:
+            methods = self._match(path, params)
+        if not methods:
+            return None, None, None, ()
+        route = methods.get(method)
+        if route is None:
+            return None, None, None, tuple(methods)
+        handler, kwargs, pattern = route
+        return handler, dict(kwargs, **params) if params else kwargs, pattern, tuple(methods)
+
+    def _match(self, path, params):
+        node = self._root
+        for segment in path.strip('/').split('/'):
+            child = node.children.get(segment)
+            if child is None:
+                if node.param_node is None or not segment:
+                    return None
+                params[node.param] = unquote(segment)
+                child = node.param_node
+            node = child
+        return node.methods
+
+
+# GET endpoints served from the response cache: path -> (resource, loader)
+READ_ROUTES = {
+    '/api/items': ('items', load_menu_items),
+    '/api/menu/categories': ('categories', load_menu_categories),
+    '/api/events': ('events', load_events),
+    '/api/news': ('news', load_news),
+    '/api/staff': ('staff', load_staff),
+    '/api/about': ('about', load_about),
+}
+
+# Admin-editable resources: API prefix -> (resource, success message per method)
+MUTATION_ROUTES = {
+    '/api/menu/categories': ('categories', {
+        'POST': "Категория сохранена", 'PUT': "Категория обновлена", 'DELETE': "Категория удалена"}),
+    '/api/items': ('items', {
+        'POST': "Блюдо сохранено", 'PUT': "Блюдо обновлено", 'DELETE': "Блюдо удалено"}),
+    '/api/events': ('events', {
+        'POST': "Мероприятие сохранено", 'PUT': "Мероприятие обновлено", 'DELETE': "Мероприятие удалено"}),
+    '/api/news': ('news', {
+        'POST': "Новость сохранена", 'PUT': "Новость обновлена", 'DELETE': "Новость удалена"}),
+    '/api/contacts': ('contacts', {
+        'POST': "Заявка отправлена", 'DELETE': "Заявка удалена"}),
+    '/api/staff': ('staff', {
+        'POST': "Сотрудник сохранён", 'PUT': "Сотрудник обновлён", 'DELETE': "Сотрудник удалён"}),
+    '/api/about': ('about', {
+        'PUT': "Информация обновлена"}),
+}
+
+# Mutations anyone may perform (заявки может оставить любой посетитель)
+PUBLIC_MUTATIONS = {('contacts', 'POST')}
+
+# Request paths served as another static file
+STATIC_ALIASES = {
+    '/': '/index.html',
+    '/admin': '/admin/index.html',
+    '/admin/': '/admin/index.html',
+}
+
+
+def build_router():
+    router = Router()
+    router.add('GET', '/api/admin/status', 'handle_admin_status')
+    router.add('POST', '/api/admin/login', 'handle_login')
+    router.add('POST', '/api/admin/logout', 'handle_logout')
+    router.add('GET', '/api/contacts', 'handle_list_contacts')
+    router.add('GET', '/api/admin/metrics', 'handle_metrics')
+    router.add('POST', '/api/uploads', 'handle_upload')
+    router.add('GET', '/api/stream', 'handle_stream')
+    router.add('POST', '/api/admin/reload', 'handle_reload')
+    router.add('POST', '/api/menu/import', 'handle_menu_import')
+    router.add('GET', '/api/menu/export', 'handle_menu_export')
+    for path, (resource, build) in READ_ROUTES.items():
+        router.add('GET', path, 'handle_cached', resource=resource, build=build)
+    for prefix, (resource, messages) in MUTATION_ROUTES.items():
+        for method, message in messages.items():
+            options = dict(resource=resource, prefix=prefix, message=message)
+            router.add(method, prefix, 'handle_mutation', **options)
+            if method != 'POST' and resource != 'about':
+                router.add(method, prefix + '/<record_id>', 'handle_mutation', **options)
+    # Остальные POST-запросы (например, форма бронирования на главной странице)
+    router.add('POST', '/', 'handle_form')
+    return router
+
+
+router = build_router()
+
+# --- END: Router ---
+
+
+# --- Content reload ---
+
+# Seconds between checks of the database files for changes made outside this server (0 disables)
+CONTENT_WATCH_INTERVAL = 2.0
+# Cached resources and their loaders (contacts are listed uncached, straight from the database)
+CONTENT_LOADERS = dict(READ_ROUTES.values())
+
+
+class ContentReloader:
+    """Rebuilds the cached API responses from the database, off the request path.
+
+    A reload reads every resource inside one read transaction, so the snapshot is consistent
+    (menu items always match their categories), serializes it in the reloader thread and then
+    swaps the bodies into the response cache; until the swap requests keep getting the previous
+    snapshot. It runs once when the server starts (warming the cache), on SIGHUP, on
+    POST /api/admin/reload and when the database files change behind the server's back.
+    Sessions and connections are not touched.
+    """
+
+    def __init__(self, watch_interval=CONTENT_WATCH_INTERVAL):
+        self.watch_interval = watch_interval
+        self.last_reload = None
+        self._requested = threading.Event()
+        self._done = threading.Condition()
+        self._started = 0
+        self._finished = 0
+        self._thread = None
+        self._stopping = False
+        self._db_stat = None
+
+    def start(self):
+        """Start the reloader thread; its first reload warms the cache"""
+        with self._done:
+            if self._thread is not None:
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='bardabar-reload', daemon=True)
+            self._thread.start()
+        self.request()
+
+    def request(self):
+        """Ask for a reload; returns a ticket for wait()"""
+        with self._done:
+            ticket = self._started + 1
+        self._requested.set()
+        return ticket
+
+    def wait(self, ticket, timeout=None):
+        """True once the reload that covers the ticket has finished"""
+        with self._done:
+            return self._done.wait_for(lambda: self._finished >= ticket, timeout)
+
+    def close(self):
+        with self._done:
+            thread, self._thread = self._thread, None
+            self._stopping = True
+        self._requested.set()
+        if thread is not None:
+            thread.join(SHUTDOWN_TIMEOUT)
+
+    def reload(self):
+        """Build a new snapshot and swap it in; returns a summary for the admin endpoint"""
+        started = time.perf_counter()
+        versions = {resource: response_cache.version(resource) for resource in CACHE_RESOURCES}
+        conn = database.connection()
+        # One read transaction: every resource comes from the same database state
+        conn.execute('BEGIN')
+        try:
+            snapshot = {resource: load() for resource, load in CONTENT_LOADERS.items()}
+        finally:
+            conn.rollback()
+        bodies = {resource: json.dumps(data, ensure_ascii=False).encode('utf-8')
+                  for resource, data in snapshot.items()}
+        changed = response_cache.replace(bodies, versions)
+        if changed:
+            event_stream.notify()
+        return {"resources": changed, "durationMs": round((time.perf_counter() - started) * 1000, 1)}
+
+    def _run(self):
+        while True:
+            requested = self._requested.wait(self.watch_interval or None)
+            with self._done:
+                if self._stopping:
+                    return
+                self._requested.clear()
+                if not requested and not self._database_changed():
+                    continue
+                self._started += 1
+            try:
+                self.last_reload = self.reload()
+            except Exception as e:
+                # The thread must survive: waiters and the watch depend on it
+                print(f"Не удалось перезагрузить контент: {e}")
+                if not isinstance(e, sqlite3.Error):
+                    traceback.print_exc()
+                self.last_reload = {"error": str(e) or type(e).__name__}
+            finally:
+                # The database state the reload has already seen
+                self._database_changed()
+            with self._done:
+                self._finished = self._started
+                self._done.notify_all()
+
+    def _database_changed(self):
+        """True if the database files changed since the last check.
+
+        The server's own writes (and WAL checkpoints) count too: telling them apart from an
+        edit by another program made in the same window is not possible from the file stat,
+        and a reload that finds nothing new costs one read transaction.
+        """
+        stat = []
+        for path in (DATABASE_PATH, DATABASE_PATH + '-wal'):
+            try:
+                info = os.stat(path)
+                stat.append((info.st_mtime_ns, info.st_size))
+            except OSError:
+                stat.append(None)
+        previous, self._db_stat = self._db_stat, stat
+        return previous is not None and stat != previous
+
+
+content_reloader = ContentReloader()
+
+
+def _request_content_reload(signum, frame):
+    content_reloader.request()
+
+# --- END: Content reload ---
+
 
 class BardabarHandler(http.server.SimpleHTTPRequestHandler):
+    # HTTP/1.1 enables keep-alive; every response must therefore carry Content-Length
+    protocol_version = 'HTTP/1.1'
+    # Idle keep-alive connections are dropped after this many seconds
+    timeout = KEEPALIVE_TIMEOUT
+    # Headers and body are separate writes; Nagle + delayed ACK would stall keep-alive by ~40 ms
+    disable_nagle_algorithm = True
+
     def __init__(self, *args, **kwargs):
-        super().__init__(*args, directory=os.path.dirname(os.path.abspath(__file__)), **kwargs)
+        super().__init__(*args, directory=BASE_DIR, **kwargs)
+
+    def handle_one_request(self):
+        # Per-request instrumentation; the fields are filled in while the response is sent
+        started = time.perf_counter()
+        self.metrics_route = 'unmatched'
+        self.metrics_status = None
+        self.metrics_bytes = 0
+        self.metrics_cache = None
+        self.body = None
+        self.form = None
+        super().handle_one_request()
+        if self.metrics_status is not None:
+            metrics.observe(
+                self.metrics_route, self.metrics_status,
+                0 if self.command == 'HEAD' else self.metrics_bytes,
+                time.perf_counter() - started, self.metrics_cache)
+
+    def handle(self):
+        """Serve requests on the connection until it closes or, on a pool server, goes idle"""
+        self.parked = False
+        self.handle_one_request()
+        while not self.close_connection:
+            if getattr(self.server, 'parks_idle_connections', False) and not self.request_waiting():
+                # Release the worker; the server resumes the connection once it is readable
+                self.parked = not self.close_connection
+                return
+            self.handle_one_request()
+
+    def request_waiting(self):
+        """True if the next request has (partly) arrived already; never waits for it"""
+        self.connection.settimeout(0)
+        try:
+            return bool(self.rfile.peek(1))
+        except OSError:
+            self.close_connection = True
+            return False
+        finally:
+            self.connection.settimeout(self.timeout)
+
+    def log_request(self, code='-', size='-'):
+        if isinstance(code, int):
+            self.metrics_status = int(code)
+        super().log_request(code, size)
+
+    def send_header(self, keyword, value):
+        if keyword == 'Content-Length':
+            self.metrics_bytes = int(value)
+        super().send_header(keyword, value)
     
     def end_headers(self):
+        # Single-threaded servers and draining servers must not hold connections open
+        server = self.server
+        if not self.close_connection and (not getattr(server, 'keep_alive', False) or getattr(server, 'draining', False)
+                                          or self.body_pending()):
+            self.send_header('Connection', 'close')
         # Add CORS headers
         self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Access-Control-Allow-Methods', 'GET, POST, PUT, DELETE, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, X-HTTP-Method-Override')
         self.send_header('Access-Control-Allow-Credentials', 'true')
         super().end_headers()
     
@@ -43,381 +2219,851 @@ class BardabarHandler(http.server.SimpleHTTPRequestHandler):
     def is_admin_session(self):
         cookies = self.parse_cookies()
         session = cookies.get(SESSION_COOKIE_NAME)
-        return session in sessions
+        return sessions.validate(session)
+
+    def require_admin(self):
+        """True for admin sessions; otherwise answers 401 and returns False"""
+        if self.is_admin_session():
+            return True
+        self.send_json({"status": "error", "message": "Требуется авторизация"}, status=401)
+        return False
     
+    def send_json(self, payload, status=200, headers=None):
+        """Send a JSON response with an explicit Content-Length (required for keep-alive)"""
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_cached_json(self, resource, build):
+        """Serve a cached API resource, answering If-None-Match revalidation with 304"""
+        entry, self.metrics_cache = response_cache.get(resource, build)
+        self.send_cached_entry(entry)
+
+    def send_cached_entry(self, entry):
+        if self.etag_matches(entry.etag):
+            self.send_response(304)
+            self.send_header('ETag', entry.etag)
+            self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(entry.body)))
+        self.send_header('ETag', entry.etag)
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(entry.body)
+
+    def etag_matches(self, etag):
+        if_none_match = self.headers.get('If-None-Match')
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == '*':
+            return True
+        # Weak comparison, as required for If-None-Match
+        candidates = (tag.strip() for tag in if_none_match.split(','))
+        return etag in (tag[2:] if tag.startswith('W/') else tag for tag in candidates)
+
+    def send_mutation_success(self, prefix, message, record=None):
+        """Acknowledge an admin mutation and drop the cached responses it affects"""
+        response_cache.invalidate(*MUTATION_INVALIDATES.get(prefix, ()))
+        event_stream.notify()
+        response = {"status": "success", "message": message}
+        if record is not None:
+            response["data"] = record
+        self.send_json(response)
+
+    def send_too_large(self):
+        # The rest of the body is never read, so the connection cannot be reused
+        self.send_json({"status": "error", "message": "Слишком большой запрос"}, status=413,
+                       headers={'Connection': 'close'})
+
     def do_OPTIONS(self):
         self.send_response(200)
+        self.send_header('Content-Length', '0')
         self.end_headers()
     
     def do_GET(self):
-        # Parse the URL
-        parsed_path = urlparse(self.path)
-        path = parsed_path.path
-        
-        # API endpoint for admin status (cookie-based)
-        if path == '/api/admin/status':
-            is_admin = self.is_admin_session()
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Credentials', 'true')
-            self.end_headers()
-            self.wfile.write(json.dumps({'isAdmin': is_admin}).encode('utf-8'))
-            return
-        
-        # --- API endpoint for menu items (test data) ---
-        if path == '/api/items':
-            items = [
-                {
-                    "id": "1",
-                    "name": "Пицца Маргарита",
-                    "description": "Томатный соус, моцарелла, базилик",
-                    "price": 450,
-                    "imageUrl": None,
-                    "articleCode": "001",
-                    "categoryId": "pizza",
-                    "category": {"id": "pizza", "name": "Пицца", "order": 1}
-                },
-                {
-                    "id": "2",
-                    "name": "Бургер Йорк",
-                    "description": "Котлета куриная, булка белая, бекон копченый, сыр, помидор, лист салата, красный лук",
-                    "price": 470,
-                    "imageUrl": None,
-                    "articleCode": "002",
-                    "categoryId": "burgers",
-                    "category": {"id": "burgers", "name": "Бургеры", "order": 2}
-                }
-            ]
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps(items, ensure_ascii=False).encode('utf-8'))
-            return
-        # --- END: API endpoint for menu items ---
-        
-        # --- API endpoint for menu categories (test data) ---
-        if path == '/api/menu/categories':
-            categories = [
-                {"id": "pizza", "name": "Пицца", "order": 1},
-                {"id": "burgers", "name": "Бургеры", "order": 2}
-            ]
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps(categories, ensure_ascii=False).encode('utf-8'))
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_PUT(self):
+        self.dispatch('PUT')
+
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+
+    def do_HEAD(self):
+        self.metrics_route = 'static'
+        self.serve_static(urlparse(self.path).path, head=True)
+
+    def dispatch(self, method):
+        """Look the request up in the router and call the matching handle_* method"""
+        path = urlparse(self.path).path
+        self.data = {}
+        try:
+            # Multipart and menu import bodies are read by the handler, after the authorisation check
+            if method != 'GET' and not self.streams_body():
+                self.data = self.read_json_body()
+            self.route(method, path)
+        except RequestEntityTooLarge:
+            self.send_too_large()
+        except ValidationError as e:
+            self.send_json({"status": "error", "message": str(e)}, status=400)
+
+    def route(self, method, path):
+        # Для PUT/DELETE можно использовать X-HTTP-Method-Override или поле _method в body
+        if method == 'POST':
+            override = self.headers.get('X-HTTP-Method-Override') or self.data.get('_method')
+            if override:
+                method = str(override).upper()
+        self.request_method = method
+        handler, kwargs, pattern, allowed = router.resolve(method, path)
+        if handler is not None:
+            self.metrics_route = pattern
+            getattr(self, handler)(**kwargs)
+        elif method == 'GET' and not path.startswith('/api/'):
+            self.metrics_route = 'static'
+            self.serve_static(path)
+        elif allowed:
+            self.send_json({"status": "error", "message": "Метод не поддерживается"}, status=405,
+                           headers={'Allow': ', '.join(allowed)})
+        else:
+            self.send_json({"status": "error", "message": "Не найдено"}, status=404)
+
+    def is_multipart(self):
+        return self.headers.get_content_type() == 'multipart/form-data'
+
+    @staticmethod
+    def body_limit_for(content_type):
+        """(size cap, streamed) for a request body of this media type"""
+        streamed = content_type in STREAMED_BODY_TYPES
+        return (MAX_UPLOAD_BODY if streamed else MAX_JSON_BODY), streamed
+
+    def streams_body(self):
+        return self.headers.get_content_type() in STREAMED_BODY_TYPES
+
+    def body_limit(self):
+        return self.body_limit_for(self.headers.get_content_type())[0]
+
+    def body_pending(self):
+        """True while part of the request body is still unread on the connection"""
+        return self.body is not None and not self.body.finished
+
+    def parse_request(self):
+        """Parse the request line and headers, then frame the body of any method"""
+        if not super().parse_request():
+            return False
+        try:
+            # A body left unread (even on GET) makes end_headers() close the connection, so
+            # its bytes are never taken for the next request
+            self.body = BodyReader(self.rfile, self.headers, self.body_limit())
+        except RequestEntityTooLarge:
+            self.send_too_large()
+            return False
+        except ValidationError as e:
+            self.send_json({"status": "error", "message": str(e)}, status=400, headers={'Connection': 'close'})
+            return False
+        return True
+
+    def handle_expect_100(self):
+        # Refuse an oversized body before the client starts sending it
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = 0
+        if length > self.body_limit():
+            self.send_too_large()
+            return False
+        return super().handle_expect_100()
+
+    def read_json_body(self):
+        post_data = self.body.read()
+        if post_data:
+            try:
+                data = json.loads(post_data.decode('utf-8'))
+                if isinstance(data, dict):
+                    return data
+            except Exception:
+                pass
+        return {}
+
+    def send_file_body(self, f, count):
+        """Send count bytes of the open file f as the response body (zero-copy) and close it"""
+        with f:
+            self.connection.sendfile(f, 0, count)
+
+    def hand_off_connection(self, adopt):
+        """Pass the socket to adopt(sock) once the response so far is sent; the server lets go of it"""
+        self.wfile.flush()
+        sock = self.connection.dup()
+        self.server.detach_request(self.request)
+        adopt(sock)
+
+    def read_form(self, accept_files=True):
+        """Parse a multipart/form-data body into (fields, files); uploads are saved to images/"""
+        boundary = self.headers.get_param('boundary')
+        if not boundary or len(boundary) > 70:
+            raise ValidationError("Некорректные данные формы")
+        self.form = MultipartParser(self.body, boundary.encode('latin-1'), UPLOAD_DIR if accept_files else None)
+        return self.form.parse()
+
+    def settle_uploads(self, succeeded):
+        """After the request: render the uploaded images, or remove new files nobody will reference"""
+        if self.form is None:
             return
-        # --- END: API endpoint for menu categories ---
+        if succeeded:
+            for saved in self.form.files:
+                # Start rendering the responsive sizes right away
+                image_pipeline.variants(saved['url'])
+        else:
+            self.form.discard()
 
-        # --- API endpoint for events (test data) ---
-        if path == '/api/events':
-            events = [
-                {"id": "1", "title": "Живая музыка", "description": "Каждую пятницу и субботу!", "imageUrl": None, "date": "2025-06-20"}
-            ]
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
+    def serve_static(self, path, head=False):
+        """Serve a file from memory (or zero-copy from disk for large files)"""
+        path = STATIC_ALIASES.get(path, path)
+        fs_path = self.translate_path(path)
+        if static_assets.is_hidden(fs_path):
+            self.send_error(404, "File not found")
+            return
+        if os.path.isdir(fs_path):
+            # Directory redirects and listings stay with SimpleHTTPRequestHandler
+            self.path = path
+            return super().do_HEAD() if head else super().do_GET()
+        asset = static_assets.get(fs_path)
+        if asset is None:
+            self.send_error(404, "File not found")
+            return
+        self.metrics_cache = asset.in_memory
+        encoding = choose_encoding(self.headers.get('Accept-Encoding'), asset.variants)
+        etag = asset.variant_etag(encoding)
+        if self.is_not_modified(etag, asset.mtime_ns):
+            self.send_response(304)
+            self.send_static_headers(asset, etag)
             self.end_headers()
-            self.wfile.write(json.dumps(events, ensure_ascii=False).encode('utf-8'))
             return
-        # --- END: API endpoint for events ---
+        body = asset.variants.get(encoding)
+        self.send_response(200)
+        self.send_header('Content-type', asset.content_type)
+        self.send_header('Content-Length', str(len(body) if body is not None else asset.size))
+        if encoding != 'identity':
+            self.send_header('Content-Encoding', encoding)
+        self.send_static_headers(asset, etag)
+        self.end_headers()
+        if head:
+            return
+        if body is not None:
+            self.wfile.write(body)
+            return
+        self.send_file_body(open(asset.path, 'rb'), asset.size)
 
-        # --- API endpoint for news (test data) ---
-        if path == '/api/news':
-            news = [
-                {"id": "1", "title": "Новое меню!", "content": "Попробуйте наши новые блюда.", "imageUrl": None, "createdAt": "2025-06-10"}
-            ]
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps(news, ensure_ascii=False).encode('utf-8'))
+    def send_static_headers(self, asset, etag):
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', asset.last_modified)
+        self.send_header('Cache-Control', static_cache_control(asset.path))
+        if len(asset.variants) > 1:
+            self.send_header('Vary', 'Accept-Encoding')
+
+    def is_not_modified(self, etag, mtime_ns):
+        if self.headers.get('If-None-Match'):
+            return self.etag_matches(etag)
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if not if_modified_since:
+            return False
+        try:
+            since = email.utils.parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=datetime.timezone.utc)
+        return int(mtime_ns // 1_000_000_000) <= since.timestamp()
+    
+    # --- Route handlers ---
+
+    def handle_admin_status(self):
+        self.send_json({'isAdmin': self.is_admin_session()})
+
+    def handle_login(self):
+        login = self.data.get('login')
+        password = self.data.get('password')
+        if login == ADMIN_LOGIN and password == ADMIN_PASSWORD:
+            session = sessions.create()
+            self.send_json({'success': True}, headers={
+                'Set-Cookie': f'{SESSION_COOKIE_NAME}={session}; Path=/; HttpOnly; SameSite=Lax',
+            })
+        else:
+            self.send_json({'success': False, 'message': 'Неверный логин или пароль'}, status=401)
+
+    def handle_logout(self):
+        cookies = self.parse_cookies()
+        session = cookies.get(SESSION_COOKIE_NAME)
+        if session:
+            sessions.revoke(session)
+        self.send_json({'success': True}, headers={
+            'Set-Cookie': f'{SESSION_COOKIE_NAME}=deleted; Path=/; Expires=Thu, 01 Jan 1970 00:00:00 GMT',
+        })
+
+    def handle_cached(self, resource, build):
+        query_string = urlparse(self.path).query
+        if query_string and resource in COLLECTION_SPECS:
+            self.handle_collection_query(resource, build, query_string)
             return
-        # --- END: API endpoint for news ---
+        self.send_cached_json(resource, build)
 
-        # --- API endpoint for contacts (test data) ---
-        if path == '/api/contacts':
-            contacts = [
-                {"id": "1", "name": "Иван", "phone": "+7 900 000-00-00", "message": "Забронировать стол", "type": "table", "createdAt": "2025-06-11"}
-            ]
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps(contacts, ensure_ascii=False).encode('utf-8'))
+    def handle_collection_query(self, resource, build, query_string):
+        try:
+            query = parse_collection_query(resource, query_string)
+        except QueryError as e:
+            self.send_json({"status": "error", "message": str(e)}, status=400)
+            return
+        index = get_collection_index(resource, build)
+        key = tuple(sorted(query.items()))
+        try:
+            entry, self.metrics_cache = index.cached_response(
+                key, lambda: build_collection_response(index, **query))
+        except QueryError as e:
+            self.send_json({"status": "error", "message": str(e)}, status=400)
             return
-        # --- END: API endpoint for contacts ---
+        self.send_cached_entry(entry)
 
-        # --- API endpoint for staff (test data) ---
-        if path == '/api/staff':
-            staff = [
-                {"id": "1", "name": "Анна Петрова", "position": "Шеф-повар", "description": "Опытный шеф-повар", "imageUrl": None, "order": 1}
-            ]
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps(staff, ensure_ascii=False).encode('utf-8'))
-            return
-        # --- END: API endpoint for staff ---
-
-        # --- API endpoint for about (test data) ---
-        if path == '/api/about':
-            about = {
-                "title": "О нас",
-                "content": "Лучшее кафе города!",
-                "advantages": [
-                    {"title": "Уютная атмосфера", "description": "Приятная обстановка для всех гостей."},
-                    {"title": "Вкусная еда", "description": "Широкий выбор блюд на любой вкус."}
-                ]
-            }
+    def handle_stream(self):
+        """Server-Sent Events: a "change" event each time a resource's version is bumped"""
+        query = parse_qs(urlparse(self.path).query)
+        requested = [name for value in query.get('resources', []) for name in value.split(',') if name]
+        unknown = [name for name in requested if name not in STREAM_RESOURCES]
+        if unknown:
+            self.send_json({"status": "error", "message": f"Неизвестный ресурс: {unknown[0]}"}, status=400)
+            return
+        if len(event_stream) >= STREAM_MAX_CLIENTS:
+            self.send_json({"status": "error", "message": "Слишком много подписчиков"}, status=503,
+                           headers={'Retry-After': str(STREAM_RETRY_MS // 1000)})
+            return
+        resources = tuple(requested) or STREAM_RESOURCES
+        versions = event_stream.snapshot(resources)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        # Proxies such as nginx must not buffer the stream
+        self.send_header('X-Accel-Buffering', 'no')
+        # The stream has no length: it ends when either side closes the connection
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(f'retry: {STREAM_RETRY_MS}\n\n'.encode('ascii') + format_event('versions', versions))
+        self.hand_off_connection(lambda sock: event_stream.add(sock, resources, versions))
+
+    def handle_reload(self):
+        """Rebuild the cached content from the database now (without restarting the server)"""
+        if not self.require_admin():
+            return
+        ticket = content_reloader.request()
+        if not content_reloader.wait(ticket, SHUTDOWN_TIMEOUT):
+            self.send_json({"status": "error", "message": "Перезагрузка не завершилась вовремя"}, status=503)
+            return
+        summary = content_reloader.last_reload
+        if 'error' in summary:
+            self.send_json({"status": "error", "message": summary['error']}, status=500)
+            return
+        self.send_json({"status": "success", "message": "Контент перезагружен", "data": summary})
+
+    def handle_list_contacts(self):
+        if not self.require_admin():
+            return
+        self.send_json(load_contacts())
+
+    def handle_metrics(self):
+        if not self.require_admin():
+            return
+        query = parse_qs(urlparse(self.path).query)
+        if query.get('format') == ['prometheus'] or 'text/plain' in self.headers.get('Accept', ''):
+            body = metrics.prometheus().encode('utf-8')
             self.send_response(200)
-            self.send_header('Content-type', 'application/json')
+            self.send_header('Content-type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('Cache-Control', 'no-store')
             self.end_headers()
-            self.wfile.write(json.dumps(about, ensure_ascii=False).encode('utf-8'))
-            return
-        # --- END: API endpoint for about ---
-        
-        # Handle root path
-        if path == '/':
-            path = '/index.html'
-        
-        # Handle admin path
-        if path == '/admin' or path == '/admin/':
-            path = '/admin/index.html'
-        
-        # Set the path for the parent class
-        self.path = path
-        
-        # Call the parent class method
-        super().do_GET()
-    
-    def do_POST(self):
-        # Handle form submissions
-        parsed_path = urlparse(self.path)
-        path = parsed_path.path
-        content_length = int(self.headers.get('Content-Length', 0))
-        post_data = self.rfile.read(content_length) if content_length else b''
-        data = {}
-        if post_data:
-            try:
-                data = json.loads(post_data.decode('utf-8'))
-            except Exception:
-                pass
+            self.wfile.write(body)
+            return
+        self.send_json(metrics.snapshot(), headers={'Cache-Control': 'no-store'})
 
-        # Login endpoint
-        if path == '/api/admin/login':
-            login = data.get('login')
-            password = data.get('password')
-            if login == ADMIN_LOGIN and password == ADMIN_PASSWORD:
-                session = secrets.token_hex(32)
-                sessions.add(session)
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Set-Cookie', f'{SESSION_COOKIE_NAME}={session}; Path=/; HttpOnly; SameSite=Lax')
-                self.send_header('Access-Control-Allow-Credentials', 'true')
-                self.end_headers()
-                self.wfile.write(json.dumps({'success': True}).encode('utf-8'))
+    def handle_mutation(self, resource, prefix, message, record_id=None):
+        """Apply a POST/PUT/DELETE to the database"""
+        method = self.request_method
+        if (resource, method) not in PUBLIC_MUTATIONS and not self.require_admin():
+            return
+        record = None
+        try:
+            if self.is_multipart():
+                self.data = self.read_form_record(resource)
+            record_id = record_id or self.data.get('id')
+            if resource == 'about':
+                record = repository.update_about(self.data)
+            elif method == 'POST' and resource == 'contacts':
+                record = contact_queue.submit(self.data)
+            elif method == 'POST':
+                record = repository.create(resource, self.data)
+            elif method == 'PUT':
+                record = repository.update(resource, record_id, self.data) if record_id else None
             else:
-                self.send_response(401)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({'success': False, 'message': 'Неверный логин или пароль'}).encode('utf-8'))
-            return
-
-        # Logout endpoint
-        if path == '/api/admin/logout':
-            cookies = self.parse_cookies()
-            session = cookies.get(SESSION_COOKIE_NAME)
-            if session in sessions:
-                sessions.remove(session)
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Set-Cookie', f'{SESSION_COOKIE_NAME}=deleted; Path=/; Expires=Thu, 01 Jan 1970 00:00:00 GMT')
-            self.send_header('Access-Control-Allow-Credentials', 'true')
-            self.end_headers()
-            self.wfile.write(json.dumps({'success': True}).encode('utf-8'))
+                # A contact request may still be waiting in the write-behind queue
+                deleted = record_id and (resource == 'contacts' and contact_queue.discard(record_id)
+                                         or repository.delete(resource, record_id))
+                record = {"id": record_id} if deleted else None
+        except ValidationError as e:
+            self.send_json({"status": "error", "message": str(e)}, status=400)
+            return
+        except sqlite3.IntegrityError:
+            self.send_json({"status": "error", "message": "Нарушена целостность данных"}, status=400)
             return
+        finally:
+            # A rejected form must not leave its image behind in images/
+            self.settle_uploads(record is not None)
+        if record is None:
+            self.send_json({"status": "error", "message": "Запись не найдена"}, status=404)
+            return
+        self.send_mutation_success(prefix, message, record)
 
-        # --- API endpoints for admin (POST/PUT/DELETE stub handlers) ---
-        # Для PUT/DELETE можно использовать X-HTTP-Method-Override или поле _method в body
-        method = self.command
-        override = self.headers.get('X-HTTP-Method-Override') or data.get('_method')
-        if override:
-            method = override.upper()
-
-        # Menu Categories
-        if path.startswith('/api/menu/categories'):
-            if method == 'POST':
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({"status": "success", "message": "Категория сохранена"}, ensure_ascii=False).encode('utf-8'))
-                return
-            if method == 'PUT':
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({"status": "success", "message": "Категория обновлена"}, ensure_ascii=False).encode('utf-8'))
-                return
-            if method == 'DELETE':
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({"status": "success", "message": "Категория удалена"}, ensure_ascii=False).encode('utf-8'))
-                return
+    def read_form_record(self, resource):
+        """Record fields from a multipart form; an uploaded image becomes its imageUrl"""
+        spec = TABLES.get(resource)
+        accept_files = spec is not None and 'imageUrl' in spec.columns
+        fields, files = self.read_form(accept_files)
+        if files:
+            fields['imageUrl'] = files[0]['url']
+        return fields
 
-        # Menu Items
-        if path.startswith('/api/items'):
-            if method == 'POST':
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({"status": "success", "message": "Блюдо сохранено"}, ensure_ascii=False).encode('utf-8'))
-                return
-            if method == 'PUT':
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({"status": "success", "message": "Блюдо обновлено"}, ensure_ascii=False).encode('utf-8'))
-                return
-            if method == 'DELETE':
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({"status": "success", "message": "Блюдо удалено"}, ensure_ascii=False).encode('utf-8'))
-                return
+    def handle_upload(self):
+        """Save images from a multipart/form-data body and return their URLs"""
+        if not self.require_admin():
+            return
+        if not self.is_multipart():
+            self.send_json({"status": "error", "message": "Ожидается multipart/form-data"}, status=415)
+            return
+        fields, files = self.read_form()
+        if not files:
+            self.send_json({"status": "error", "message": "Файл не получен"}, status=400)
+            return
+        self.settle_uploads(True)
+        self.send_json({"status": "success", "message": "Файл загружен", "data": files})
 
-        # Events
-        if path.startswith('/api/events'):
-            if method == 'POST':
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({"status": "success", "message": "Мероприятие сохранено"}, ensure_ascii=False).encode('utf-8'))
-                return
-            if method == 'PUT':
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({"status": "success", "message": "Мероприятие обновлено"}, ensure_ascii=False).encode('utf-8'))
-                return
-            if method == 'DELETE':
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({"status": "success", "message": "Мероприятие удалено"}, ensure_ascii=False).encode('utf-8'))
-                return
+    def handle_menu_import(self):
+        """Upsert categories and dishes from a CSV or JSON-lines body in one transaction"""
+        if not self.require_admin():
+            return
+        fmt = MENU_CONTENT_TYPES.get(self.headers.get_content_type())
+        if fmt is None:
+            self.send_json({"status": "error", "message": "Ожидается text/csv или application/x-ndjson"},
+                           status=415)
+            return
+        query = parse_qs(urlparse(self.path).query)
+        dry_run = query.get('dryRun', ['0'])[0] not in ('0', 'false', '')
+        # Spool the upload first so a slow client never holds the database write lock
+        with tempfile.SpooledTemporaryFile(max_size=MAX_JSON_BODY) as spool:
+            shutil.copyfileobj(self.body, spool, BODY_CHUNK_SIZE)
+            spool.seek(0)
+            summary = import_menu(spool.read, fmt, dry_run)
+        if summary['errorCount']:
+            self.send_json({"status": "error", "message": "Меню не импортировано: ошибки в файле",
+                            "data": summary}, status=400)
+        elif dry_run:
+            self.send_json({"status": "success", "message": "Проверка пройдена", "data": summary})
+        else:
+            self.send_mutation_success('/api/menu/categories', "Меню импортировано", summary)
 
-        # News
-        if path.startswith('/api/news'):
-            if method == 'POST':
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({"status": "success", "message": "Новость сохранена"}, ensure_ascii=False).encode('utf-8'))
-                return
-            if method == 'PUT':
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({"status": "success", "message": "Новость обновлена"}, ensure_ascii=False).encode('utf-8'))
-                return
-            if method == 'DELETE':
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({"status": "success", "message": "Новость удалена"}, ensure_ascii=False).encode('utf-8'))
-                return
+    def handle_menu_export(self):
+        """Stream the whole menu as CSV or JSON lines (one row per dish)"""
+        if not self.require_admin():
+            return
+        fmt = parse_qs(urlparse(self.path).query).get('format', ['csv'])[0]
+        if fmt not in MENU_MEDIA_TYPES:
+            self.send_json({"status": "error", "message": "Формат: csv или jsonl"}, status=400)
+            return
+        chunked = self.request_version == 'HTTP/1.1'
+        self.send_response(200)
+        self.send_header('Content-type', MENU_MEDIA_TYPES[fmt])
+        self.send_header('Content-Disposition', f'attachment; filename="menu.{fmt}"')
+        self.send_header('Cache-Control', 'no-store')
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        else:
+            # HTTP/1.0 clients read until the connection closes
+            self.send_header('Connection', 'close')
+            self.close_connection = True
+        self.end_headers()
+        for text in iter_menu_export(fmt):
+            data = text.encode('utf-8')
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data) if chunked else data)
+        if chunked:
+            self.wfile.write(b'0\r\n\r\n')
+
+    def handle_form(self):
+        self.send_json({
+            'status': 'success',
+            'message': 'Данные получены успешно'
+        })
+
+    # --- END: Route handlers ---
+
+
+# --- Pre-fork supervisor ---
+
+# Workers that die sooner than this after starting are restarted with a delay
+WORKER_MIN_UPTIME = 1.0
+WORKER_RESTART_DELAY = 1.0
+
+
+class PreforkSupervisor:
+    """Binds the listening socket once and keeps N forked worker processes serving it.
 
-        # Contacts
-        if path.startswith('/api/contacts'):
-            if method == 'POST':
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({"status": "success", "message": "Заявка отправлена"}, ensure_ascii=False).encode('utf-8'))
+    - a crashed worker is replaced
+    - SIGHUP is passed on to the workers, which reload the content
+    - SIGUSR2 replaces the workers one by one (rolling restart, no downtime)
+    - SIGTERM/SIGINT stop accepting; every worker drains its in-flight requests
+
+    Workers share the API cache versions through shared memory and admin
+    sessions through the SQLite session store, so any worker can serve any
+    request.
+    """
+
+    def __init__(self, port, processes, mode=DEFAULT_MODE, workers=DEFAULT_WORKERS, host='0.0.0.0',
+                 reuse_port=False):
+        self.port = port
+        self.processes = processes
+        self.mode = mode
+        self.workers = workers
+        self.host = host
+        self.reuse_port = reuse_port
+        self.listener = None
+        self.children = {}
+        self._stopping = False
+        self._reload = False
+        self._restart = False
+
+    def run(self):
+        # Nothing opened by the supervisor may be shared with the forked workers
+        database.close_all()
+        sessions.close()
+        response_cache.versions = SharedVersions()
+        if not self.reuse_port:
+            self.listener = create_listener(self.host, self.port)
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+        signal.signal(signal.SIGHUP, self._request_reload)
+        signal.signal(signal.SIGUSR2, self._request_restart)
+        try:
+            for _ in range(self.processes):
+                self._spawn()
+            while not self._stopping:
+                self._reap(respawn=True)
+                if self._reload:
+                    self._reload = False
+                    self._signal_children(signal.SIGHUP)
+                if self._restart:
+                    self._restart = False
+                    self._rolling_restart()
+                time.sleep(0.2)
+        finally:
+            self._stop_children()
+            if self.listener is not None:
+                self.listener.close()
+
+    def _request_stop(self, signum, frame):
+        self._stopping = True
+
+    def _request_reload(self, signum, frame):
+        self._reload = True
+
+    def _request_restart(self, signum, frame):
+        self._restart = True
+
+    def _signal_children(self, signum):
+        for pid in list(self.children):
+            with contextlib.suppress(ProcessLookupError):
+                os.kill(pid, signum)
+
+    def _spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                self._worker_main()
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        self.children[pid] = time.monotonic()
+        return pid
+
+    def _worker_main(self):
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, signal.default_int_handler)
+        # Until serve_until_stopped() installs the reload handler
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        signal.signal(signal.SIGUSR2, signal.SIG_DFL)
+        # With SO_REUSEPORT each worker binds its own socket and the kernel balances between them
+        sock = create_listener(self.host, self.port, reuse_port=True) if self.reuse_port else self.listener
+        httpd = make_server(BardabarHandler, self.port, self.mode, self.workers, self.host, sock=sock)
+        serve_until_stopped(httpd)
+
+    def _reap(self, respawn):
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.children.clear()
                 return
-            if method == 'DELETE':
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({"status": "success", "message": "Заявка удалена"}, ensure_ascii=False).encode('utf-8'))
+            if pid == 0:
                 return
+            started = self.children.pop(pid, None)
+            if started is None:
+                continue
+            if respawn and not self._stopping:
+                print(f"Процесс {pid} завершился (код {os.waitstatus_to_exitcode(status)}), перезапуск")
+                if time.monotonic() - started < WORKER_MIN_UPTIME:
+                    time.sleep(WORKER_RESTART_DELAY)
+                self._spawn()
 
-        # Staff
-        if path.startswith('/api/staff'):
-            if method == 'POST':
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({"status": "success", "message": "Сотрудник сохранён"}, ensure_ascii=False).encode('utf-8'))
+    def _rolling_restart(self):
+        print("Перезапуск рабочих процессов")
+        for pid in list(self.children):
+            if self._stopping:
                 return
-            if method == 'PUT':
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({"status": "success", "message": "Сотрудник обновлён"}, ensure_ascii=False).encode('utf-8'))
+            # Start the replacement first so capacity never drops
+            self._spawn()
+            self._terminate(pid)
+
+    def _terminate(self, pid, timeout=SHUTDOWN_TIMEOUT + 5):
+        self.children.pop(pid, None)
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            return
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                done, _ = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
                 return
-            if method == 'DELETE':
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({"status": "success", "message": "Сотрудник удалён"}, ensure_ascii=False).encode('utf-8'))
+            if done:
                 return
+            time.sleep(0.05)
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
 
-        # About
-        if path.startswith('/api/about'):
-            if method == 'PUT':
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({"status": "success", "message": "Информация обновлена"}, ensure_ascii=False).encode('utf-8'))
-                return
-        
-        # --- END: API endpoints for admin (POST/PUT/DELETE stub handlers) ---
-        
-        # Остальные POST-запросы (например, формы)
-        try:
-            response = {
-                'status': 'success',
-                'message': 'Данные получены успешно'
-            }
-            
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8'))
-            
-        except Exception as e:
-            self.send_response(400)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            error_response = {
-                'status': 'error',
-                'message': 'Ошибка обработки данных'
-            }
-            self.wfile.write(json.dumps(error_response, ensure_ascii=False).encode('utf-8'))
+    def _stop_children(self):
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + SHUTDOWN_TIMEOUT + 5
+        while self.children and time.monotonic() < deadline:
+            self._reap(respawn=False)
+            time.sleep(0.05)
+        for pid in list(self.children):
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        self.children.clear()
+
+# --- END: Pre-fork supervisor ---
+
+
+def _raise_keyboard_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def import_menu_file(path, fmt=None, dry_run=False):
+    """Import a menu file ('-' for stdin) into the database; returns the process exit code"""
+    fmt = fmt or menu_format_for(path)
+    database.initialize()
+    try:
+        if path == '-':
+            summary = import_menu(sys.stdin.buffer.read, fmt, dry_run)
+        else:
+            with open(path, 'rb') as f:
+                summary = import_menu(f.read, fmt, dry_run)
+    except (OSError, ValidationError) as e:
+        print(f"Ошибка импорта: {e}", file=sys.stderr)
+        return 1
+    finally:
+        database.close_all()
+    for error in summary['errors']:
+        print(f"Строка {error['line']}: {error['message']}", file=sys.stderr)
+    if summary['errorCount']:
+        print(f"Меню не импортировано: ошибок {summary['errorCount']}", file=sys.stderr)
+        return 1
+    created = summary['created']
+    print(f"{'Проверено' if dry_run else 'Импортировано'} строк: {summary['rows']} "
+          f"(новых категорий: {created['categories']}, новых блюд: {created['items']}, "
+          f"обновлено блюд: {summary['updated']})")
+    return 0
+
+
+def export_menu_file(path, fmt=None):
+    """Write the menu to a file ('-' for stdout); returns the process exit code"""
+    fmt = fmt or menu_format_for(path)
+    database.initialize()
+    try:
+        if path == '-':
+            for text in iter_menu_export(fmt):
+                sys.stdout.write(text)
+            sys.stdout.flush()
+        else:
+            # newline='' keeps the CSV line endings as the csv module wrote them
+            with open(path, 'w', encoding='utf-8', newline='') as f:
+                for text in iter_menu_export(fmt):
+                    f.write(text)
+            print(f"Меню выгружено в {path}")
+    except OSError as e:
+        print(f"Ошибка экспорта: {e}", file=sys.stderr)
+        return 1
+    finally:
+        database.close_all()
+    return 0
 
-def run_server(port=12000):
+
+def run_server(port=12000, mode=DEFAULT_MODE, workers=DEFAULT_WORKERS, seed_demo=False,
+               session_backend='memory', sessions_db=None, processes=1, reuse_port=False,
+               max_json_body=None, max_upload_body=None, content_watch=CONTENT_WATCH_INTERVAL):
     """Run the development server"""
     
     # Change to the script directory
-    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(BASE_DIR)
+    configure_body_limits(max_json_body, max_upload_body)
+    content_reloader.watch_interval = content_watch
+
+    if processes > 1 and session_backend == 'memory':
+        # Worker processes must see each other's logins
+        print("Несколько процессов: сессии хранятся в SQLite")
+        session_backend = 'sqlite'
+    configure_sessions(session_backend, sessions_db)
+
+    # Prepare the database (tables, WAL, indexes) before accepting requests
+    database.initialize()
+    contact_queue.db.initialize()
+    static_assets.preload()
+    if processes == 1:
+        # Pre-fork workers render derivatives on demand instead (no threads before fork())
+        image_pipeline.scan()
+    if seed_demo and seed_demo_content():
+        print("База данных заполнена демонстрационным контентом")
     
-    # Create server
-    with socketserver.TCPServer(("0.0.0.0", port), BardabarHandler) as httpd:
-        print(f"Сервер запущен на порту {port}")
+    if processes > 1:
+        supervisor = PreforkSupervisor(port, processes, mode, workers, reuse_port=reuse_port)
+        print(f"Сервер запущен на порту {port} (процессов: {processes}, режим: {mode}, потоков: {workers})")
         print(f"Откройте в браузере: http://localhost:{port}")
         print(f"Админ-панель: http://localhost:{port}/admin")
-        print("Для остановки нажмите Ctrl+C")
-        
-        try:
-            httpd.serve_forever()
-        except KeyboardInterrupt:
-            print("\nСервер остановлен")
+        print("Для остановки нажмите Ctrl+C; SIGHUP перезагружает контент, SIGUSR2 перезапускает процессы")
+        supervisor.run()
+        print("\nСервер остановлен")
+        return
+
+    # Create server
+    httpd = make_server(BardabarHandler, port, mode, workers)
+    print(f"Сервер запущен на порту {port} (режим: {mode}, потоков: {workers if mode != 'single' else 1})")
+    print(f"Откройте в браузере: http://localhost:{port}")
+    print(f"Админ-панель: http://localhost:{port}/admin")
+    print("Для остановки нажмите Ctrl+C, для перезагрузки контента отправьте SIGHUP")
+    serve_until_stopped(httpd)
+    print("\nСервер остановлен")
+
+
+def serve_until_stopped(httpd):
+    """Serve until Ctrl+C or SIGTERM, then drain in-flight requests and release resources"""
+    # SIGTERM shuts down as gracefully as Ctrl+C
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, _raise_keyboard_interrupt)
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, _request_content_reload)
+
+    # Replays contact requests left in the queue by the previous run
+    contact_queue.start()
+    content_reloader.start()
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Subscribers reconnect (possibly to another worker) after STREAM_RETRY_MS
+        event_stream.close()
+        content_reloader.close()
+        # Finish requests in flight before closing the worker pool
+        httpd.drain()
+        httpd.server_close()
+        # After the last request: everything it queued is written before exit
+        contact_queue.close()
+        database.close_all()
+        sessions.close()
+        image_pipeline.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Bardabar Cafe development server')
+    parser.add_argument('port', nargs='?', default='12000', help='порт (по умолчанию 12000)')
+    parser.add_argument('--mode', choices=SERVER_MODES, default=DEFAULT_MODE,
+                        help=f'режим обработки запросов (по умолчанию {DEFAULT_MODE})')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f'число рабочих потоков (по умолчанию {DEFAULT_WORKERS})')
+    parser.add_argument('--seed-demo', action='store_true',
+                        help='заполнить пустую базу данных демонстрационным контентом')
+    parser.add_argument('--sessions', choices=SESSION_BACKENDS, default='memory',
+                        help='хранилище сессий: memory (в процессе) или sqlite (общее для процессов)')
+    parser.add_argument('--sessions-db', default=None,
+                        help=f'файл SQLite для --sessions sqlite (по умолчанию {os.path.relpath(SESSIONS_DB_PATH, BASE_DIR)})')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='число рабочих процессов (pre-fork, только Unix; по умолчанию 1)')
+    parser.add_argument('--reuse-port', action='store_true',
+                        help='каждый процесс открывает свой сокет с SO_REUSEPORT вместо общего')
+    parser.add_argument('--max-body-kb', type=int, default=MAX_JSON_BODY // 1024,
+                        help=f'предельный размер JSON-запроса в КБ (по умолчанию {MAX_JSON_BODY // 1024})')
+    parser.add_argument('--max-upload-mb', type=int, default=MAX_UPLOAD_BODY // (1024 * 1024),
+                        help=f'предельный размер загрузки файлов в МБ (по умолчанию {MAX_UPLOAD_BODY // (1024 * 1024)})')
+    parser.add_argument('--content-watch', type=float, default=CONTENT_WATCH_INTERVAL,
+                        help='как часто (в секундах) проверять, не изменена ли база данных извне; 0 — не проверять')
+    parser.add_argument('--import-menu', metavar='FILE',
+                        help='импортировать меню из CSV или JSON lines (- — из stdin) и выйти')
+    parser.add_argument('--export-menu', metavar='FILE',
+                        help='выгрузить меню в CSV или JSON lines (- — в stdout) и выйти')
+    parser.add_argument('--format', choices=tuple(MENU_MEDIA_TYPES), default=None,
+                        help='формат файла меню (по умолчанию — по расширению, иначе csv)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='с --import-menu: только проверить файл, ничего не записывая')
+    args = parser.parse_args(argv)
+    if args.import_menu and args.export_menu:
+        parser.error('--import-menu и --export-menu нельзя указывать вместе')
+    try:
+        args.port = int(args.port)
+    except ValueError:
+        print("Неверный номер порта, используется порт по умолчанию 12000")
+        args.port = 12000
+    if args.workers < 1:
+        parser.error('--workers должно быть не меньше 1')
+    if args.processes < 1:
+        parser.error('--processes должно быть не меньше 1')
+    if args.content_watch < 0:
+        parser.error('--content-watch не может быть отрицательным')
+    if args.max_body_kb < 1 or args.max_upload_mb < 1:
+        parser.error('--max-body-kb и --max-upload-mb должны быть не меньше 1')
+    if args.processes > 1 and not hasattr(os, 'fork'):
+        parser.error('--processes поддерживается только на Unix')
+    return args
+
 
 if __name__ == "__main__":
-    port = 12000
-    if len(sys.argv) > 1:
-        try:
-            port = int(sys.argv[1])
-        except ValueError:
-            print("Неверный номер порта, используется порт по умолчанию 12000")
-    
-    run_server(port)
\ No newline at end of file
+    args = parse_args()
+    if args.import_menu:
+        sys.exit(import_menu_file(args.import_menu, args.format, args.dry_run))
+    if args.export_menu:
+        sys.exit(export_menu_file(args.export_menu, args.format))
+    run_server(args.port, args.mode, args.workers, seed_demo=args.seed_demo,
+               session_backend=args.sessions, sessions_db=args.sessions_db,
+               processes=args.processes, reuse_port=args.reuse_port,
+               max_json_body=args.max_body_kb * 1024, max_upload_body=args.max_upload_mb * 1024 * 1024,
+               content_watch=args.content_watch)
@@ -0,0 +1,20 @@
+"""
+Test setup: the server modules are imported from the repository root, with every
+database redirected to a temporary directory so tests never touch prisma/dev.db
+"""
+
+import os
+import sys
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = tempfile.mkdtemp(prefix='bardabar-tests-')
+
+# Must be set before server.py and db.py are imported: their paths are read at import time
+os.environ['BARDABAR_DB'] = os.path.join(DATA_DIR, 'dev.db')
+os.environ['BARDABAR_SESSIONS_DB'] = os.path.join(DATA_DIR, 'sessions.db')
+os.environ['BARDABAR_CONTACT_QUEUE'] = os.path.join(DATA_DIR, 'contact-queue.db')
+os.environ.pop('BARDABAR_NOTIFY_URL', None)
+
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
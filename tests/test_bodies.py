@@ -0,0 +1,205 @@
+"""
+Request bodies: BodyReader framing and caps, MultipartParser uploads
+"""
+
+import io
+import os
+import tempfile
+import unittest
+from email.message import Message
+
+import server
+from db import ValidationError
+from engines import RequestEntityTooLarge
+
+PNG = b'\x89PNG\r\n\x1a\n' + bytes(range(256)) * 4
+BOUNDARY = b'XyZbound'
+
+
+def make_headers(**fields):
+    headers = Message()
+    for name, value in fields.items():
+        headers[name.replace('_', '-')] = value
+    return headers
+
+
+def chunked(*chunks):
+    return b''.join(b'%x\r\n%s\r\n' % (len(chunk), chunk) for chunk in chunks) + b'0\r\n\r\n'
+
+
+class TrickleFile(io.BytesIO):
+    """A connection that hands out at most step bytes per read, like a slow client"""
+
+    def __init__(self, data, step):
+        super().__init__(data)
+        self.step = step
+
+    def read(self, size=-1):
+        return super().read(self.step if size < 0 else min(size, self.step))
+
+
+class BodyReaderTest(unittest.TestCase):
+
+    def reader(self, data, limit=1024, **headers):
+        return server.BodyReader(io.BytesIO(data), make_headers(**headers), limit)
+
+    def test_content_length_leaves_the_next_request_unread(self):
+        rfile = io.BytesIO(b'{"a": 1}GET / HTTP/1.1\r\n')
+        body = server.BodyReader(rfile, make_headers(Content_Length='8'), 1024)
+        self.assertEqual(body.read(), b'{"a": 1}')
+        self.assertEqual(body.read(), b'')
+        self.assertEqual(rfile.read(), b'GET / HTTP/1.1\r\n')
+
+    def test_no_length_means_empty_body(self):
+        self.assertEqual(self.reader(b'GET / HTTP/1.1\r\n').read(), b'')
+
+    def test_chunked_body_is_decoded(self):
+        rfile = io.BytesIO(chunked(b'hello, ', b'world') + b'NEXT')
+        body = server.BodyReader(rfile, make_headers(Transfer_Encoding='chunked'), 1024)
+        self.assertEqual(body.read(), b'hello, world')
+        self.assertEqual(rfile.read(), b'NEXT')
+
+    def test_chunked_reads_across_chunk_boundaries(self):
+        body = self.reader(chunked(b'abc', b'defgh'), Transfer_Encoding='chunked')
+        self.assertEqual([body.read(2) for _ in range(5)], [b'ab', b'c', b'de', b'fg', b'h'])
+        self.assertEqual(body.read(2), b'')
+
+    def test_chunked_trailers_and_extensions_are_skipped(self):
+        data = b'3;name=value\r\nabc\r\n0\r\nX-Trailer: 1\r\n\r\nNEXT'
+        rfile = io.BytesIO(data)
+        body = server.BodyReader(rfile, make_headers(Transfer_Encoding='chunked'), 1024)
+        self.assertEqual(body.read(), b'abc')
+        self.assertEqual(rfile.read(), b'NEXT')
+
+    def test_declared_length_over_the_cap_is_refused_before_reading(self):
+        rfile = io.BytesIO(b'x' * 20)
+        with self.assertRaises(RequestEntityTooLarge):
+            server.BodyReader(rfile, make_headers(Content_Length='20'), 10)
+        self.assertEqual(rfile.tell(), 0)
+
+    def test_chunked_body_over_the_cap_is_refused(self):
+        body = self.reader(chunked(b'x' * 6, b'y' * 6), limit=10, Transfer_Encoding='chunked')
+        with self.assertRaises(RequestEntityTooLarge):
+            body.read()
+
+    def test_malformed_framing(self):
+        with self.assertRaises(ValidationError):
+            self.reader(b'', Content_Length='-1')
+        with self.assertRaises(ValidationError):
+            self.reader(b'', Content_Length='ten')
+        with self.assertRaises(ValidationError):
+            self.reader(b'zz\r\nabc\r\n', Transfer_Encoding='chunked').read()
+        with self.assertRaises(ValidationError):
+            self.reader(b'3\r\nabcX\r\n0\r\n\r\n', Transfer_Encoding='chunked').read()
+
+    def test_truncated_body(self):
+        with self.assertRaises(ValidationError):
+            self.reader(b'abc', Content_Length='10').read()
+
+    def test_drain_consumes_the_rest(self):
+        rfile = io.BytesIO(chunked(b'abc', b'def') + b'NEXT')
+        body = server.BodyReader(rfile, make_headers(Transfer_Encoding='chunked'), 1024)
+        body.read(1)
+        body.drain()
+        self.assertEqual(rfile.read(), b'NEXT')
+
+
+class MultipartParserTest(unittest.TestCase):
+
+    def setUp(self):
+        self.upload_dir = tempfile.mkdtemp(prefix='uploads-')
+
+    def tearDown(self):
+        for name in os.listdir(self.upload_dir):
+            os.remove(os.path.join(self.upload_dir, name))
+        os.rmdir(self.upload_dir)
+
+    def body(self, parts, preamble=b'', step=None):
+        data = preamble
+        for headers, content in parts:
+            data += b'--' + BOUNDARY + b'\r\n' + headers + b'\r\n\r\n' + content + b'\r\n'
+        data += b'--' + BOUNDARY + b'--\r\n'
+        rfile = io.BytesIO(data) if step is None else TrickleFile(data, step)
+        return server.BodyReader(rfile, make_headers(Content_Length=str(len(data))), len(data))
+
+    def parse(self, parts, preamble=b'', step=None):
+        return server.MultipartParser(self.body(parts, preamble, step), BOUNDARY, self.upload_dir).parse()
+
+    def stored(self):
+        return sorted(os.listdir(self.upload_dir))
+
+    def test_fields_and_image(self):
+        fields, files = self.parse([
+            (b'Content-Disposition: form-data; name="title"', 'Пицца'.encode('utf-8')),
+            (b'Content-Disposition: form-data; name="file"; filename="a.png"\r\nContent-Type: image/png', PNG),
+        ])
+        self.assertEqual(fields, {'title': 'Пицца'})
+        self.assertEqual(len(files), 1)
+        self.assertEqual(files[0]['size'], len(PNG))
+        self.assertTrue(files[0]['url'].endswith('.png'))
+        [name] = self.stored()
+        with open(os.path.join(self.upload_dir, name), 'rb') as f:
+            self.assertEqual(f.read(), PNG)
+
+    def test_delimiters_split_across_reads(self):
+        parts = [
+            (b'Content-Disposition: form-data; name="title"', b'value'),
+            (b'Content-Disposition: form-data; name="file"; filename="a.png"', PNG),
+        ]
+        expected = self.parse(parts)
+        for name in self.stored():
+            os.remove(os.path.join(self.upload_dir, name))
+        for step in (1, 3, 7, len(BOUNDARY) + 3):
+            with self.subTest(step=step):
+                self.assertEqual(self.parse(parts, step=step), expected)
+
+    def test_preamble_is_ignored(self):
+        fields, files = self.parse(
+            [(b'Content-Disposition: form-data; name="a"', b'1')],
+            preamble=b'This is a multi-part message in MIME format.\r\n')
+        self.assertEqual(fields, {'a': '1'})
+        self.assertEqual(files, [])
+
+    def test_empty_file_input_is_skipped(self):
+        fields, files = self.parse([
+            (b'Content-Disposition: form-data; name="file"; filename=""\r\n'
+             b'Content-Type: application/octet-stream', b''),
+        ])
+        self.assertEqual(files, [])
+        self.assertEqual(self.stored(), [])
+
+    def test_non_image_is_rejected_and_nothing_is_left(self):
+        with self.assertRaises(ValidationError):
+            self.parse([
+                (b'Content-Disposition: form-data; name="ok"; filename="a.png"', PNG),
+                (b'Content-Disposition: form-data; name="file"; filename="evil.png"', b'<?php echo 1; ?>'),
+            ])
+        self.assertEqual(self.stored(), [])
+
+    def test_discard_removes_only_new_files(self):
+        image = (b'Content-Disposition: form-data; name="file"; filename="a.png"', PNG)
+        self.parse([image])
+        existing = self.stored()
+        parser = server.MultipartParser(
+            self.body([image, (b'Content-Disposition: form-data; name="b"; filename="b.png"', PNG + b'!')]),
+            BOUNDARY, self.upload_dir)
+        parser.parse()
+        self.assertEqual(len(self.stored()), 2)
+        parser.discard()
+        self.assertEqual(self.stored(), existing)
+
+    def test_file_parts_refused_without_upload_dir(self):
+        body = self.body([(b'Content-Disposition: form-data; name="f"; filename="a.png"', PNG)])
+        with self.assertRaises(ValidationError):
+            server.MultipartParser(body, BOUNDARY, None).parse()
+
+    def test_oversized_field(self):
+        with self.assertRaises(RequestEntityTooLarge):
+            self.parse([(b'Content-Disposition: form-data; name="a"', b'x' * (server.MAX_FORM_FIELD + 1))])
+
+    def test_missing_closing_boundary(self):
+        data = b'--' + BOUNDARY + b'\r\nContent-Disposition: form-data; name="a"\r\n\r\nvalue'
+        body = server.BodyReader(io.BytesIO(data), make_headers(Content_Length=str(len(data))), len(data))
+        with self.assertRaises(ValidationError):
+            server.MultipartParser(body, BOUNDARY, self.upload_dir).parse()
+
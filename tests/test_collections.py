@@ -0,0 +1,135 @@
+"""
+Collection queries: cursor pagination, prefix search, query validation
+"""
+
+import unittest
+
+import server
+
+SPEC = server.COLLECTION_SPECS['items']
+
+
+def make_items(count, split=4):
+    """Menu items in MENU_ITEMS_SQL order: the first split in category a, the rest in b"""
+    items = []
+    for i in range(count):
+        category = {'id': 'a', 'order': 1} if i < split else {'id': 'b', 'order': 2}
+        items.append({'id': 'item%02d' % i, 'name': 'Блюдо %02d' % i, 'description': '',
+                      'articleCode': '%03d' % i, 'categoryId': category['id'], 'category': category})
+    return items
+
+
+def ids(records):
+    return [record['id'] for record in records]
+
+
+def walk(index, **query):
+    """All pages of a query; returns the ids page by page"""
+    pages, cursor = [], None
+    while True:
+        page, cursor = index.select(cursor=cursor, **query)
+        pages.append(ids(page))
+        if cursor is None:
+            return pages
+
+
+class CursorPaginationTest(unittest.TestCase):
+
+    def test_pages_cover_the_collection_once(self):
+        index = server.CollectionIndex(make_items(7), SPEC)
+        self.assertEqual(walk(index, limit=3), [['item00', 'item01', 'item02'],
+                                                ['item03', 'item04', 'item05'], ['item06']])
+
+    def test_pages_within_a_group(self):
+        index = server.CollectionIndex(make_items(7), SPEC)
+        self.assertEqual(walk(index, group='b', limit=2), [['item04', 'item05'], ['item06']])
+
+    def test_deleting_the_last_record_of_a_page(self):
+        records = make_items(7)
+        page, cursor = server.CollectionIndex(records, SPEC).select(limit=3)
+        self.assertEqual(ids(page)[-1], 'item02')
+        index = server.CollectionIndex([r for r in records if r['id'] != 'item02'], SPEC)
+        page, cursor = index.select(cursor=cursor, limit=3)
+        self.assertEqual(ids(page), ['item03', 'item04', 'item05'])
+
+    def test_deleting_records_already_seen(self):
+        records = make_items(7)
+        page, cursor = server.CollectionIndex(records, SPEC).select(limit=3)
+        index = server.CollectionIndex([r for r in records if r['id'] not in ('item00', 'item01')], SPEC)
+        page, cursor = index.select(cursor=cursor, limit=3)
+        # The cursor follows the order, not positions: nothing is skipped or repeated
+        self.assertEqual(ids(page), ['item03', 'item04', 'item05'])
+
+    def test_deleting_the_cursor_record_and_its_neighbours(self):
+        records = make_items(7)
+        page, cursor = server.CollectionIndex(records, SPEC).select(limit=3)
+        removed = ('item01', 'item02', 'item03')
+        index = server.CollectionIndex([r for r in records if r['id'] not in removed], SPEC)
+        page, cursor = index.select(cursor=cursor, limit=3)
+        self.assertEqual(ids(page), ['item04', 'item05', 'item06'])
+        self.assertIsNone(cursor)
+
+    def test_records_added_before_the_cursor_are_not_repeated(self):
+        records = make_items(7)
+        page, cursor = server.CollectionIndex(records, SPEC).select(limit=3)
+        added = dict(records[0], id='item00a', name='Блюдо 00a')
+        index = server.CollectionIndex(records[:1] + [added] + records[1:], SPEC)
+        page, cursor = index.select(cursor=cursor, limit=3)
+        self.assertEqual(ids(page), ['item03', 'item04', 'item05'])
+
+    def test_news_newest_first(self):
+        news = [{'id': 'n%d' % i, 'title': 'Новость', 'content': '', 'createdAt': created}
+                for i, created in enumerate(('2026-10-03T10:00:00.000Z', '2026-10-02T10:00:00.000Z',
+                                             '2026-10-01T10:00:00.000Z'))]
+        index = server.CollectionIndex(news, server.COLLECTION_SPECS['news'])
+        page, cursor = index.select(limit=1)
+        index = server.CollectionIndex(news[1:], server.COLLECTION_SPECS['news'])
+        self.assertEqual(walk(index, limit=1)[0], ['n1'])
+        self.assertEqual(ids(index.select(cursor=cursor, limit=5)[0]), ['n1', 'n2'])
+
+    def test_invalid_cursor(self):
+        index = server.CollectionIndex(make_items(3), SPEC)
+        for cursor in ('not a cursor!', server.encode_cursor({'a': 1}), server.encode_cursor([None, 'x'])):
+            with self.subTest(cursor=cursor), self.assertRaises(server.QueryError):
+                index.select(cursor=cursor)
+
+
+class SearchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = server.CollectionIndex([
+            dict(item, id=record_id, name=name, description=description)
+            for item, (record_id, name, description) in zip(make_items(3), (
+                ('a', 'Пицца Маргарита', 'Томатный соус'),
+                ('b', 'Пицца Пепперони', 'Острая'),
+                ('c', 'Ёжик', 'Десерт')))
+        ], SPEC)
+
+    def test_prefixes_of_every_word(self):
+        self.assertEqual(self.index.search('пиц'), [0, 1])
+        self.assertEqual(self.index.search('пиц мар'), [0])
+        self.assertEqual(self.index.search('пиццы'), [])
+
+    def test_yo_matches_ye(self):
+        self.assertEqual(self.index.search('ежик'), [2])
+
+    def test_article_code(self):
+        self.assertEqual(ids(self.index.select(text='001')[0]), ['b'])
+
+
+class CollectionQueryTest(unittest.TestCase):
+
+    def test_limit_is_clamped(self):
+        self.assertEqual(server.parse_collection_query('items', 'limit=0')['limit'], 1)
+        self.assertEqual(server.parse_collection_query('items', 'limit=100000')['limit'], server.MAX_PAGE_SIZE)
+
+    def test_unknown_fields(self):
+        with self.assertRaises(server.QueryError):
+            server.parse_collection_query('news', 'fields=title,secret')
+
+    def test_normalize_with_category_field(self):
+        with self.assertRaises(server.QueryError):
+            server.parse_collection_query('items', 'normalize=1&fields=id,category')
+        query = server.parse_collection_query('items', 'normalize=1&fields=id,categoryId')
+        self.assertTrue(query['normalize'])
+        self.assertTrue(query['paged'])
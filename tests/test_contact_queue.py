@@ -0,0 +1,150 @@
+"""
+Contact request queue: write-behind, replay after a restart, merge into GET /api/contacts
+"""
+
+import http.client
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import server
+from db import ValidationError, database, repository
+from engines import make_server
+
+
+def contact(name):
+    return {'name': name, 'phone': '+7 900 000-00-00', 'type': 'booking', 'message': ''}
+
+
+def stored_names():
+    return sorted(record['name'] for record in repository.list('contacts'))
+
+
+class ContactQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        with database.transaction() as conn:
+            conn.execute('DELETE FROM "ContactRequest"')
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        self.path = os.path.join(directory, 'queue.db')
+        self.queue = self.open_queue()
+
+    def open_queue(self):
+        queue = server.ContactQueue(self.path, repository)
+        self.addCleanup(queue.close)
+        return queue
+
+    def test_submit_only_queues(self):
+        record = self.queue.submit(contact('Анна'))
+        self.assertTrue(record['pending'])
+        self.assertEqual([r['id'] for r in self.queue.pending()], [record['id']])
+        self.assertEqual(stored_names(), [])
+
+    def test_invalid_request_is_not_queued(self):
+        with self.assertRaises(ValidationError):
+            self.queue.submit({'name': 'Анна'})
+        self.assertEqual(self.queue.pending(), [])
+
+    def test_queued_requests_survive_a_restart(self):
+        self.queue.submit(contact('Анна'))
+        self.queue.submit(contact('Борис'))
+        self.queue.close()
+        restarted = self.open_queue()
+        self.assertEqual([r['name'] for r in restarted.pending()], ['Анна', 'Борис'])
+        version = server.response_cache.version('contacts')
+        self.assertEqual(restarted.flush(), 2)
+        self.assertEqual(restarted.flush(), 0)
+        self.assertEqual(restarted.pending(), [])
+        self.assertEqual(stored_names(), ['Анна', 'Борис'])
+        self.assertEqual(server.response_cache.version('contacts'), version + 1)
+
+    def test_start_replays_the_queue(self):
+        self.queue.submit(contact('Анна'))
+        self.queue.start()
+        deadline = time.monotonic() + 5
+        while self.queue.pending() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(stored_names(), ['Анна'])
+
+    def test_batch_written_twice_is_stored_once(self):
+        self.queue.submit(contact('Анна'))
+        [row] = self.queue.db.connection().execute('SELECT "id", "data" FROM "PendingContact"').fetchall()
+        self.queue.flush()
+        # As if the process died after the main commit but before the queue commit
+        with self.queue.db.transaction() as conn:
+            conn.execute('INSERT INTO "PendingContact" ("id", "data") VALUES (?, ?)', (row['id'], row['data']))
+        self.assertEqual(self.queue.flush(), 1)
+        self.assertEqual(stored_names(), ['Анна'])
+
+    def test_discard(self):
+        record = self.queue.submit(contact('Анна'))
+        self.assertTrue(self.queue.discard(record['id']))
+        self.assertFalse(self.queue.discard(record['id']))
+        self.queue.flush()
+        self.assertEqual(stored_names(), [])
+
+    def test_list_merges_pending_and_stored(self):
+        self.queue.submit(contact('Анна'))
+        self.queue.flush()
+        # Stored contacts are listed newest first, by createdAt in milliseconds
+        time.sleep(0.01)
+        self.queue.submit(contact('Борис'))
+        twice = self.queue.submit(contact('Вера'))
+        # Written by another worker but not yet removed from the queue
+        repository.create('contacts', dict(contact('Вера'), id=twice['id']))
+        with mock.patch.object(server, 'contact_queue', self.queue):
+            contacts = server.load_contacts()
+        self.assertEqual([(r['name'], r.get('pending', False)) for r in contacts],
+                         [('Борис', True), ('Вера', False), ('Анна', False)])
+
+
+class ContactEndpointTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.httpd = make_server(server.BardabarHandler, 0, 'threaded', 2, '127.0.0.1')
+        cls.thread = threading.Thread(target=cls.httpd.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.httpd.shutdown()
+        cls.thread.join()
+        cls.httpd.server_close()
+
+    def request(self, method, path, headers=None, payload=None):
+        conn = http.client.HTTPConnection('127.0.0.1', self.httpd.server_address[1], timeout=5)
+        self.addCleanup(conn.close)
+        headers = dict(headers or {})
+        body = None
+        if payload is not None:
+            body = json.dumps(payload).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        conn.request(method, path, body, headers)
+        response = conn.getresponse()
+        return response.status, json.loads(response.read())
+
+    def test_submitted_request_is_listed_before_and_after_the_write(self):
+        admin = {'Cookie': '%s=%s' % (server.SESSION_COOKIE_NAME, server.sessions.create())}
+        status, response = self.request('POST', '/api/contacts', payload=contact('Анна'))
+        self.assertEqual(status, 200)
+        record = response['data']
+        self.assertTrue(record['pending'])
+        _, contacts = self.request('GET', '/api/contacts', admin)
+        self.assertEqual(contacts[0], record)
+        while server.contact_queue.flush():
+            pass
+        _, contacts = self.request('GET', '/api/contacts', admin)
+        listed = [r for r in contacts if r['id'] == record['id']]
+        self.assertEqual(len(listed), 1)
+        self.assertNotIn('pending', listed[0])
+
+    def test_list_requires_admin(self):
+        status, _ = self.request('GET', '/api/contacts')
+        self.assertEqual(status, 401)
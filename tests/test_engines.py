@@ -0,0 +1,93 @@
+"""
+Serving engines: the same answers from the threaded and the async engine
+"""
+
+import os
+import socket
+import threading
+import time
+import unittest
+
+import server
+from engines import make_server
+
+
+class EngineTestMixin:
+    """Serves BardabarHandler with the engine of the mode attribute on a free port"""
+    mode = None
+
+    @classmethod
+    def setUpClass(cls):
+        cls.httpd = make_server(server.BardabarHandler, 0, cls.mode, 2, '127.0.0.1')
+        cls.thread = threading.Thread(target=cls.httpd.serve_forever, daemon=True)
+        cls.thread.start()
+        # The async engine binds inside serve_forever()
+        deadline = time.monotonic() + 5
+        while not cls.httpd.server_address[1] and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.httpd.shutdown()
+        cls.thread.join()
+        cls.httpd.server_close()
+
+    def exchange(self, raw):
+        """Send raw bytes; returns (status line, headers, body) and whether the server then closed"""
+        with socket.create_connection(('127.0.0.1', self.httpd.server_address[1]), timeout=5) as sock:
+            sock.sendall(raw)
+            received = b''
+            while True:
+                data = sock.recv(65536)
+                if not data:
+                    break
+                received += data
+        head, _, body = received.partition(b'\r\n\r\n')
+        status, *lines = head.decode('latin-1').split('\r\n')
+        headers = dict(line.split(': ', 1) for line in lines)
+        return status, headers, body
+
+
+class MalformedBodyMixin:
+
+    def assert_bad_request(self, raw):
+        status, headers, body = self.exchange(raw)
+        self.assertTrue(status.startswith('HTTP/1.1 400'), status)
+        self.assertEqual(headers.get('Connection'), 'close')
+        return body.decode('utf-8')
+
+    def test_invalid_content_length(self):
+        for value in (b'abc', b'-5'):
+            with self.subTest(value=value):
+                body = self.assert_bad_request(
+                    b'POST /api/contacts HTTP/1.1\r\nHost: x\r\nContent-Type: application/json\r\n'
+                    b'Content-Length: ' + value + b'\r\n\r\n{}')
+                self.assertIn('Некорректная длина тела запроса', body)
+
+    def test_invalid_chunk_size(self):
+        body = self.assert_bad_request(
+            b'POST /api/contacts HTTP/1.1\r\nHost: x\r\nContent-Type: application/json\r\n'
+            b'Transfer-Encoding: chunked\r\n\r\nzz\r\n{}\r\n0\r\n\r\n')
+        self.assertIn('Некорректное chunked-кодирование', body)
+
+
+class StaticFileMixin:
+    LARGE_FILE = 'walwle75.on.adaptive.ai/cdn/erLBU3T7tGHBkqgWrciMZZDftpxjqAN7.png'
+
+    def test_large_file_is_sent_from_disk(self):
+        with open(os.path.join(server.BASE_DIR, self.LARGE_FILE), 'rb') as f:
+            expected = f.read()
+        self.assertGreater(len(expected), server.STATIC_MEMORY_LIMIT)
+        status, headers, body = self.exchange(
+            b'GET /' + self.LARGE_FILE.encode('ascii') + b' HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n')
+        self.assertTrue(status.startswith('HTTP/1.1 200'), status)
+        self.assertEqual(headers['Content-Length'], str(len(expected)))
+        self.assertEqual(body, expected)
+
+
+class ThreadedEngineTest(EngineTestMixin, MalformedBodyMixin, StaticFileMixin, unittest.TestCase):
+    mode = 'threaded'
+
+
+class AsyncEngineTest(EngineTestMixin, MalformedBodyMixin, StaticFileMixin, unittest.TestCase):
+    mode = 'async'
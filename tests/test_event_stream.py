@@ -0,0 +1,138 @@
+"""
+Server-Sent Events: change events for version bumps, subscriber hand-over and shutdown
+"""
+
+import socket
+import threading
+import time
+import unittest
+
+import server
+from engines import make_server
+
+
+class Subscriber:
+    """The client end of an event stream"""
+
+    def __init__(self, sock, timeout=5):
+        self.sock = sock
+        self.sock.settimeout(timeout)
+        self.buffer = b''
+
+    def head(self):
+        while b'\r\n\r\n' not in self.buffer:
+            self._fill()
+        head, _, self.buffer = self.buffer.partition(b'\r\n\r\n')
+        return head.decode('latin-1')
+
+    def events(self, count):
+        """The next count blocks of the stream (events, comments, the retry field)"""
+        while self.buffer.count(b'\n\n') < count:
+            self._fill()
+        blocks = self.buffer.split(b'\n\n')
+        self.buffer = b'\n\n'.join(blocks[count:])
+        return [block.decode('utf-8') for block in blocks[:count]]
+
+    def _fill(self):
+        data = self.sock.recv(65536)
+        if not data:
+            raise EOFError
+        self.buffer += data
+
+
+class EventStreamTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stream = server.EventStream()
+        self.subscribers = []
+
+    def tearDown(self):
+        self.stream.close()
+        for sock in self.subscribers:
+            sock.close()
+
+    def subscribe(self, resources):
+        theirs, ours = socket.socketpair()
+        self.subscribers.append(ours)
+        self.stream.add(theirs, resources, self.stream.snapshot(resources))
+        return ours
+
+    def test_change_event_for_subscribed_resources_only(self):
+        events = self.subscribe(('events',))
+        news = self.subscribe(('news',))
+        version = server.response_cache.version('events')
+        server.response_cache.invalidate('events')
+        self.stream.notify()
+        self.assertEqual(Subscriber(events).events(1),
+                         ['event: change\ndata: {"resource": "events", "version": %d}' % (version + 1)])
+        news.settimeout(server.STREAM_POLL_INTERVAL * 2)
+        with self.assertRaises(socket.timeout):
+            news.recv(100)
+
+    def test_bump_between_snapshot_and_adoption(self):
+        theirs, ours = socket.socketpair()
+        self.subscribers.append(ours)
+        # Start the thread first, so the bump below happens after its own snapshot
+        self.subscribe(('news',))
+        snapshot = self.stream.snapshot(('staff',))
+        server.response_cache.invalidate('staff')
+        self.stream.add(theirs, ('staff',), snapshot)
+        self.assertEqual(Subscriber(ours).events(1),
+                         ['event: change\ndata: {"resource": "staff", "version": %d}' % (snapshot['staff'] + 1)])
+
+    def test_closed_subscriber_is_dropped(self):
+        sock = self.subscribe(('events',))
+        deadline = time.monotonic() + 5
+        while len(self.stream._clients) != 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        sock.close()
+        self.subscribers.remove(sock)
+        while len(self.stream) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(self.stream), 0)
+
+    def test_close_ends_every_stream(self):
+        sock = self.subscribe(('events',))
+        self.stream.close()
+        sock.settimeout(5)
+        self.assertEqual(sock.recv(100), b'')
+        # A stream closed for good refuses new subscribers
+        late = self.subscribe(('events',))
+        self.assertEqual(late.recv(100), b'')
+
+
+class StreamEndpointTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.httpd = make_server(server.BardabarHandler, 0, 'threaded', 2, '127.0.0.1')
+        cls.thread = threading.Thread(target=cls.httpd.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.httpd.shutdown()
+        cls.thread.join()
+        cls.httpd.server_close()
+
+    def connect(self, path):
+        sock = socket.create_connection(('127.0.0.1', self.httpd.server_address[1]), timeout=5)
+        self.addCleanup(sock.close)
+        sock.sendall(b'GET %s HTTP/1.1\r\nHost: x\r\n\r\n' % path.encode('ascii'))
+        return sock
+
+    def test_initial_versions_then_changes(self):
+        subscriber = Subscriber(self.connect('/api/stream?resources=news,about'))
+        self.assertIn('Content-Type: text/event-stream; charset=utf-8', subscriber.head())
+        retry, versions = subscriber.events(2)
+        self.assertEqual(retry, 'retry: %d' % server.STREAM_RETRY_MS)
+        self.assertEqual(versions, 'event: versions\ndata: {"news": %d, "about": %d}' % (
+            server.response_cache.version('news'), server.response_cache.version('about')))
+        server.response_cache.invalidate('about')
+        server.event_stream.notify()
+        self.assertEqual(subscriber.events(1), ['event: change\ndata: {"resource": "about", "version": %d}'
+                                                % server.response_cache.version('about')])
+
+    def test_unknown_resource(self):
+        sock = self.connect('/api/stream?resources=secrets')
+        self.assertIn(b' 400 ', sock.recv(4096).split(b'\r\n')[0])
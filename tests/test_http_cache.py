@@ -0,0 +1,120 @@
+"""
+HTTP caching: ETag revalidation of API responses and static files, invalidation by mutations
+"""
+
+import http.client
+import json
+import threading
+import unittest
+
+import server
+from engines import make_server
+
+
+class ResponseCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = server.ResponseCache()
+
+    def test_built_once_per_version(self):
+        first, hit = self.cache.get('news', lambda: ['a'])
+        self.assertFalse(hit)
+        second, hit = self.cache.get('news', self.fail)
+        self.assertTrue(hit)
+        self.assertIs(second, first)
+
+    def test_invalidate_rebuilds_with_a_new_etag(self):
+        first, _ = self.cache.get('news', lambda: ['a'])
+        self.cache.invalidate('news')
+        second, hit = self.cache.get('news', lambda: ['b'])
+        self.assertFalse(hit)
+        self.assertEqual(second.version, first.version + 1)
+        self.assertNotEqual(second.etag, first.etag)
+
+    def test_same_body_keeps_its_etag(self):
+        first, _ = self.cache.get('news', lambda: ['a'])
+        self.cache.invalidate('news')
+        self.assertEqual(self.cache.get('news', lambda: ['a'])[0].etag, first.etag)
+
+    def test_body_built_during_an_invalidation_is_not_kept(self):
+        def build():
+            self.cache.invalidate('news')
+            return ['stale']
+        entry, hit = self.cache.get('news', build)
+        self.assertEqual(entry.body, b'["stale"]')
+        self.assertFalse(self.cache.get('news', lambda: ['fresh'])[1])
+
+
+class RevalidationTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.httpd = make_server(server.BardabarHandler, 0, 'threaded', 2, '127.0.0.1')
+        cls.thread = threading.Thread(target=cls.httpd.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.httpd.shutdown()
+        cls.thread.join()
+        cls.httpd.server_close()
+
+    def request(self, method, path, headers=None, payload=None):
+        """Returns (status, headers, body)"""
+        conn = http.client.HTTPConnection('127.0.0.1', self.httpd.server_address[1], timeout=5)
+        self.addCleanup(conn.close)
+        body = json.dumps(payload).encode('utf-8') if payload is not None else None
+        headers = dict(headers or {})
+        if body is not None:
+            headers['Content-Type'] = 'application/json'
+        conn.request(method, path, body, headers)
+        response = conn.getresponse()
+        return response.status, response.headers, response.read()
+
+    def admin_cookie(self):
+        return {'Cookie': '%s=%s' % (server.SESSION_COOKIE_NAME, server.sessions.create())}
+
+    def test_api_if_none_match(self):
+        status, headers, body = self.request('GET', '/api/events')
+        self.assertEqual(status, 200)
+        etag = headers['ETag']
+        self.assertEqual(headers['Cache-Control'], 'no-cache')
+        for if_none_match in (etag, 'W/' + etag, '"other", ' + etag, '*'):
+            with self.subTest(if_none_match=if_none_match):
+                status, headers, body = self.request('GET', '/api/events', {'If-None-Match': if_none_match})
+                self.assertEqual(status, 304)
+                self.assertEqual(headers['ETag'], etag)
+                self.assertEqual(body, b'')
+        status, _, _ = self.request('GET', '/api/events', {'If-None-Match': '"other"'})
+        self.assertEqual(status, 200)
+
+    def test_mutation_invalidates_the_etag(self):
+        _, headers, _ = self.request('GET', '/api/events')
+        etag = headers['ETag']
+        status, _, _ = self.request('POST', '/api/events', self.admin_cookie(),
+                                    {'title': 'Джазовый вечер', 'date': '2026-11-01T19:00:00.000Z'})
+        self.assertEqual(status, 200)
+        status, headers, body = self.request('GET', '/api/events', {'If-None-Match': etag})
+        self.assertEqual(status, 200)
+        self.assertNotEqual(headers['ETag'], etag)
+        self.assertIn('Джазовый вечер', [event['title'] for event in json.loads(body)])
+
+    def test_unauthorized_mutation_keeps_the_etag(self):
+        _, headers, _ = self.request('GET', '/api/news')
+        status, _, _ = self.request('POST', '/api/news', payload={'title': 'Новость', 'content': 'Текст'})
+        self.assertEqual(status, 401)
+        status, _, _ = self.request('GET', '/api/news', {'If-None-Match': headers['ETag']})
+        self.assertEqual(status, 304)
+
+    def test_static_revalidation(self):
+        status, headers, body = self.request('GET', '/images/logo.svg', {'Accept-Encoding': 'identity'})
+        self.assertEqual(status, 200)
+        self.assertTrue(body)
+        for validator in ({'If-None-Match': headers['ETag']},
+                          {'If-Modified-Since': headers['Last-Modified']}):
+            with self.subTest(validator=validator):
+                status, _, body = self.request('GET', '/images/logo.svg', validator)
+                self.assertEqual(status, 304)
+                self.assertEqual(body, b'')
+        status, _, _ = self.request('GET', '/images/logo.svg', {'If-Modified-Since': 'Thu, 01 Jan 1970 00:00:00 GMT'})
+        self.assertEqual(status, 200)
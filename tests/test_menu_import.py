@@ -0,0 +1,114 @@
+"""
+Menu import: upserts by articleCode and category name, all-or-nothing transactions
+"""
+
+import io
+import json
+import unittest
+
+import server
+from db import ValidationError, database, repository
+
+HEADER = 'articleCode,name,description,price,imageUrl,category,categoryOrder\n'
+
+
+def run_import(text, fmt='csv', dry_run=False):
+    return server.import_menu(io.BytesIO(text.encode('utf-8')).read, fmt, dry_run)
+
+
+def menu():
+    """{articleCode: (name, price, category name)} of the stored menu"""
+    return {item['articleCode']: (item['name'], item['price'], item['category']['name'])
+            for item in repository.list_menu_items()}
+
+
+class MenuImportTest(unittest.TestCase):
+
+    def setUp(self):
+        with database.transaction() as conn:
+            conn.execute('DELETE FROM "MenuItem"')
+            conn.execute('DELETE FROM "MenuCategory"')
+
+    def categories(self):
+        return {c['name']: c['order'] for c in repository.list('categories')}
+
+    def test_creates_categories_and_items(self):
+        summary = run_import(HEADER + '001,Маргарита,,450,,Пицца,1\n'
+                                      '002,Йорк,,470,,Бургеры,2\n'
+                                      '003,Пепперони,,520,,пицца,\n')
+        self.assertTrue(summary['applied'])
+        self.assertEqual(summary['rows'], 3)
+        self.assertEqual(summary['created'], {'categories': 2, 'items': 3})
+        self.assertEqual(menu(), {'001': ('Маргарита', 450.0, 'Пицца'), '002': ('Йорк', 470.0, 'Бургеры'),
+                                  '003': ('Пепперони', 520.0, 'Пицца')})
+        self.assertEqual(self.categories(), {'Пицца': 1, 'Бургеры': 2})
+
+    def test_upsert_by_article_code(self):
+        run_import(HEADER + '001,Маргарита,Томаты,450,,Пицца,1\n')
+        [before] = repository.list_menu_items()
+        summary = run_import(HEADER + '001,Маргарита,,490,,ПИЦЦА,5\n'
+                                      ',Без артикула,,100,,Пицца,\n')
+        self.assertEqual(summary['updated'], 1)
+        self.assertEqual(summary['created'], {'categories': 0, 'items': 1})
+        items = {item['name']: item for item in repository.list_menu_items()}
+        self.assertEqual(items['Маргарита']['id'], before['id'])
+        self.assertEqual(items['Маргарита']['price'], 490.0)
+        # An empty cell keeps the stored value
+        self.assertEqual(items['Маргарита']['description'], 'Томаты')
+        self.assertEqual(self.categories(), {'Пицца': 5})
+
+    def test_rows_without_article_code_are_always_added(self):
+        run_import(HEADER + ',Лимонад,,150,,Напитки,\n')
+        run_import(HEADER + ',Лимонад,,150,,Напитки,\n')
+        self.assertEqual(len(repository.list_menu_items()), 2)
+
+    def test_an_invalid_row_rolls_back_the_whole_file(self):
+        run_import(HEADER + '001,Маргарита,,450,,Пицца,1\n')
+        summary = run_import(HEADER + '001,Маргарита,,999,,Пицца,1\n'
+                                      '002,Йорк,,470,,Бургеры,2\n'
+                                      '003,Без цены,,,,Пицца,\n'
+                                      '004,Без категории,,100,,,\n')
+        self.assertFalse(summary['applied'])
+        self.assertEqual(summary['errorCount'], 2)
+        self.assertEqual([error['line'] for error in summary['errors']], [4, 5])
+        self.assertEqual(menu(), {'001': ('Маргарита', 450.0, 'Пицца')})
+        self.assertEqual(self.categories(), {'Пицца': 1})
+
+    def test_dry_run_writes_nothing(self):
+        summary = run_import(HEADER + '001,Маргарита,,450,,Пицца,1\n', dry_run=True)
+        self.assertFalse(summary['applied'])
+        self.assertEqual(summary['created'], {'categories': 1, 'items': 1})
+        self.assertEqual(menu(), {})
+
+    def test_ambiguous_article_code(self):
+        repository.create('categories', {'id': 'pizza', 'name': 'Пицца', 'order': 1})
+        for name in ('Маргарита', 'Маргарита 2'):
+            repository.create('items', {'name': name, 'price': 450, 'articleCode': '001', 'categoryId': 'pizza'})
+        summary = run_import(HEADER + '001,Маргарита,,500,,Пицца,\n')
+        self.assertFalse(summary['applied'])
+        self.assertIn('001', summary['errors'][0]['message'])
+
+    def test_json_lines(self):
+        lines = [json.dumps({'articleCode': '001', 'name': 'Маргарита', 'price': 450, 'category': 'Пицца'}),
+                 '', json.dumps({'articleCode': '002', 'name': 'Йорк', 'price': 470, 'category': 'Бургеры'})]
+        summary = run_import('\n'.join(lines) + '\n', fmt='jsonl')
+        self.assertTrue(summary['applied'])
+        self.assertEqual(set(menu()), {'001', '002'})
+        summary = run_import('[1, 2]\nnot json\n', fmt='jsonl')
+        self.assertEqual([error['line'] for error in summary['errors']], [1, 2])
+
+    def test_unreadable_file_leaves_no_transaction_open(self):
+        with self.assertRaises(ValidationError):
+            server.import_menu(io.BytesIO(HEADER.encode('utf-8') + b'001,\xff\xfe,,1,,X,\n').read, 'csv')
+        with self.assertRaises(ValidationError):
+            run_import('foo,bar\n1,2\n')
+        self.assertFalse(database.connection().in_transaction)
+        self.assertEqual(menu(), {})
+        self.assertTrue(run_import(HEADER + '001,Маргарита,,450,,Пицца,1\n')['applied'])
+
+    def test_export_round_trip(self):
+        run_import(HEADER + '001,Маргарита,"Томаты, сыр",450,,Пицца,1\n')
+        exported = ''.join(server.iter_menu_export('csv'))
+        self.assertIn('"Томаты, сыр"', exported)
+        summary = run_import(exported)
+        self.assertEqual((summary['created'], summary['updated']), ({'categories': 0, 'items': 0}, 1))
@@ -0,0 +1,79 @@
+"""
+Response cache: versions, replace() from content reloads
+"""
+
+import json
+import unittest
+
+import server
+
+
+def body(data):
+    return json.dumps(data).encode('utf-8')
+
+
+class ReplaceTest(unittest.TestCase):
+    """replace() bumps a version only for content nobody has announced yet"""
+
+    def setUp(self):
+        self.cache = server.ResponseCache()
+
+    def replace(self, resource, data):
+        return self.cache.replace({resource: body(data)}, {resource: self.cache.version(resource)})
+
+    def test_first_snapshot_is_stored_without_a_bump(self):
+        self.assertEqual(self.replace('events', ['a']), [])
+        self.assertEqual(self.cache.version('events'), 0)
+        entry, hit = self.cache.get('events', self.fail)
+        self.assertTrue(hit)
+        self.assertEqual(entry.body, body(['a']))
+
+    def test_unchanged_content_is_not_announced(self):
+        self.replace('events', ['a'])
+        self.assertEqual(self.replace('events', ['a']), [])
+        self.assertEqual(self.cache.version('events'), 0)
+
+    def test_external_change_bumps_once(self):
+        self.replace('events', ['a'])
+        self.assertEqual(self.replace('events', ['b']), ['events'])
+        self.assertEqual(self.cache.version('events'), 1)
+        self.assertEqual(self.replace('events', ['b']), [])
+        self.assertEqual(self.cache.version('events'), 1)
+
+    def test_change_against_a_cached_entry(self):
+        self.cache.get('events', lambda: ['a'])
+        self.assertEqual(self.replace('events', ['b']), ['events'])
+        self.assertEqual(self.cache.get('events', self.fail)[0].body, body(['b']))
+
+    def test_mutation_is_not_announced_again(self):
+        # A mutation bumps the version; the reload its own write triggers must not bump it again,
+        # whether or not the resource was requested in between
+        for requested in (False, True):
+            with self.subTest(requested=requested):
+                self.setUp()
+                self.replace('events', ['a'])
+                self.cache.invalidate('events')
+                if requested:
+                    self.cache.get('events', lambda: ['b'])
+                self.assertEqual(self.replace('events', ['b']), [])
+                self.assertEqual(self.cache.version('events'), 1)
+                self.assertEqual(self.cache.get('events', self.fail)[0].body, body(['b']))
+
+    def test_snapshot_older_than_a_mutation_is_dropped(self):
+        self.replace('events', ['a'])
+        versions = {'events': self.cache.version('events')}
+        self.cache.invalidate('events')
+        self.assertEqual(self.cache.replace({'events': body(['stale'])}, versions), [])
+        self.assertEqual(self.cache.version('events'), 1)
+        entry, hit = self.cache.get('events', lambda: ['fresh'])
+        self.assertFalse(hit)
+        self.assertEqual(entry.body, body(['fresh']))
+
+    def test_workers_sharing_versions_announce_once(self):
+        versions = server.SharedVersions()
+        workers = [server.ResponseCache(versions), server.ResponseCache(versions)]
+        for cache in workers:
+            cache.replace({'news': body(['a'])}, {'news': versions.get('news')})
+        changed = [cache.replace({'news': body(['b'])}, {'news': versions.get('news')}) for cache in workers]
+        self.assertEqual(changed, [['news'], []])
+        self.assertEqual(versions.get('news'), 1)
@@ -0,0 +1,97 @@
+"""
+Routing: exact and parameterized paths, 404 and 405 answers
+"""
+
+import http.client
+import json
+import threading
+import unittest
+
+import server
+from engines import make_server
+
+
+class RouterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.router = server.Router()
+        self.router.add('GET', '/api/items', 'handle_list', resource='items')
+        self.router.add('PUT', '/api/items/<record_id>', 'handle_update', resource='items')
+        self.router.add('DELETE', '/api/items/<record_id>', 'handle_delete', resource='items')
+
+    def test_exact_path(self):
+        self.assertEqual(self.router.resolve('GET', '/api/items'),
+                         ('handle_list', {'resource': 'items'}, '/api/items', ('GET',)))
+
+    def test_parameter_is_unquoted(self):
+        handler, kwargs, pattern, allowed = self.router.resolve('PUT', '/api/items/a%20b')
+        self.assertEqual(handler, 'handle_update')
+        self.assertEqual(kwargs, {'resource': 'items', 'record_id': 'a b'})
+        self.assertEqual(pattern, '/api/items/<record_id>')
+        self.assertEqual(set(allowed), {'PUT', 'DELETE'})
+
+    def test_fixed_arguments_are_not_shared_between_matches(self):
+        self.router.resolve('PUT', '/api/items/1')
+        self.assertEqual(self.router.resolve('PUT', '/api/items/2')[1]['record_id'], '2')
+        self.assertEqual(self.router.resolve('GET', '/api/items')[1], {'resource': 'items'})
+
+    def test_unknown_path_is_404(self):
+        for path in ('/api/nothing', '/api/items/1/extra', '/api/items/', '/api'):
+            with self.subTest(path=path):
+                self.assertEqual(self.router.resolve('GET', path), (None, None, None, ()))
+
+    def test_known_path_with_other_method_is_405(self):
+        handler, kwargs, pattern, allowed = self.router.resolve('POST', '/api/items/1')
+        self.assertIsNone(handler)
+        self.assertEqual(set(allowed), {'PUT', 'DELETE'})
+        self.assertEqual(self.router.resolve('DELETE', '/api/items')[3], ('GET',))
+
+    def test_application_routes(self):
+        router = server.build_router()
+        self.assertEqual(router.resolve('GET', '/api/news')[0], 'handle_cached')
+        self.assertEqual(router.resolve('DELETE', '/api/news/42')[1]['record_id'], '42')
+        # about is a single record: no /<record_id> routes and no DELETE
+        self.assertEqual(router.resolve('PUT', '/api/about/1')[3], ())
+        self.assertEqual(set(router.resolve('DELETE', '/api/about')[3]), {'GET', 'PUT'})
+
+
+class RouterResponseTest(unittest.TestCase):
+    """404 and 405 as the handler sends them, through the threaded engine"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.httpd = make_server(server.BardabarHandler, 0, 'threaded', 2, '127.0.0.1')
+        cls.thread = threading.Thread(target=cls.httpd.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.httpd.shutdown()
+        cls.httpd.server_close()
+        cls.thread.join()
+
+    def request(self, method, path, body=None, headers=None):
+        conn = http.client.HTTPConnection('127.0.0.1', self.httpd.server_address[1], timeout=5)
+        try:
+            conn.request(method, path, body, headers or {})
+            response = conn.getresponse()
+            return response.status, response.headers, json.loads(response.read())
+        finally:
+            conn.close()
+
+    def test_unknown_api_path(self):
+        status, headers, payload = self.request('GET', '/api/nothing')
+        self.assertEqual(status, 404)
+        self.assertEqual(payload['status'], 'error')
+
+    def test_wrong_method(self):
+        status, headers, payload = self.request('DELETE', '/api/about')
+        self.assertEqual(status, 405)
+        self.assertEqual(set(headers['Allow'].split(', ')), {'GET', 'PUT'})
+
+    def test_method_override(self):
+        status, headers, payload = self.request(
+            'POST', '/api/events', b'{}',
+            {'Content-Type': 'application/json', 'X-HTTP-Method-Override': 'PATCH'})
+        self.assertEqual(status, 405)
+        self.assertNotIn('PATCH', headers['Allow'])
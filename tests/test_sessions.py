@@ -0,0 +1,119 @@
+"""
+Admin sessions: TTL, LRU eviction, the SQLite store shared between processes
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import server
+
+
+class SessionStoreMixin:
+    """The behaviour both stores share; make_store(ttl, max_sessions) builds the store under test"""
+
+    def make_store(self, ttl=server.SESSION_TTL, max_sessions=server.SESSION_MAX):
+        raise NotImplementedError
+
+    def test_create_validate_revoke(self):
+        store = self.make_store()
+        token = store.create()
+        self.assertTrue(store.validate(token))
+        self.assertFalse(store.validate('unknown'))
+        self.assertFalse(store.validate(None))
+        store.revoke(token)
+        self.assertFalse(store.validate(token))
+        self.assertEqual(len(store), 0)
+
+    def test_expired_session_is_rejected_and_dropped(self):
+        store = self.make_store(ttl=0.05)
+        token = store.create()
+        time.sleep(0.1)
+        self.assertFalse(store.validate(token))
+        self.assertEqual(len(store), 0)
+
+    def test_oldest_session_is_evicted(self):
+        store = self.make_store(max_sessions=2)
+        first = store.create()
+        time.sleep(0.01)
+        second = store.create()
+        time.sleep(0.01)
+        third = store.create()
+        self.assertEqual(len(store), 2)
+        self.assertFalse(store.validate(first))
+        self.assertTrue(store.validate(second))
+        self.assertTrue(store.validate(third))
+
+
+class MemorySessionStoreTest(SessionStoreMixin, unittest.TestCase):
+
+    def make_store(self, ttl=server.SESSION_TTL, max_sessions=server.SESSION_MAX):
+        return server.MemorySessionStore(ttl, max_sessions)
+
+    def test_use_renews_the_session(self):
+        store = self.make_store(max_sessions=2)
+        first = store.create()
+        second = store.create()
+        self.assertTrue(store.validate(first))
+        store.create()
+        # The least recently used session goes, not the oldest one
+        self.assertTrue(store.validate(first))
+        self.assertFalse(store.validate(second))
+
+    def test_sliding_expiry(self):
+        store = self.make_store(ttl=0.2)
+        token = store.create()
+        for _ in range(3):
+            time.sleep(0.1)
+            self.assertTrue(store.validate(token))
+
+
+class SqliteSessionStoreTest(SessionStoreMixin, unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        self.path = os.path.join(directory, 'sessions.db')
+        self.stores = []
+
+    def tearDown(self):
+        for store in self.stores:
+            store.close()
+
+    def make_store(self, ttl=server.SESSION_TTL, max_sessions=server.SESSION_MAX):
+        store = server.SqliteSessionStore(self.path, ttl, max_sessions)
+        self.stores.append(store)
+        return store
+
+    def test_sessions_are_shared_through_the_file(self):
+        worker, other = self.make_store(), self.make_store()
+        token = worker.create()
+        self.assertTrue(other.validate(token))
+        other.revoke(token)
+        self.assertFalse(worker.validate(token))
+
+    def test_sweep_drops_expired_sessions_of_other_workers(self):
+        expiring = self.make_store(ttl=0.05)
+        for _ in range(3):
+            expiring.create()
+        time.sleep(0.1)
+        self.assertFalse(self.make_store().validate('unknown'))
+        self.assertEqual(len(expiring), 0)
+
+
+class ConfigureSessionsTest(unittest.TestCase):
+
+    def tearDown(self):
+        server.configure_sessions('memory')
+
+    def test_backends(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        store = server.configure_sessions('sqlite', os.path.join(directory, 'sessions.db'))
+        self.assertIsInstance(store, server.SqliteSessionStore)
+        self.assertIs(server.sessions, store)
+        self.assertIsInstance(server.configure_sessions('memory'), server.MemorySessionStore)
+        with self.assertRaises(ValueError):
+            server.configure_sessions('redis')